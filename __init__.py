@@ -2,4 +2,4 @@
 """
 bubble_tool package
 """
-__all__ = ["cli", "ocr", "rules", "geometry", "cleaning", "sorting", "drawing", "exporter", "gradio_ui"]
+__all__ = ["cli", "pipeline", "batch", "server", "ocr", "backends", "tiling", "cascade", "premask", "pages", "pdf_text", "cache", "rules", "geometry", "items", "cleaning", "sorting", "layout", "spatial", "drawing", "render_cache", "preview", "exporter", "revision", "index_db", "metrics", "bench", "gradio_ui"]
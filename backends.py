@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+"""
+backends.py — 可插拔 OCR 后端
+协议（OCRBackend）：
+    load()                     加载模型，只调用一次
+    predict(images, ...)       一批 RGB ndarray → 每张图一个条目列表（各自图像坐标）；
+                               batch_size 为单次推理的最大张数，不支持批量的引擎可逐张处理
+    recognize(crops, ...)      只识别、跳过检测：每个小图是一行文本，返回 [(text, conf)]；
+                               基类退化为对小图做完整检测+识别，取置信度最高的一条
+    返回条目结构与 run_ocr 相同：{"text","conf","box","center"}
+内置实现：
+    paddle / paddle-v2 / paddle-v3   PaddleOCR（定义在 ocr.py，导入时注册）
+    replay                           确定性回放（录制的 *_dims.json 或内存条目；无数据时返回空，可作 mock）
+    pdf-text                         只读 PDF 文本层，光栅图不做识别
+新引擎（如 ONNX Runtime 导出的模型）用 @register_backend("name") 注册即可被 --ocr-backend 选用。
+已加载的后端放在进程级池中复用：按 (后端, lang, 模型目录, 选项) 分键，LRU 淘汰，借出期间独占。
+"""
+from __future__ import annotations
+
+import copy
+import json
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Type
+
+import numpy as np
+
+Item = Dict[str, Any]
+
+class OCRBackend:
+    name = "base"
+
+    def __init__(self, lang: str = "en", det_model_dir: Optional[str] = None,
+                 rec_model_dir: Optional[str] = None, **options: Any):
+        self.lang = lang
+        self.det_model_dir = det_model_dir
+        self.rec_model_dir = rec_model_dir
+        self.options = options
+        self.mode = self.name
+
+    def load(self) -> None:
+        pass
+
+    def predict(self, images: Sequence[np.ndarray], limit_side_len: int = 960, pad_stride: int = 32,
+                allow_upscale: bool = False, batch_size: int = 1) -> List[List[Item]]:
+        raise NotImplementedError
+
+    def recognize(self, crops: Sequence[np.ndarray], batch_size: int = 8,
+                  cls: bool = False) -> List[Tuple[str, float]]:
+        out: List[Tuple[str, float]] = []
+        for items in self.predict(list(crops), batch_size=batch_size):
+            best = max(items, key=lambda it: float(it.get("conf", 0.0)), default=None)
+            out.append((best["text"], float(best["conf"])) if best is not None else ("", 0.0))
+        return out
+
+    def warmup(self) -> None:
+        try:
+            self.predict([np.full((64, 64, 3), 255, dtype=np.uint8)])
+        except Exception:
+            pass
+
+    def close(self) -> None:
+        pass
+
+# ---------------- registry ----------------
+_REGISTRY: Dict[str, Type[OCRBackend]] = {}
+
+def register_backend(name: str) -> Callable[[Type[OCRBackend]], Type[OCRBackend]]:
+    def deco(cls: Type[OCRBackend]) -> Type[OCRBackend]:
+        cls.name = name
+        _REGISTRY[name] = cls
+        return cls
+    return deco
+
+def _ensure_builtin() -> None:
+    from . import ocr  # noqa: F401  注册 paddle 系列
+
+def backend_names() -> List[str]:
+    _ensure_builtin()
+    return sorted(_REGISTRY.keys())
+
+def create_backend(name: str = "paddle", lang: str = "en", det_model_dir: Optional[str] = None,
+                   rec_model_dir: Optional[str] = None, **options: Any) -> OCRBackend:
+    _ensure_builtin()
+    if name not in _REGISTRY:
+        raise ValueError(f"unknown OCR backend '{name}' (available: {', '.join(sorted(_REGISTRY))})")
+    be = _REGISTRY[name](lang=lang, det_model_dir=det_model_dir, rec_model_dir=rec_model_dir, **options)
+    be.load()
+    return be
+
+# ---------------- built-in non-paddle backends ----------------
+def _normalize_items(raw: Sequence[Dict[str, Any]]) -> List[Item]:
+    return [{"text": it.get("text", ""), "conf": float(it.get("conf", 1.0)),
+             "box": [(float(x), float(y)) for (x, y) in it["box"]],
+             "center": (float(it["center"][0]), float(it["center"][1]))} for it in raw]
+
+@register_backend("replay")
+class ReplayBackend(OCRBackend):
+    """
+    确定性回放：options 里给 items（列表）或 path（*_dims.json / OCR 缓存条目）。
+    每次预测返回同一份条目的深拷贝（下游会原地写 type/bubble_id）；什么都不给时返回空列表，即 mock。
+    """
+    def __init__(self, lang: str = "en", det_model_dir: Optional[str] = None,
+                 rec_model_dir: Optional[str] = None, **options: Any):
+        super().__init__(lang, det_model_dir, rec_model_dir, **options)
+        self.items: List[Item] = []
+
+    def load(self) -> None:
+        if self.options.get("items") is not None:
+            self.items = _normalize_items(self.options["items"])
+        elif self.options.get("path"):
+            with open(self.options["path"], "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.items = _normalize_items(data["items"] if isinstance(data, dict) else data)
+
+    def predict(self, images: Sequence[np.ndarray], limit_side_len: int = 960, pad_stride: int = 32,
+                allow_upscale: bool = False, batch_size: int = 1) -> List[List[Item]]:
+        return [copy.deepcopy(self.items) for _ in images]
+
+    def recognize(self, crops: Sequence[np.ndarray], batch_size: int = 8,
+                  cls: bool = False) -> List[Tuple[str, float]]:
+        # 回放不看像素，没有可识别的内容
+        return [("", 0.0) for _ in crops]
+
+@register_backend("pdf-text")
+class PdfTextBackend(OCRBackend):
+    """PDF 文本层后端：PDF 页面走 extract()，光栅图像没有文本层，predict 返回空"""
+    def load(self) -> None:
+        from .pdf_text import _require_fitz
+        _require_fitz()
+
+    def predict(self, images: Sequence[np.ndarray], limit_side_len: int = 960, pad_stride: int = 32,
+                allow_upscale: bool = False, batch_size: int = 1) -> List[List[Item]]:
+        return [[] for _ in images]
+
+    def recognize(self, crops: Sequence[np.ndarray], batch_size: int = 8,
+                  cls: bool = False) -> List[Tuple[str, float]]:
+        return [("", 0.0) for _ in crops]
+
+    def extract(self, page, dpi: float = 300) -> List[Item]:
+        from .pdf_text import extract_text_items
+        return extract_text_items(page, dpi)
+
+# ---------------- engine pool（进程级复用已加载的后端）----------------
+# 同一 key 可有多个副本供并发使用；总数超过上限时按 LRU 淘汰空闲实例。后端实例非线程安全，借出期间独占。
+PoolKey = Tuple[Any, ...]
+
+class _PooledEngine:
+    __slots__ = ("backend", "busy")
+
+    def __init__(self):
+        self.backend: Optional[OCRBackend] = None
+        self.busy = True
+
+_POOL_COND = threading.Condition()
+_POOL: "OrderedDict[PoolKey, List[_PooledEngine]]" = OrderedDict()
+_POOL_MAX_ENGINES = 2
+_POOL_MAX_PER_KEY = 1
+
+def configure_engine_pool(max_engines: Optional[int] = None, max_per_key: Optional[int] = None) -> None:
+    """调整引擎池上限：max_engines 为总实例数，max_per_key 为同一配置的并发副本数"""
+    global _POOL_MAX_ENGINES, _POOL_MAX_PER_KEY
+    with _POOL_COND:
+        if max_per_key is not None:
+            _POOL_MAX_PER_KEY = max(1, int(max_per_key))
+        if max_engines is not None:
+            _POOL_MAX_ENGINES = max(1, int(max_engines))
+        _POOL_MAX_ENGINES = max(_POOL_MAX_ENGINES, _POOL_MAX_PER_KEY)
+        _POOL_COND.notify_all()
+
+def reserve_engine_pool(max_per_key: int) -> None:
+    """保证同一配置至少可有 max_per_key 份副本；只调高不调低（不覆盖其他入口已设的更大值）"""
+    global _POOL_MAX_ENGINES, _POOL_MAX_PER_KEY
+    with _POOL_COND:
+        _POOL_MAX_PER_KEY = max(_POOL_MAX_PER_KEY, int(max_per_key))
+        _POOL_MAX_ENGINES = max(_POOL_MAX_ENGINES, _POOL_MAX_PER_KEY)
+        _POOL_COND.notify_all()
+
+def engine_pool_limits() -> Tuple[int, int]:
+    """当前引擎池上限 (max_engines, max_per_key)"""
+    with _POOL_COND:
+        return _POOL_MAX_ENGINES, _POOL_MAX_PER_KEY
+
+def clear_engine_pool() -> None:
+    """丢弃所有空闲实例（借出中的实例归还后照常可用）"""
+    with _POOL_COND:
+        for key in list(_POOL.keys()):
+            idle = [e for e in _POOL[key] if not e.busy]
+            for e in idle:
+                if e.backend is not None:
+                    e.backend.close()
+            slots = [e for e in _POOL[key] if e.busy]
+            if slots:
+                _POOL[key] = slots
+            else:
+                del _POOL[key]
+
+def _freeze(v: Any) -> Any:
+    if isinstance(v, dict):
+        return tuple(sorted((k, _freeze(x)) for k, x in v.items()))
+    if isinstance(v, (list, tuple)):
+        return tuple(_freeze(x) for x in v)
+    return v if isinstance(v, (str, int, float, bool, type(None))) else id(v)
+
+def _engine_key(name: str, lang: str, det_model_dir: Optional[str], rec_model_dir: Optional[str],
+                options: Dict[str, Any]) -> PoolKey:
+    return (name, lang, det_model_dir or "", rec_model_dir or "", _freeze(options))
+
+def _evict_idle_locked(keep: PoolKey) -> bool:
+    """淘汰最久未用的一个空闲实例；调用方需持有 _POOL_COND"""
+    for key in list(_POOL.keys()):
+        if key == keep:
+            continue
+        slots = _POOL[key]
+        for e in slots:
+            if not e.busy:
+                slots.remove(e)
+                if not slots:
+                    del _POOL[key]
+                if e.backend is not None:
+                    e.backend.close()
+                return True
+    return False
+
+@contextmanager
+def checkout_backend(
+    name: str = "paddle",
+    lang: str = "en",
+    det_model_dir: Optional[str] = None,
+    rec_model_dir: Optional[str] = None,
+    options: Optional[Dict[str, Any]] = None
+) -> Iterator[OCRBackend]:
+    """借出一个已加载的后端：with checkout_backend("paddle", "en") as be: be.predict([...])"""
+    options = dict(options or {})
+    key = _engine_key(name, lang, det_model_dir, rec_model_dir, options)
+    fresh = False
+    with _POOL_COND:
+        while True:
+            slots = _POOL.get(key, [])
+            eng = next((e for e in slots if not e.busy and e.backend is not None), None)
+            if eng is not None:
+                eng.busy = True
+                _POOL.move_to_end(key)
+                break
+            total = sum(len(v) for v in _POOL.values())
+            if len(slots) < _POOL_MAX_PER_KEY and (total < _POOL_MAX_ENGINES or _evict_idle_locked(key)):
+                eng = _PooledEngine()       # 先占位，模型在锁外加载
+                _POOL.setdefault(key, []).append(eng)
+                _POOL.move_to_end(key)
+                fresh = True
+                break
+            _POOL_COND.wait()
+
+    if fresh:
+        try:
+            eng.backend = create_backend(name, lang=lang, det_model_dir=det_model_dir,
+                                         rec_model_dir=rec_model_dir, **options)
+        except Exception:
+            with _POOL_COND:
+                slots = _POOL.get(key, [])
+                if eng in slots:
+                    slots.remove(eng)
+                    if not slots:
+                        del _POOL[key]
+                _POOL_COND.notify_all()
+            raise
+    try:
+        yield eng.backend  # type: ignore[misc]
+    finally:
+        with _POOL_COND:
+            eng.busy = False
+            _POOL_COND.notify_all()
+
+def warmup_backend(name: str = "paddle", lang: str = "en", det_model_dir: Optional[str] = None,
+                   rec_model_dir: Optional[str] = None, options: Optional[Dict[str, Any]] = None) -> str:
+    """启动时预加载并跑一次空白小图，首个真实请求不再付初始化开销；返回后端 mode"""
+    with checkout_backend(name, lang, det_model_dir, rec_model_dir, options) as be:
+        be.warmup()
+        return be.mode
+
+__all__ = ["OCRBackend", "register_backend", "backend_names", "create_backend", "ReplayBackend", "PdfTextBackend",
+           "checkout_backend", "warmup_backend", "configure_engine_pool", "reserve_engine_pool",
+           "engine_pool_limits", "clear_engine_pool"]
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+batch.py — 目录 / 通配符 / 清单批处理
+- 多进程 worker，每个进程启动时加载一次 OCR 模型（引擎池内复用）
+- 每个文件独立 try/except，单个失败不影响其他文件
+- 同时在途的任务数有上限（workers × 2），避免结果和图像堆积占满内存
+- ocr_batch > 1 时每个任务处理一组文件，单页图像在 worker 内组批 OCR（见 pipeline.process_files）；
+  组内出错时退回逐个处理，仍保证单文件隔离
+- consolidate=True 时每个成功文件的表格在完成后立刻逐行追加到 batch_dims.csv / .xlsx（见 exporter.ConsolidatedExport），
+  不在内存中累积所有行
+- opts['index_db'] 时主进程把每个成功文件的 {stem}_dims.json 按批汇入 SQLite 尺寸索引（见 index_db.DimIndex）
+- opts['columnar']（parquet / arrow）时各文件写入 out_dir/dims_dataset/drawing=<stem>/ 分区，整批构成一个数据集
+"""
+from __future__ import annotations
+
+import glob as _glob
+import json
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from .pipeline import process_document, process_files
+from .metrics import aggregate
+from .exporter import ConsolidatedExport
+from .index_db import DimIndex, index_summary
+
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".tif", ".tiff", ".bmp", ".webp", ".pdf"}
+
+def collect_inputs(spec: str, recursive: bool = False) -> List[Path]:
+    """
+    spec 可为：
+      - 目录：收集其中的图像文件（recursive=True 时递归子目录）
+      - 通配符：如 'scans/**/*.png'
+      - 清单：.txt/.lst（每行一个路径，# 开头为注释）或 .csv（取第一列）；相对路径相对清单所在目录
+    """
+    p = Path(spec)
+    if p.is_dir():
+        it = p.rglob("*") if recursive else p.iterdir()
+        return sorted(f for f in it if f.is_file() and f.suffix.lower() in IMAGE_EXTS)
+    if p.is_file() and p.suffix.lower() in (".txt", ".lst", ".csv"):
+        out: List[Path] = []
+        for line in p.read_text(encoding="utf-8").splitlines():
+            s = line.strip()
+            if p.suffix.lower() == ".csv":
+                s = s.split(",")[0].strip().strip('"')
+            if not s or s.startswith("#"):
+                continue
+            f = Path(s)
+            out.append(f if f.is_absolute() else p.parent / f)
+        return out
+    if p.is_file():
+        return [p]
+    return sorted(Path(f) for f in _glob.glob(spec, recursive=True) if Path(f).suffix.lower() in IMAGE_EXTS)
+
+def _unique_stems(paths: List[Path]) -> List[str]:
+    """同名文件（不同目录）加上级目录名前缀，避免输出互相覆盖"""
+    seen: Dict[str, int] = {}
+    for f in paths:
+        seen[f.stem] = seen.get(f.stem, 0) + 1
+    return [f"{f.parent.name}_{f.stem}" if seen[f.stem] > 1 else f.stem for f in paths]
+
+# ---------------- worker process ----------------
+_WORKER_OPTS: Dict[str, Any] = {}
+
+def _init_worker(opts: Dict[str, Any]) -> None:
+    global _WORKER_OPTS
+    _WORKER_OPTS = opts
+    from .ocr import reserve_engine_pool, warmup_ocr
+    from .pipeline import backend_spec, engine_copies
+    reserve_engine_pool(engine_copies(opts, opts.get("page_workers") or 1))
+    try:
+        backend, backend_options = backend_spec(opts)
+        # 与 run_ocr 相同的引擎 key（含模型目录），否则预热的实例用不上、首个文件又加载一份
+        warmup_ocr(lang=opts.get("lang", "en"), det_model_dir=opts.get("det_model_dir"),
+                   rec_model_dir=opts.get("rec_model_dir"), backend=backend, backend_options=backend_options)
+    except Exception:
+        pass  # 真正出错时由各文件自己报告
+
+def _quiet(_msg: str) -> None:
+    pass
+
+def _work(path: str, stem: str) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    try:
+        summary = process_document(path, _WORKER_OPTS, stem=stem, log=_quiet)
+        summary["ok"] = True
+    except Exception as e:
+        summary = {"input": path, "ok": False, "error": f"{type(e).__name__}: {e}"}
+    summary["seconds"] = round(time.perf_counter() - t0, 3)
+    return summary
+
+def _work_group(group: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+    if len(group) == 1:
+        return [_work(*group[0])]
+    t0 = time.perf_counter()
+    try:
+        summaries = process_files(group, _WORKER_OPTS, log=_quiet)
+    except Exception:
+        # 找出出错的文件：逐个重跑（已识别的结果命中 OCR 缓存）
+        return [_work(path, stem) for path, stem in group]
+    seconds = round((time.perf_counter() - t0) / len(group), 3)
+    for s in summaries:
+        s["ok"] = True
+        s["seconds"] = seconds
+    return summaries
+
+def _iter_results(jobs: List[Tuple[str, str]], opts: Dict[str, Any], workers: int,
+                  max_tasks_per_child: Optional[int]) -> Iterator[Dict[str, Any]]:
+    size = max(1, int(opts.get("ocr_batch") or 1))
+    groups = [jobs[i:i + size] for i in range(0, len(jobs), size)]
+    if workers <= 1:
+        _init_worker(opts)
+        for group in groups:
+            yield from _work_group(group)
+        return
+
+    kwargs: Dict[str, Any] = dict(max_workers=workers, initializer=_init_worker, initargs=(opts,))
+    if max_tasks_per_child:
+        kwargs["max_tasks_per_child"] = max_tasks_per_child
+    limit = workers * 2
+    pending: Set[Future] = set()
+    owner: Dict[Future, List[str]] = {}
+    queue = iter(groups)
+    with ProcessPoolExecutor(**kwargs) as ex:
+        while True:
+            while len(pending) < limit:
+                nxt = next(queue, None)
+                if nxt is None:
+                    break
+                fut = ex.submit(_work_group, nxt)
+                owner[fut] = [path for path, _ in nxt]
+                pending.add(fut)
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                paths = owner.pop(fut)
+                try:
+                    yield from fut.result()
+                except Exception as e:  # worker 进程崩溃等
+                    for path in paths:
+                        yield {"input": path, "ok": False, "error": f"{type(e).__name__}: {e}", "seconds": 0.0}
+
+def run_batch(inputs: List[Path], opts: Dict[str, Any], workers: int = 1,
+              max_tasks_per_child: Optional[int] = None, consolidate: bool = False) -> Dict[str, Any]:
+    """并行处理 inputs，打印进度，返回并写出 batch_summary.json（consolidate=True 时另写合并表 batch_dims.*）"""
+    jobs = [(str(f), s) for f, s in zip(inputs, _unique_stems(inputs))]
+    n = len(jobs)
+    out_dir = Path(opts.get("out_dir", "out"))
+    if (opts.get("columnar") or "off") != "off":
+        opts = dict(opts, dataset_dir=str(out_dir / "dims_dataset"))
+    merged = ConsolidatedExport(str(out_dir / "batch_dims")) if consolidate else None
+    index = DimIndex(opts["index_db"]) if opts.get("index_db") else None
+    indexed = 0
+    t0 = time.perf_counter()
+    results: List[Dict[str, Any]] = []
+    try:
+        for i, r in enumerate(_iter_results(jobs, opts, workers, max_tasks_per_child), start=1):
+            results.append(r)
+            if r.get("ok"):
+                print(f"[{i}/{n}] OK   {r['input']} ({r['items']} items, {r['seconds']}s)")
+                if merged is not None and r.get("outputs", {}).get("csv"):
+                    merged.add_csv(r["outputs"]["csv"])
+                if index is not None:
+                    indexed += index_summary(index, r, revision=opts.get("revision"))
+            else:
+                print(f"[{i}/{n}] FAIL {r['input']}: {r.get('error')}")
+    finally:
+        merged_paths = merged.close() if merged is not None else None
+        if index is not None:
+            index.close()
+
+    elapsed = time.perf_counter() - t0
+    ok = sum(1 for r in results if r.get("ok"))
+    summary = {
+        "total": n, "ok": ok, "failed": n - ok,
+        "seconds": round(elapsed, 3),
+        "files_per_min": round(n / elapsed * 60.0, 2) if elapsed > 0 else None,
+        "workers": workers,
+        "ocr_batch": max(1, int(opts.get("ocr_batch") or 1)),
+        "failures": [{"input": r["input"], "error": r.get("error")} for r in results if not r.get("ok")],
+        "metrics": aggregate([r.get("metrics") for r in results if r.get("ok")], name="batch"),
+        "results": results,
+    }
+    if index is not None:
+        summary["index_db"] = {"path": index.path, "rows": indexed}
+    if opts.get("dataset_dir"):
+        summary["dataset"] = {"path": opts["dataset_dir"], "format": opts["columnar"], "partitioning": "hive"}
+    if merged_paths is not None:
+        summary["consolidated"] = {"csv": merged_paths[0], "xlsx": merged_paths[1], "rows": merged.writer.rows}
+    out_dir.mkdir(parents=True, exist_ok=True)
+    with open(out_dir / "batch_summary.json", "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    if opts.get("metrics"):
+        for k, v in summary["metrics"]["stages"].items():
+            print(f"[METRICS]   {k:<16} {v['seconds']:8.3f}s x{v['calls']}")
+    if merged_paths is not None:
+        print(f"[OK] consolidated table ({merged.writer.rows} rows) -> {merged_paths[0]}"
+              + (f" | {merged_paths[1]}" if merged_paths[1] else " (xlsx skipped)"))
+    if index is not None:
+        print(f"[OK] indexed {indexed} dims -> {index.path}")
+    print(f"[DONE] {ok}/{n} succeeded, {n - ok} failed in {elapsed:.1f}s -> {out_dir / 'batch_summary.json'}")
+    return summary
+
+__all__ = ["collect_inputs", "run_batch"]
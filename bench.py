@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+bench.py — 离线可复现的流水线基准
+- 用 PIL 生成指定尺寸 / 尺寸文本密度的合成图纸（边框、标题栏、随机尺寸文本）
+- OCR 阶段由确定性的回放后端（backends.ReplayBackend）提供（合成条目或录制的 *_dims.json / 缓存条目），不需要 PaddleOCR 模型
+- 其余阶段（清洗 → 排序 → 绘制 → 导出）走真实的 pipeline 代码，按阶段输出耗时、吞吐（条目/秒）与内存
+用法：
+    python -m Engineering_Bubble_Drawing bench --cases 2000x100,8000x1000,20000x10000 --out bench.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from .backends import ReplayBackend, create_backend
+from .metrics import Metrics, collecting, stage, peak_rss_mb
+from .pipeline import annotate, write_tables
+
+DEFAULT_CASES = "2000x100,8000x1000,20000x10000"
+
+def _dim_text(rng: random.Random) -> str:
+    k = rng.random()
+    v = round(rng.uniform(0.5, 500.0), rng.choice((0, 1, 2)))
+    if k < 0.45:
+        return f"{v:g}"
+    if k < 0.6:
+        return f"R{v:g}"
+    if k < 0.75:
+        return f"⌀{v:g}"
+    if k < 0.85:
+        return f"{rng.randint(1, 179)}°"
+    if k < 0.92:
+        return f"M{rng.choice((3, 4, 5, 6, 8, 10, 12))}x{rng.choice((0.5, 0.75, 1, 1.25, 1.5))}"
+    return rng.choice(("A-A", "NOTE", "B", "12/05", "SCALE"))  # 噪声文本，应被清洗掉
+
+def _font(size: int):
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:  # Pillow < 10.1
+        return ImageFont.load_default()
+
+def synth_drawing(width: int, height: int, n_items: int, seed: int = 0,
+                  render: bool = True) -> Tuple[Optional[Image.Image], List[Dict[str, Any]]]:
+    """
+    生成合成图纸与对应的“OCR 结果”。字号随图幅缩放；条目坐标与图中文字一致。
+    render=False 时只生成条目（用于只测清洗/排序的大规模用例）。
+    """
+    rng = random.Random(seed)
+    font_px = max(10, int(min(width, height) / 160))
+    font = _font(font_px)
+    img = Image.new("RGB", (width, height), "white") if render else None
+    d = ImageDraw.Draw(img) if img is not None else None
+    if d is not None:
+        m = int(min(width, height) * 0.025)
+        d.rectangle((m, m, width - m, height - m), outline=(0, 0, 0), width=max(1, font_px // 6))
+        d.rectangle((int(width * 0.62), int(height * 0.62), width - m, height - m), outline=(0, 0, 0), width=2)
+
+    items: List[Dict[str, Any]] = []
+    for _ in range(n_items):
+        txt = _dim_text(rng)
+        x = rng.uniform(0.04, 0.94) * width
+        y = rng.uniform(0.04, 0.94) * height
+        tw = font_px * 0.6 * len(txt)
+        th = float(font_px)
+        if d is not None:
+            d.text((x, y), txt, fill=(0, 0, 0), font=font)
+            l, t, r, b = d.textbbox((x, y), txt, font=font)
+            tw, th = float(r - l), float(b - t)
+        box = [(x, y), (x + tw, y), (x + tw, y + th), (x, y + th)]
+        items.append({"text": txt, "conf": round(rng.uniform(0.4, 1.0), 4), "box": box,
+                      "center": (x + tw / 2.0, y + th / 2.0)})
+    return img, items
+
+def parse_cases(spec: str) -> List[Tuple[int, int, int]]:
+    """'2000x100,8000x1000' → [(2000, 1414, 100), ...]；也接受 'WxHxN' 明确给出宽高"""
+    out = []
+    for seg in (spec or "").split(","):
+        parts = [p for p in seg.strip().lower().split("x") if p]
+        if len(parts) == 2:
+            side, n = int(parts[0]), int(parts[1])
+            out.append((side, int(round(side / 2 ** 0.5)), n))  # A 系列横幅比例
+        elif len(parts) == 3:
+            out.append((int(parts[0]), int(parts[1]), int(parts[2])))
+    return out
+
+def _stage_mem(fn):
+    """运行 fn 并返回 (结果, 该阶段 Python 分配峰值 MB)；未开启 tracemalloc 时为 None"""
+    if not tracemalloc.is_tracing():
+        return fn(), None
+    tracemalloc.reset_peak()
+    res = fn()
+    return res, round(tracemalloc.get_traced_memory()[1] / (1024.0 * 1024.0), 2)
+
+def run_case(width: int, height: int, n_items: int, seed: int = 0, repeat: int = 1,
+             replay: Optional[ReplayBackend] = None, image: Optional[Image.Image] = None,
+             opts: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """跑一个用例 repeat 次，各阶段取最小耗时（减少噪声）"""
+    t0 = time.perf_counter()
+    if replay is None:
+        image, items = synth_drawing(width, height, n_items, seed=seed)
+        replay = create_backend("replay", items=items)  # type: ignore[assignment]
+    elif image is None:
+        image = Image.new("RGB", (width, height), "white")
+    gen_s = time.perf_counter() - t0
+    arr = np.zeros((1, 1, 3), dtype=np.uint8)  # 回放后端不看像素，避免为大图复制一份数组
+    opts = dict(opts or {}, anchor=(opts or {}).get("anchor", "tr"))
+
+    best: Dict[str, Dict[str, Any]] = {}
+    mem_peak: Dict[str, float] = {}
+    for _ in range(max(1, repeat)):
+        m = Metrics(f"{width}x{height}x{len(replay.items)}")
+        mem: Dict[str, Optional[float]] = {}
+        with tempfile.TemporaryDirectory() as tmp, collecting(m):
+            with stage("ocr") as rec:
+                raw, mem["ocr"] = _stage_mem(lambda: replay.predict([arr])[0])
+                rec.items = len(raw)
+            (res, mem["annotate"]) = _stage_mem(lambda: annotate(image, raw, opts))
+            items, _anno = res
+            _, mem["export"] = _stage_mem(lambda: write_tables(items, tmp, "bench", "bench.png", log=lambda _m: None))
+        for k, v in m.to_dict()["stages"].items():
+            cur = best.get(k)
+            if cur is None or v["seconds"] < cur["seconds"]:
+                best[k] = dict(v)
+        for k, v in mem.items():
+            if v is not None:
+                mem_peak[k] = max(mem_peak.get(k, 0.0), v)
+
+    stages = {}
+    for k, v in best.items():
+        n = v.get("items") or len(replay.items)
+        stages[k] = {"seconds": v["seconds"], "items": v.get("items"),
+                     "items_per_s": round(n / v["seconds"], 1) if v["seconds"] > 0 else None}
+    return {"case": f"{width}x{height}", "width": width, "height": height, "items": len(replay.items),
+            "generate_seconds": round(gen_s, 3), "stages": stages,
+            "py_peak_mb": mem_peak or None, "peak_rss_mb": peak_rss_mb()}
+
+@contextmanager
+def _tracing(enabled: bool) -> Iterator[None]:
+    """enabled 时在范围内开启 tracemalloc（各阶段报告 py_peak_mb）"""
+    if enabled:
+        tracemalloc.start()
+    try:
+        yield
+    finally:
+        if enabled:
+            tracemalloc.stop()
+
+def run_bench(cases: List[Tuple[int, int, int]], repeat: int = 1, seed: int = 0, trace_memory: bool = False,
+              opts: Optional[Dict[str, Any]] = None, log=print) -> Dict[str, Any]:
+    results = []
+    with _tracing(trace_memory):
+        for (w, h, n) in cases:
+            r = run_case(w, h, n, seed=seed, repeat=repeat, opts=opts)
+            results.append(r)
+            stages = "  ".join(f"{k}={v['seconds']:.3f}s" for k, v in r["stages"].items())
+            log(f"[BENCH] {w}x{h} {n:>6} items  {stages}  rss={r['peak_rss_mb']}MB")
+    return {"repeat": repeat, "seed": seed, "results": results}
+
+def cmd_bench(args: argparse.Namespace) -> None:
+    opts = {"min_conf": args.min_conf, "bubble_radius": args.bubble_radius}
+    if args.replay:
+        replay = create_backend("replay", path=args.replay)  # type: ignore[assignment]
+        image = Image.open(args.replay_image).convert("RGB") if args.replay_image else None
+        if image is not None:
+            w, h = image.size
+        else:
+            w = int(max(p[0] for it in replay.items for p in it["box"]) + 1) if replay.items else 1000
+            h = int(max(p[1] for it in replay.items for p in it["box"]) + 1) if replay.items else 1000
+        with _tracing(args.trace_memory):
+            result = run_case(w, h, len(replay.items), repeat=args.repeat, replay=replay, image=image, opts=opts)
+        report = {"repeat": args.repeat, "results": [result]}
+        print(json.dumps(report["results"][0]["stages"], indent=2))
+    else:
+        report = run_bench(parse_cases(args.cases), repeat=args.repeat, seed=args.seed,
+                           trace_memory=args.trace_memory, opts=opts)
+    if args.out:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"[OK] bench report -> {args.out}")
+
+def add_bench_args(ap: argparse.ArgumentParser) -> None:
+    ap.add_argument("--cases", default=DEFAULT_CASES, help="Comma list of SIDExITEMS or WxHxITEMS synthetic cases")
+    ap.add_argument("--repeat", type=int, default=3, help="Runs per case; the fastest run per stage is reported")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--trace_memory", action="store_true", help="Report per-stage Python allocation peaks (slower)")
+    ap.add_argument("--replay", default=None, help="Replay a recorded *_dims.json / OCR cache entry instead of synthetic items")
+    ap.add_argument("--replay_image", default=None, help="Image matching --replay (defaults to a blank sheet)")
+    ap.add_argument("--min_conf", type=float, default=0.60)
+    ap.add_argument("--bubble_radius", type=int, default=18)
+    ap.add_argument("--out", default=None, help="Write the JSON report here")
+
+__all__ = ["synth_drawing", "run_case", "run_bench", "parse_cases"]
+
+if __name__ == "__main__":
+    _ap = argparse.ArgumentParser(description="Offline pipeline benchmark (synthetic drawings + replay OCR)")
+    add_bench_args(_ap)
+    cmd_bench(_ap.parse_args())
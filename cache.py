@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+cache.py — 原始 OCR 结果的磁盘缓存（内容寻址）
+- key = 图像像素哈希 + OCR 设置（lang / limit_side_len / pad_stride / 模型目录 / PaddleOCR 版本 / 分块参数）
+- 每条一个 JSON 文件；命中时刷新 mtime，写入后按 mtime 做 LRU 淘汰，总大小不超过 max_bytes
+- 只缓存 run_ocr 的原始输出：改 min_conf / exclude / 气泡参数时只重跑清洗、排序、绘制
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+DEFAULT_CACHE_DIR = str(Path.home() / ".cache" / "bubble_tool" / "ocr")
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+def image_digest(img: Image.Image) -> str:
+    """按 RGB 像素内容取哈希：同一张图无论 CLI 读文件还是 UI 上传都得到相同 key"""
+    arr = np.ascontiguousarray(np.asarray(img.convert("RGB")))
+    h = hashlib.blake2b(digest_size=20)
+    h.update(f"{arr.shape[1]}x{arr.shape[0]}".encode("ascii"))
+    h.update(memoryview(arr).cast("B"))
+    return h.hexdigest()
+
+def _restore_items(raw: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """JSON 里的 list 还原成 run_ocr 的 tuple 结构"""
+    out = []
+    for it in raw:
+        out.append({
+            "text": it.get("text", ""),
+            "conf": float(it.get("conf", 0.0)),
+            "box": [(float(x), float(y)) for (x, y) in it["box"]],
+            "center": (float(it["center"][0]), float(it["center"][1])),
+        })
+    return out
+
+class OcrCache:
+    def __init__(self, root: Optional[str] = None, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.root = Path(root or DEFAULT_CACHE_DIR)
+        self.max_bytes = int(max_bytes)
+
+    def key(self, img: Image.Image, settings: Dict[str, Any]) -> str:
+        blob = json.dumps(settings, sort_keys=True, ensure_ascii=True, default=str)
+        h = hashlib.blake2b(digest_size=20)
+        h.update(image_digest(img).encode("ascii"))
+        h.update(blob.encode("utf-8"))
+        return h.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Tuple[List[Dict[str, Any]], str]]:
+        p = self._path(key)
+        try:
+            with open(p, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            os.utime(p, None)
+            return _restore_items(data["items"]), data.get("mode", "")
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def put(self, key: str, items: List[Dict[str, Any]], mode: str) -> None:
+        p = self._path(key)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        # 先写临时文件再原子替换，批处理多进程并发写同一 key 也安全
+        fd, tmp = tempfile.mkstemp(dir=str(p.parent), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"mode": mode, "items": items}, f, ensure_ascii=False)
+            os.replace(tmp, p)
+        except Exception:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+        self.evict()
+
+    def evict(self) -> int:
+        """按最近使用时间淘汰，直到总大小 <= max_bytes；返回删除条数"""
+        entries = []
+        total = 0
+        for f in self.root.glob("*/*.json"):
+            try:
+                st = f.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, f))
+            total += st.st_size
+        if total <= self.max_bytes:
+            return 0
+        removed = 0
+        for _, size, f in sorted(entries):
+            try:
+                f.unlink()
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+            if total <= self.max_bytes:
+                break
+        return removed
+
+def cached_ocr(
+    img: Image.Image,
+    settings: Dict[str, Any],
+    ocr_fn: Callable[[], Tuple[List[Dict[str, Any]], str]],
+    cache: Optional[OcrCache],
+    refresh: bool = False
+) -> Tuple[List[Dict[str, Any]], str, bool]:
+    """命中返回 (items, mode, True)；否则调用 ocr_fn 并写回缓存。cache=None 时直接识别"""
+    if cache is None:
+        items, mode = ocr_fn()
+        return items, mode, False
+    key = cache.key(img, settings)
+    if not refresh:
+        hit = cache.get(key)
+        if hit is not None:
+            return hit[0], hit[1], True
+    items, mode = ocr_fn()
+    try:
+        cache.put(key, items, mode)
+    except OSError:
+        pass  # 缓存写失败不影响主流程
+    return items, mode, False
+
+__all__ = ["OcrCache", "cached_ocr", "image_digest", "DEFAULT_CACHE_DIR"]
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+cascade.py — 低置信度条目的二次识别（置信度级联）
+- 整图识别为控制耗时会先把图缩到最长边 limit_side_len，小字号尺寸常被读错、置信度落在 min_conf 以下而被清洗掉
+- 第二遍只处理 [min_conf - band, min_conf) 区间内的条目：按原框从全分辨率原图裁出文本行、放大到 min_height，
+  跳过检测整批只做识别（ocr.recognize_regions）；新置信度更高时替换 text / conf
+- 高分辨率识别的开销只花在少数不确定的框上，而不是整张图；在 clean_items 之前运行
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional
+
+from PIL import Image
+
+from .ocr import recognize_regions
+from .metrics import stage
+
+def rescue_low_conf(
+    img: Image.Image,
+    items: List[Dict[str, Any]],
+    min_conf: float = 0.60,
+    band: float = 0.30,
+    min_height: int = 48,
+    lang: str = "en",
+    det_model_dir: Optional[str] = None,
+    rec_model_dir: Optional[str] = None,
+    backend: str = "paddle",
+    backend_options: Optional[Dict[str, Any]] = None,
+    batch_size: int = 8
+) -> int:
+    """
+    原地更新 items 中置信度在 [min_conf - band, min_conf) 的条目（坐标须为 img 的像素坐标），返回被替换的条数。
+    低于区间下限的视为噪声，不再花时间重读。
+    """
+    lo = float(min_conf) - float(band)
+    todo = [it for it in items
+            if lo <= float(it.get("conf", 1.0)) < float(min_conf) and it.get("box") and len(it["box"]) == 4]
+    if not todo:
+        return 0
+    with stage("ocr.rescue") as rec:
+        results = recognize_regions(img, [it["box"] for it in todo], lang=lang, pad=3.0, batch_size=batch_size,
+                                    min_height=min_height, det_model_dir=det_model_dir,
+                                    rec_model_dir=rec_model_dir, backend=backend, backend_options=backend_options)
+        replaced = 0
+        for it, (txt, conf) in zip(todo, results):
+            txt = (txt or "").strip()
+            if txt and float(conf) > float(it.get("conf", 0.0)):
+                it["text"], it["conf"] = txt, float(conf)
+                replaced += 1
+        rec.items = len(todo)
+    return replaced
+
+__all__ = ["rescue_low_conf"]
@@ -1,17 +1,37 @@
 # -*- coding: utf-8 -*-
-from typing import Any, Dict, List, Optional, Tuple
-from .rules import classify_text
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .rules import classify_text, classify_text_cached
 from .geometry import default_exclusion_zones, in_rect
+from .items import ItemTable
+
+# 条目数达到该值时走列式路径（小列表时建数组的固定开销反而更大）
+COLUMNAR_MIN_ITEMS = 256
+
+# 排除区内仍保留的类型
+_ZONE_KEEP = ("R", "DIA", "ANG")
 
 # 清洗 OCR 结果，过滤低置信度、无类型、区域内的文本
 def should_drop_by_zone(center: Tuple[float, float], zones: List[Tuple[float, float, float, float]]) -> bool:
     return any(in_rect(center, z) for z in zones)
 
-def clean_items(items: List[Dict[str, Any]], img_w: int, img_h: int, min_conf: float,
-                custom_excludes: Optional[List[Tuple[float, float, float, float]]] = None) -> List[Dict[str, Any]]:
+def _zones(img_w: int, img_h: int,
+           custom_excludes: Optional[List[Tuple[float, float, float, float]]]) -> List[Tuple[float, float, float, float]]:
     zones = default_exclusion_zones(img_w, img_h)
     if custom_excludes:
         zones += custom_excludes
+    return zones
+
+def clean_items(items: Union[List[Dict[str, Any]], ItemTable], img_w: int, img_h: int, min_conf: float,
+                custom_excludes: Optional[List[Tuple[float, float, float, float]]] = None
+                ) -> Union[List[Dict[str, Any]], ItemTable]:
+    if isinstance(items, ItemTable):
+        return clean_table(items, img_w, img_h, min_conf, custom_excludes)
+    if len(items) >= COLUMNAR_MIN_ITEMS:
+        return clean_items_columnar(items, img_w, img_h, min_conf, custom_excludes)
+    zones = _zones(img_w, img_h, custom_excludes)
     cleaned: List[Dict[str, Any]] = []
     for it in items:
         txt = (it.get("text") or "").strip()
@@ -30,3 +50,47 @@ def clean_items(items: List[Dict[str, Any]], img_w: int, img_h: int, min_conf: f
         it["type"] = tp
         cleaned.append(it)
     return cleaned
+
+def clean_mask(texts: Sequence[str], conf: np.ndarray, centers: np.ndarray, min_conf: float,
+               zones: Sequence[Tuple[float, float, float, float]]) -> Tuple[np.ndarray, List[Optional[str]]]:
+    """
+    列式清洗核心：texts（已 strip）、conf (N,)、centers (N, 2) → (保留掩码 (N,), 每条的类型)。
+    排除区判断一次广播完成：(N, 1) 对 (1, Z) 比较后按行 any；判定规则与 clean_items 逐条完全一致。
+    """
+    types = [classify_text_cached(t) for t in texts]
+    n = len(types)
+    keep = np.fromiter((tp is not None and t != "0" for t, tp in zip(texts, types)), dtype=bool, count=n)
+    keep &= ~(conf < min_conf)   # 与逐条的 "conf < min_conf 则丢弃" 相同（NaN 保留）
+    if zones and n:
+        z = np.asarray(zones, dtype=np.float64).reshape(-1, 4)
+        cx, cy = centers[:, 0:1], centers[:, 1:2]
+        inside = ((z[:, 0] <= cx) & (cx <= z[:, 2]) & (z[:, 1] <= cy) & (cy <= z[:, 3])).any(axis=1)
+        zone_ok = np.fromiter((tp in _ZONE_KEEP for tp in types), dtype=bool, count=n)
+        keep &= ~inside | zone_ok
+    return keep, types
+
+def clean_items_columnar(items: List[Dict[str, Any]], img_w: int, img_h: int, min_conf: float,
+                         custom_excludes: Optional[List[Tuple[float, float, float, float]]] = None) -> List[Dict[str, Any]]:
+    """clean_items 的列式实现：结果（保留的条目、顺序、写入的 type）与逐条版本相同"""
+    n = len(items)
+    texts = [(it.get("text") or "").strip() for it in items]
+    conf = np.fromiter((float(it.get("conf", 1.0)) for it in items), dtype=np.float64, count=n)
+    centers = np.array([it["center"] for it in items], dtype=np.float64).reshape(n, 2)
+    keep, types = clean_mask(texts, conf, centers, min_conf, _zones(img_w, img_h, custom_excludes))
+    cleaned: List[Dict[str, Any]] = []
+    for i in np.flatnonzero(keep).tolist():
+        it = items[i]
+        it["type"] = types[i]
+        cleaned.append(it)
+    return cleaned
+
+def clean_table(table: ItemTable, img_w: int, img_h: int, min_conf: float,
+                custom_excludes: Optional[List[Tuple[float, float, float, float]]] = None) -> ItemTable:
+    """ItemTable 版本：直接用表的列，返回保留行组成的新表（type 列已写入）"""
+    texts = [(t or "").strip() for t in table.text]
+    keep, types = clean_mask(texts, table.conf, table.centers, min_conf,
+                             _zones(img_w, img_h, custom_excludes))
+    idx = np.flatnonzero(keep)
+    out = table.take(idx)
+    out.set_types([types[i] for i in idx.tolist()])
+    return out
@@ -1,69 +1,106 @@
 # -*- coding: utf-8 -*-
-import argparse, json
-from pathlib import Path
-from typing import Tuple, List
-
-from PIL import Image
-
-from .ocr import run_ocr
-from .cleaning import clean_items
-from .sorting import sort_reading_order
-from .drawing import draw_bubbles
-from .exporter import export_tabular
+import argparse
+from typing import Any, Dict
+
+from .pipeline import process_document
+from .backends import backend_names
+from .batch import collect_inputs, run_batch
+from .exporter import pa as columnar_pa
+from .bench import add_bench_args, cmd_bench
+from .index_db import DimIndex, add_query_args, cmd_query, index_summary
+from .revision import add_revise_args, revise_document
+from .server import add_serve_args, cmd_serve
 from .gradio_ui import cmd_gradio as _cmd_gradio
 
-# 命令行入口，支持 run 和 gradio 两个子命令
-# run 为命令行模式，gradio 为图形界面模式
-def _parse_excludes(s: str) -> List[Tuple[float, float, float, float]]:
-    s = (s or "").strip()
-    if not s:
-        return []
-    out = []
-    for seg in s.split(";"):
-        try:
-            x1,y1,x2,y2 = [float(v) for v in seg.split(",")]
-            out.append((x1,y1,x2,y2))
-        except Exception:
-            continue
-    return out
+# 命令行入口，支持 run / batch / revise / query / serve / gradio 子命令
+# run 为单图命令行模式，batch 为批处理模式，revise 为改版增量处理，query 查询尺寸索引，
+# serve 为本地 HTTP 推理服务，gradio 为图形界面模式
+def _opts(args: argparse.Namespace) -> Dict[str, Any]:
+    if getattr(args, "columnar", "off") != "off" and columnar_pa is None:
+        raise SystemExit(f"[ERROR] --columnar {args.columnar} requires pyarrow (pip install pyarrow)")
+    return {k: v for k, v in vars(args).items() if k != "func"}
 
 # run + clean + sort + draw + export 流程
 def cmd_run(args: argparse.Namespace) -> None:
-    img = Image.open(args.input).convert("RGB")
-    W, H = img.size
-    print(f"[INFO] image loaded: {args.input} ({W}x{H})")
-
-    ocr_items, mode = run_ocr(img, lang=args.lang, det=True, rec=True)
-    print(f"[INFO] PaddleOCR mode: {mode}; raw items: {len(ocr_items)}")
-
-    custom_excludes = _parse_excludes(args.exclude)
-    items = clean_items(ocr_items, W, H, min_conf=args.min_conf, custom_excludes=custom_excludes)
-    print(f"[INFO] after cleaning: {len(items)}")
-
-    items_sorted = sort_reading_order(items)
-
-    # 给每个气泡编号 1 到 n
-    for i, it in enumerate(items_sorted, start=1):
-        it["bubble_id"] = i
-
-    dx, dy = args.offset
-    anno = draw_bubbles(img, items_sorted, radius=args.bubble_radius, text_scale=args.label_scale, font_path=args.font,
-                        anchor=args.anchor, offset=(dx, dy), avoid_overlap=True)
-
-    Path(args.out_dir).mkdir(parents=True, exist_ok=True)
-    stem = Path(args.input).stem
-    out_img = str(Path(args.out_dir) / f"{stem}_bubbled.jpg")
-    anno.save(out_img, quality=95)
-    print(f"[OK] annotated image -> {out_img}")
-
-    base = str(Path(args.out_dir) / f"{stem}_dims")
-    csv_path, xlsx_path = export_tabular(items_sorted, base, image_name=Path(args.input).name)
-    print(f"[OK] table -> {csv_path}" + (f" | {xlsx_path}" if xlsx_path else " (xlsx skipped)"))
-
-    out_json = str(Path(args.out_dir) / f"{stem}_dims.json")
-    with open(out_json, "w", encoding="utf-8") as f:
-        json.dump(items_sorted, f, ensure_ascii=False, indent=2)
-    print(f"[OK] JSON -> {out_json}")
+    summary = process_document(args.input, _opts(args))
+    if args.index_db:
+        with DimIndex(args.index_db) as idx:
+            n = index_summary(idx, summary, revision=args.revision)
+        print(f"[OK] indexed {n} dims -> {args.index_db}")
+
+# 改版：只重识别与上一版有差异的区域，沿用气泡编号
+def cmd_revise(args: argparse.Namespace) -> None:
+    summary = revise_document(args.input, args.prev_json, args.prev_image, _opts(args))
+    if args.index_db:
+        with DimIndex(args.index_db) as idx:
+            n = index_summary(idx, summary, revision=args.revision)
+        print(f"[OK] indexed {n} dims -> {args.index_db}")
+
+# 目录 / 通配符 / 清单批处理
+def cmd_batch(args: argparse.Namespace) -> None:
+    inputs = collect_inputs(args.inputs, recursive=args.recursive)
+    if not inputs:
+        raise SystemExit(f"[ERROR] no input images found: {args.inputs}")
+    print(f"[INFO] batch: {len(inputs)} files, {args.workers} workers")
+    summary = run_batch(inputs, _opts(args), workers=args.workers, max_tasks_per_child=args.max_tasks_per_child,
+                        consolidate=args.consolidate)
+    if summary["failed"]:
+        raise SystemExit(1)
+
+def _add_pipeline_args(ap: argparse.ArgumentParser) -> None:
+    ap.add_argument("--out_dir", default="out", help="Output directory")
+    ap.add_argument("--lang", default="en", help="OCR language")
+    ap.add_argument("--min_conf", type=float, default=0.60)
+    ap.add_argument("--bubble_radius", type=int, default=18)
+    ap.add_argument("--label_scale", type=float, default=1.2, help="Scale for bubble number font size relative to radius (font_size = radius*label_scale)")
+    ap.add_argument("--font", default=None, help="Optional TTF font path for bubble numbers")
+    ap.add_argument("--anchor", default="tr", choices=["tl", "tr", "bl", "br"], help="Bubble anchor relative to text box")
+    ap.add_argument("--offset", type=lambda s: tuple(map(int, s.split(","))), default=(10, -10), help="dx,dy for bubble from anchor")
+    ap.add_argument("--avoid_text", action="store_true", help="Keep bubbles off OCR text boxes and other leader lines")
+    ap.add_argument("--layout", default="greedy", choices=["greedy", "global"],
+                    help="Bubble placement: greedy per item, or global optimization of overlaps/crossings/leader length")
+    ap.add_argument("--layout_budget_ms", type=float, default=200, help="Time budget of --layout global per sheet")
+    ap.add_argument("--rescue_band", type=float, default=0.0,
+                    help="Re-read items with conf in [min_conf - band, min_conf) from full-resolution crops (0 = off)")
+    ap.add_argument("--rescue_height", type=int, default=48, help="Upscale rescued text-line crops to at least this height")
+    ap.add_argument("--sort", default="rows", choices=["rows", "columns", "zones", "legacy"],
+                    help="Bubble numbering order: rows (top-down, left-right), columns, drawing-frame zones, or the legacy row scan")
+    ap.add_argument("--deskew", action="store_true", help="Estimate page skew from text-box angles before row/column clustering")
+    ap.add_argument("--zone_grid", type=lambda s: tuple(map(int, s.lower().split("x"))), default=(8, 6),
+                    help="Drawing-frame zones COLSxROWS for --sort zones (columns 1.., rows A..)")
+    ap.add_argument("--exclude", default="", help="Exclude zones 'x1,y1,x2,y2;...' in pixels")
+    ap.add_argument("--ocr_backend", "--ocr-backend", dest="ocr_backend", default="paddle", choices=backend_names(),
+                    help="OCR engine: paddle (auto v2/v3), paddle-v2, paddle-v3, replay, pdf-text")
+    ap.add_argument("--replay", default=None, help="Recorded *_dims.json / OCR cache entry for --ocr-backend replay")
+    ap.add_argument("--det_model_dir", default=None, help="Custom detection model directory")
+    ap.add_argument("--rec_model_dir", default=None, help="Custom recognition model directory")
+    ap.add_argument("--premask", default="blank", choices=["off", "blank", "zones"],
+                    help="Before OCR: skip blank pages/tiles (blank; ink = any colour channel below 200), also white out border strips, "
+                         "title block and --exclude zones (zones; drops R/DIA/ANG that the post-filter would keep)")
+    ap.add_argument("--tiled", action="store_true", help="Tiled high-resolution OCR for large-format sheets")
+    ap.add_argument("--tile_size", type=int, default=1600, help="Tile side length in pixels (after --tile_scale)")
+    ap.add_argument("--tile_overlap", type=int, default=200, help="Overlap between neighbouring tiles in pixels")
+    ap.add_argument("--tile_scale", type=float, default=1.0, help="OCR resolution relative to the input image (e.g. 0.5 = half DPI)")
+    ap.add_argument("--tile_workers", type=int, default=1, help="Tile batches recognized concurrently (one engine copy each)")
+    ap.add_argument("--ocr_batch", type=int, default=1,
+                    help="Images per OCR predict call: tiles in --tiled mode, single-page files per worker task in batch")
+    ap.add_argument("--pdf_dpi", type=float, default=300, help="Rasterization DPI for PDF input (text-layer boxes use the same scale)")
+    ap.add_argument("--pdf_mode", default="text", choices=["text", "ocr"], help="PDF: read the text layer (OCR only where missing) or always rasterize+OCR")
+    ap.add_argument("--tiff_dpi", type=float, default=None, help="Resample TIFF frames to this DPI (uses the file's DPI tag)")
+    ap.add_argument("--page_workers", type=int, default=1, help="Pages of a multi-page document processed concurrently")
+    ap.add_argument("--jsonl", action="store_true", help="Also write <stem>_dims.jsonl (one JSON object per item)")
+    ap.add_argument("--columnar", default="off", choices=["off", "parquet", "arrow"],
+                    help="Also write typed columns as Parquet / Arrow IPC (requires pyarrow); "
+                         "batch writes a dataset partitioned by drawing under out_dir/dims_dataset")
+    ap.add_argument("--index_db", default=None, help="Also insert cleaned dims into this SQLite index (see the query subcommand)")
+    ap.add_argument("--revision", default=None,
+                    help="Revision stored in --index_db (default: parsed from the file name, e.g. PN-1234_revC)")
+    ap.add_argument("--metrics", action="store_true", help="Write per-stage timing/items/peak RSS as <stem>_metrics.json")
+    ap.add_argument("--profile", action="store_true", help="Also write a cProfile dump <stem>.prof for the instrumented stages")
+    ap.add_argument("--cache_dir", default=None, help="Raw OCR result cache directory (default ~/.cache/bubble_tool/ocr)")
+    ap.add_argument("--cache_max_mb", type=float, default=512, help="Evict least recently used cache entries above this size")
+    ap.add_argument("--no_cache", "--no-cache", dest="no_cache", action="store_true", help="Neither read nor write the OCR cache")
+    ap.add_argument("--refresh", action="store_true", help="Ignore cached OCR results and overwrite them")
 
 # argparse 
 def build_cli() -> argparse.ArgumentParser:
@@ -71,20 +108,43 @@ def build_cli() -> argparse.ArgumentParser:
     sub = ap.add_subparsers(dest="cmd", required=True)
 
     ap_run = sub.add_parser("run", help="Run OCR->clean->bubble->export pipeline")
-    ap_run.add_argument("--input", required=True, help="Input image file (JPG/PNG/TIF)")
-    ap_run.add_argument("--out_dir", default="out", help="Output directory")
-    ap_run.add_argument("--lang", default="en", help="OCR language")
-    ap_run.add_argument("--min_conf", type=float, default=0.60)
-    ap_run.add_argument("--bubble_radius", type=int, default=18)
-    ap_run.add_argument("--label_scale", type=float, default=1.2, help="Scale for bubble number font size relative to radius (font_size = radius*label_scale)")
-    ap_run.add_argument("--font", default=None, help="Optional TTF font path for bubble numbers")
-    ap_run.add_argument("--anchor", default="tr", choices=["tl", "tr", "bl", "br"], help="Bubble anchor relative to text box")
-    ap_run.add_argument("--offset", type=lambda s: tuple(map(int, s.split(","))), default=(10, -10), help="dx,dy for bubble from anchor")
-    ap_run.add_argument("--exclude", default="", help="Exclude zones 'x1,y1,x2,y2;...' in pixels")
+    ap_run.add_argument("--input", required=True, help="Input image file (JPG/PNG/TIF, multi-frame TIFF) or PDF")
+    ap_run.add_argument("--page", type=int, default=None, help="Only process this page of a multi-page PDF/TIFF (1-based; default: all pages)")
+    _add_pipeline_args(ap_run)
     ap_run.set_defaults(func=cmd_run)
 
+    ap_batch = sub.add_parser("batch", help="Run the pipeline over a directory, glob or manifest with a worker pool")
+    ap_batch.add_argument("--inputs", required=True, help="Directory, glob pattern ('scans/**/*.png') or manifest (.txt/.lst/.csv)")
+    ap_batch.add_argument("--recursive", action="store_true", help="Recurse into subdirectories when --inputs is a directory")
+    ap_batch.add_argument("--workers", type=int, default=2, help="Worker processes (each holds one loaded OCR model)")
+    ap_batch.add_argument("--max_tasks_per_child", type=int, default=None, help="Recycle a worker after N files to cap memory growth")
+    ap_batch.add_argument("--consolidate", action="store_true",
+                          help="Also stream every file's table into one out_dir/batch_dims.csv (+ .xlsx)")
+    _add_pipeline_args(ap_batch)
+    ap_batch.set_defaults(func=cmd_batch)
+
+    ap_rev = sub.add_parser("revise", help="Re-process a revised sheet: re-OCR only regions that changed since the previous run")
+    add_revise_args(ap_rev)
+    _add_pipeline_args(ap_rev)
+    ap_rev.set_defaults(func=cmd_revise)
+
+    ap_query = sub.add_parser("query", help="Search the SQLite dimension index written with --index_db")
+    add_query_args(ap_query)
+    ap_query.set_defaults(func=cmd_query)
+
+    ap_serve = sub.add_parser("serve", help="Local HTTP inference service with a bounded queue and cross-request batching")
+    add_serve_args(ap_serve)
+    _add_pipeline_args(ap_serve)
+    ap_serve.set_defaults(func=cmd_serve)
+
+    ap_bench = sub.add_parser("bench", help="Offline benchmark on synthetic drawings with a replay OCR backend")
+    add_bench_args(ap_bench)
+    ap_bench.set_defaults(func=cmd_bench)
+
     ap_ui = sub.add_parser("gradio", help="Launch Gradio UI")
     ap_ui.add_argument("--share", action="store_true", help="Enable public share link (慎用，涉及图纸隐私)")
+    ap_ui.add_argument("--lang", default="en", help="OCR language to preload at startup")
+    ap_ui.add_argument("--no_warmup", action="store_true", help="Do not preload OCR models at startup")
     ap_ui.set_defaults(func=_cmd_gradio)
 
     return ap
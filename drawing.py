@@ -4,6 +4,9 @@ from typing import Any, Dict, List, Tuple, Optional
 from PIL import Image, ImageDraw, ImageFont
 import math, numpy as np
 
+from .geometry import nearest_point_on_edges
+from .layout import layout_bubbles
+
 RGBA = Tuple[int, int, int, int]
 
 def _ensure_rgba(c: Tuple[int, int, int] | RGBA, alpha: int | float = 255) -> RGBA:
@@ -29,6 +32,92 @@ def _to_pil(img_any) -> Image.Image:
         return Image.fromarray(img_any).convert("RGB")
     raise TypeError(f"draw_bubbles: unsupported image type: {type(img_any)}")
 
+def load_font(font_path: Optional[str], radius: int, text_scale: float = 1.2):
+    font_size = max(10, int(radius * text_scale))
+    try:
+        return ImageFont.truetype(font_path, font_size) if font_path else ImageFont.load_default()
+    except Exception:
+        return ImageFont.load_default()
+
+def bubble_colors(
+    bubble_fill: Tuple[int,int,int] = (255, 0, 0),
+    bubble_alpha: float | int = 0.65,
+    number_color: Tuple[int,int,int] = (255, 255, 255),
+    dash_color: Tuple[int,int,int] = (255, 0, 0),
+) -> Tuple[RGBA, RGBA, RGBA, RGBA]:
+    """(气泡填充, 气泡描边, 编号, 引出线) 的 RGBA"""
+    fill_rgba = _ensure_rgba(bubble_fill, bubble_alpha)
+    outline_rgba = _ensure_rgba(bubble_fill, 1.0 if isinstance(bubble_alpha, float) else 255)
+    return fill_rgba, outline_rgba, _ensure_rgba(number_color, 255), _ensure_rgba(dash_color, 255)
+
+def draw_dashed_line(d: ImageDraw.ImageDraw, p1: Tuple[float,float], p2: Tuple[float,float], color: RGBA,
+                     dash: int = 6, gap: int = 4, origin: Tuple[float,float] = (0, 0)):
+    ox, oy = origin
+    x1,y1 = p1; x2,y2 = p2
+    dx, dy = x2-x1, y2-y1
+    dist = math.hypot(dx, dy)
+    if dist < 1e-3:
+        return
+    ux, uy = dx/dist, dy/dist
+    n = int(dist // (dash+gap)) + 1
+    for i in range(n):
+        a = i*(dash+gap)
+        b = min(a + dash, dist)
+        xa, ya = x1 + ux*a, y1 + uy*a
+        xb, yb = x1 + ux*b, y1 + uy*b
+        d.line((xa-ox,ya-oy,xb-ox,yb-oy), fill=color, width=1)
+
+def leader_segment(it: Dict[str, Any], center: Tuple[float,float], radius: int):
+    """引出线：从气泡边缘到文本框最近边；没有框或太短时为 None"""
+    box = it.get("box")
+    if not box or len(box) != 4:
+        return None
+    cx, cy = center
+    end_pt = nearest_point_on_edges((cx, cy), box)
+    vx, vy = end_pt[0]-cx, end_pt[1]-cy
+    vlen = math.hypot(vx, vy)
+    if vlen <= 1e-3:
+        return None
+    return (cx + vx/vlen*(radius+1), cy + vy/vlen*(radius+1)), end_pt
+
+def bubble_extent(it: Dict[str, Any], center: Tuple[float,float], radius: int) -> Tuple[int, int, int, int]:
+    """一个气泡（圆、编号、引出线）在整图上覆盖的整数包围框 (x1, y1, x2, y2)，右下开区间"""
+    cx, cy = center
+    x1, y1, x2, y2 = cx - radius, cy - radius, cx + radius, cy + radius
+    seg = leader_segment(it, center, radius)
+    if seg is not None:
+        (sx, sy), (ex, ey) = seg
+        x1 = min(x1, sx, ex); y1 = min(y1, sy, ey); x2 = max(x2, sx, ex); y2 = max(y2, sy, ey)
+    pad = 3
+    return (int(math.floor(x1)) - pad, int(math.floor(y1)) - pad, int(math.ceil(x2)) + pad, int(math.ceil(y2)) + pad)
+
+def draw_bubble(
+    d: ImageDraw.ImageDraw,
+    it: Dict[str, Any],
+    idx: int,
+    center: Tuple[float,float],
+    radius: int,
+    font,
+    colors: Tuple[RGBA, RGBA, RGBA, RGBA],
+    origin: Tuple[float,float] = (0, 0)
+) -> None:
+    """画一个气泡 + 引出线 + 编号；origin 为画布左上角在整图中的坐标（画局部贴片时用）"""
+    fill_rgba, outline_rgba, number_rgba, dash_rgba = colors
+    ox, oy = origin
+    cx, cy = center
+    d.ellipse((cx-radius-ox, cy-radius-oy, cx+radius-ox, cy+radius-oy), fill=fill_rgba, outline=outline_rgba, width=2)
+
+    # 连线到最近边
+    seg = leader_segment(it, center, radius)
+    if seg is not None:
+        draw_dashed_line(d, seg[0], seg[1], dash_rgba, origin=origin)
+
+    # 写编号
+    num = str(it.get("bubble_id", idx))
+    l, t, r, b = d.textbbox((0, 0), num, font=font)
+    tw, th = r-l, b-t
+    d.text((cx - tw/2 - ox, cy - th/2 - oy), num, font=font, fill=number_rgba)
+
 def draw_bubbles(
     img,  # 可传 PIL 或 numpy
     items: List[Dict[str, Any]],
@@ -38,6 +127,10 @@ def draw_bubbles(
     anchor: str = "tr",
     offset: Tuple[int, int] = (8, -8),
     avoid_overlap: bool = True,
+    avoid_text: bool = False,
+    layout: str = "greedy",
+    layout_budget: float = 0.2,
+    positions: Optional[List[Tuple[float, float]]] = None,
     # ------- 样式参数 -------
     show_boxes: bool = False,
     bubble_fill: Tuple[int,int,int] = (255, 0, 0),
@@ -52,6 +145,9 @@ def draw_bubbles(
       1) 可选：OCR 四点多边形框
       2) 半透明气泡 + 虚线连边
       3) 气泡中心编号（it['bubble_id'] 优先）
+    气泡位置由 layout.layout_bubbles 求解（avoid_text=True 时不压文本框与引出线；
+    layout="global" 时整页优化，layout_budget 为秒数）；
+    positions 给定时直接使用（顺序同 items）；items 可为 dict 列表或 items.ItemTable（逐行 dict 视图）
     """
     base_rgb = _to_pil(img)
     base = base_rgb.convert("RGBA")
@@ -59,50 +155,7 @@ def draw_bubbles(
     odraw = ImageDraw.Draw(overlay, "RGBA")
     w, h = base.size
 
-    # 字体
-    font_size = max(10, int(radius * text_scale))
-    try:
-        font = ImageFont.truetype(font_path, font_size) if font_path else ImageFont.load_default()
-    except Exception:
-        font = ImageFont.load_default()
-
-    def centroid(box: List[Tuple[float,float]]) -> Tuple[float,float]:
-        xs = [p[0] for p in box]; ys = [p[1] for p in box]
-        return (sum(xs)/4.0, sum(ys)/4.0)
-
-    def nearest_point_on_edges(pt: Tuple[float,float], poly: List[Tuple[float,float]]) -> Tuple[float,float]:
-        x0, y0 = pt
-        best = None
-        for i in range(4):
-            x1,y1 = poly[i]
-            x2,y2 = poly[(i+1)%4]
-            vx, vy = x2-x1, y2-y1
-            seg_len2 = vx*vx + vy*vy
-            if seg_len2 <= 1e-6:
-                proj = (x1, y1)
-            else:
-                t = ((x0-x1)*vx + (y0-y1)*vy) / seg_len2
-                t = max(0.0, min(1.0, t))
-                proj = (x1 + t*vx, y1 + t*vy)
-            d2 = (proj[0]-x0)**2 + (proj[1]-y0)**2
-            if (best is None) or (d2 < best[0]):
-                best = (d2, proj)
-        return best[1] if best else (poly[0][0], poly[0][1])
-
-    def draw_dashed_line(d: ImageDraw.ImageDraw, p1: Tuple[float,float], p2: Tuple[float,float], dash: int = 6, gap: int = 4):
-        x1,y1 = p1; x2,y2 = p2
-        dx, dy = x2-x1, y2-y1
-        dist = math.hypot(dx, dy)
-        if dist < 1e-3:
-            return
-        ux, uy = dx/dist, dy/dist
-        n = int(dist // (dash+gap)) + 1
-        for i in range(n):
-            a = i*(dash+gap)
-            b = min(a + dash, dist)
-            xa, ya = x1 + ux*a, y1 + uy*a
-            xb, yb = x1 + ux*b, y1 + uy*b
-            d.line((xa,ya,xb,yb), fill=_ensure_rgba(dash_color, 255), width=1)
+    font = load_font(font_path, radius, text_scale)
 
     # 1) 可选显示 OCR 框
     if show_boxes:
@@ -113,65 +166,14 @@ def draw_bubbles(
                 continue
             odraw.polygon(box, outline=box_rgba, fill=None)
 
-    # 简单的防重叠
-    used: List[Tuple[float,float]] = []
-    def place_point(anchor_pt: Tuple[float,float]) -> Tuple[float,float]:
-        x, y = anchor_pt
-        for rtry in range(0, radius*3, max(2, radius//3)):
-            for ang in (0,45,90,135,180,225,270,315):
-                rx = x + (rtry*math.cos(math.radians(ang)))
-                ry = y + (rtry*math.sin(math.radians(ang)))
-                if all((rx-ux)**2 + (ry-uy)**2 > (radius*2.2)**2 for (ux,uy) in used):
-                    used.append((rx,ry))
-                    return (rx, ry)
-        used.append((x,y))
-        return (x,y)
-
-    for idx, it in enumerate(items, start=1):
-        box = it.get("box")
-        if not box or len(box) != 4:
-            cx, cy = it.get("center", (w*0.5, h*0.5))
-            target = (cx, cy)
-        else:
-            target = centroid(box)
-
-        bx, by = target
-        sel_anchor = anchor
-        if anchor == "auto":
-            leftness = bx < w*0.33; rightness = bx > w*0.67
-            topness = by < h*0.33; bottomness = by > h*0.67
-            if leftness and topness:   sel_anchor="br"
-            elif leftness and bottomness: sel_anchor="tr"
-            elif rightness and topness: sel_anchor="bl"
-            elif rightness and bottomness: sel_anchor="tl"
-            else: sel_anchor="tr"
-
-        ax = {"tl": -1, "tr": 1, "bl": -1, "br": 1}.get(sel_anchor, 1)
-        ay = {"tl": -1, "tr": -1, "bl": 1, "br": 1}.get(sel_anchor, -1)
-
-        cx = bx + ax*(abs(offset[0]) + radius*1.2)
-        cy = by + ay*(abs(offset[1]) + radius*1.2)
-        cx, cy = place_point((cx, cy))
-
-        # 2) 画气泡
-        fill_rgba = _ensure_rgba(bubble_fill, bubble_alpha)
-        outline_rgba = _ensure_rgba(bubble_fill, 1.0 if isinstance(bubble_alpha, float) else 255)
-        odraw.ellipse((cx-radius, cy-radius, cx+radius, cy+radius), fill=fill_rgba, outline=outline_rgba, width=2)
-
-        # 连线到最近边
-        if box and len(box)==4:
-            end_pt = nearest_point_on_edges((cx, cy), box)
-            vx, vy = end_pt[0]-cx, end_pt[1]-cy
-            vlen = math.hypot(vx, vy)
-            if vlen > 1e-3:
-                sx, sy = cx + vx/vlen*(radius+1), cy + vy/vlen*(radius+1)
-                draw_dashed_line(odraw, (sx,sy), end_pt)
-
-        # 3) 写编号
-        bubble_num = it.get("bubble_id", idx)
-        num = str(bubble_num)
-        l, t, r, b = odraw.textbbox((0, 0), num, font=font)
-        tw, th = r-l, b-t
-        odraw.text((cx - tw/2, cy - th/2), num, font=font, fill=_ensure_rgba(number_color, 255))
+    if positions is None:
+        positions = layout_bubbles(items, w, h, radius=radius, anchor=anchor, offset=offset,
+                                   avoid_overlap=avoid_overlap, avoid_text=avoid_text,
+                                   method=layout, time_budget=layout_budget)
+
+    # 2) 气泡 + 虚线连边 + 3) 编号
+    colors = bubble_colors(bubble_fill, bubble_alpha, number_color, dash_color)
+    for idx, (it, center) in enumerate(zip(items, positions), start=1):
+        draw_bubble(odraw, it, idx, center, radius, font, colors)
 
     return Image.alpha_composite(base, overlay).convert("RGB")
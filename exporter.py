@@ -1,51 +1,291 @@
 # -*- coding: utf-8 -*-
-from typing import Any, Dict, List, Tuple, Optional
+"""
+exporter.py — 表格导出（流式）
+- 行按 (page, bubble_id) 排序后逐行生成，不在内存里攒整张表
+- CSV 用标准库 csv.writer：含逗号 / 引号 / 换行的文本与 JSON 形式的 box 列自动加引号
+- XLSX 用 openpyxl 的 write-only 模式逐行追加（未安装 openpyxl 时跳过），超过单表行数上限时自动续到下一张表
+- ConsolidatedExport：批处理时把每个文件写好的 CSV 逐行追加到一份合并 CSV / XLSX，内存占用与文件数无关
+- export_jsonl：每行一个 JSON 对象（box 为数组），供流式读取
+- export_columnar：Parquet / Arrow IPC，列带类型（直接取 ItemTable 的数组，不经过行 dict）；需要 pyarrow（可选依赖）。
+  批处理写成按 drawing=<stem> 分区的数据集目录，pyarrow.dataset / DuckDB / Spark 可直接整库查询
+"""
+from typing import Any, Dict, Iterable, Iterator, List, Tuple, Optional, Union
 from pathlib import Path
+import csv
 import json
 
+import numpy as np
+
+from .items import ItemTable, as_table
+
+try:
+    from openpyxl import Workbook
+    from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+except Exception:
+    Workbook = None
+    ILLEGAL_CHARACTERS_RE = None
+
 try:
-    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.parquet as pq
 except Exception:
-    pd = None
-
-def export_tabular(items: List[Dict[str, Any]], out_base: str, image_name: str) -> Tuple[str, Optional[str]]:
-    rows = []
-    for idx, it in enumerate(items, start=1):
-        box = it["box"]
-        flat = [c for p in box for c in p]
-        # —— 改动：bubble_id 优先用用户编辑后的
-        bid = it.get("bubble_id", idx)
-        rows.append({
-            "bubble_id": bid,
-            "text": it.get("text", ""),
-            "type": it.get("type", ""),
-            "conf": round(float(it.get("conf", 1.0)), 4),
-            "cx": round(float(it["center"][0]), 2),
-            "cy": round(float(it["center"][1]), 2),
-            "box": json.dumps(box, ensure_ascii=False),
-            "x1": flat[0], "y1": flat[1], "x2": flat[2], "y2": flat[3],
-            "x3": flat[4], "y3": flat[5], "x4": flat[6], "y4": flat[7],
-            "image": image_name,
-        })
-
-    # 可按 bubble_id 排序输出，便于对齐
-    rows.sort(key=lambda r: (r["bubble_id"],))
-
-    csv_path = f"{out_base}.csv"
-    Path(csv_path).parent.mkdir(parents=True, exist_ok=True)
-    with open(csv_path, "w", encoding="utf-8") as f:
-        cols = list(rows[0].keys()) if rows else ["bubble_id","text","type","conf"]
-        f.write(",".join(cols) + "\n")
+    pa = None
+    pq = None
+
+COLUMNS = ["bubble_id", "text", "type", "conf", "cx", "cy", "box",
+           "x1", "y1", "x2", "y2", "x3", "y3", "x4", "y4", "image"]
+EMPTY_COLUMNS = ["bubble_id", "text", "type", "conf"]
+XLSX_MAX_ROWS = 1048576
+
+_INT_COLS = {"bubble_id", "page"}
+_FLOAT_COLS = {"conf", "cx", "cy", "x1", "y1", "x2", "y2", "x3", "y3", "x4", "y4"}
+
+def _export_order(table: ItemTable) -> Tuple[np.ndarray, np.ndarray]:
+    """导出顺序 (page, bubble_id) 与各行的 bubble_id（未编号的按行号补 1..n）"""
+    n = len(table)
+    bids = np.where(table.bubble_id >= 0, table.bubble_id, np.arange(1, n + 1)).astype(np.int32)
+    return np.lexsort((bids, table.page)), bids
+
+def _table_rows(table: ItemTable, image_name: str, chunk: int = 4096, box_json: bool = True) -> Iterator[Dict[str, Any]]:
+    """ItemTable → 行 dict（按 page, bubble_id 排序）；坐标按块整体展平，不逐条转换 tuple"""
+    order, bids = _export_order(table)
+    n = len(table)
+    names = table.type_names
+    for s in range(0, n, chunk):
+        idx = order[s:s + chunk]
+        f = table.boxes[idx].ravel().tolist()
+        centers = table.centers[idx].tolist()
+        conf = table.conf[idx].tolist()
+        codes = table.type_code[idx].tolist()
+        pages = table.page[idx].tolist()
+        for k, (i, bid) in enumerate(zip(idx.tolist(), bids[idx].tolist())):
+            q = f[8 * k:8 * k + 8]
+            box = [q[0:2], q[2:4], q[4:6], q[6:8]]
+            row = {
+                "bubble_id": bid,
+                "text": table.text[i],
+                "type": names[codes[k]] if codes[k] >= 0 else "",
+                "conf": round(conf[k], 4),
+                "cx": round(centers[k][0], 2),
+                "cy": round(centers[k][1], 2),
+                "box": json.dumps(box, ensure_ascii=False) if box_json else box,
+                "x1": q[0], "y1": q[1], "x2": q[2], "y2": q[3],
+                "x3": q[4], "y3": q[5], "x4": q[6], "y4": q[7],
+                "image": image_name,
+            }
+            if pages[k] > 0:
+                row["page"] = pages[k]
+            yield row
+
+def _item_row(it: Dict[str, Any], bid: Any, image_name: str, box_json: bool = True) -> Dict[str, Any]:
+    box = it["box"]
+    flat = [c for p in box for c in p]
+    row = {
+        "bubble_id": bid,
+        "text": it.get("text", ""),
+        "type": it.get("type", ""),
+        "conf": round(float(it.get("conf", 1.0)), 4),
+        "cx": round(float(it["center"][0]), 2),
+        "cy": round(float(it["center"][1]), 2),
+        "box": json.dumps(box, ensure_ascii=False) if box_json else [list(p) for p in box],
+        "x1": flat[0], "y1": flat[1], "x2": flat[2], "y2": flat[3],
+        "x3": flat[4], "y3": flat[5], "x4": flat[6], "y4": flat[7],
+        "image": image_name,
+    }
+    if "page" in it:
+        row["page"] = int(it["page"])
+    return row
+
+def _item_rows(items: List[Dict[str, Any]], image_name: str, box_json: bool = True) -> Iterator[Dict[str, Any]]:
+    # —— bubble_id 优先用用户编辑后的
+    bids = [it.get("bubble_id", idx) for idx, it in enumerate(items, start=1)]
+    order = sorted(range(len(items)), key=lambda i: (int(items[i].get("page", 0)), bids[i]))
+    for i in order:
+        yield _item_row(items[i], bids[i], image_name, box_json)
+
+def iter_rows(items: Union[List[Dict[str, Any]], ItemTable], image_name: str,
+              box_json: bool = True) -> Iterator[Dict[str, Any]]:
+    """
+    导出行：可按 (page, bubble_id) 排序输出，便于对齐；多页文档每页编号各自从 1 开始。
+    行是逐个生成的，写出端边生成边写；box_json=False 时 box 为坐标数组而不是 JSON 字符串
+    """
+    if isinstance(items, ItemTable):
+        return _table_rows(items, image_name, box_json=box_json)
+    return _item_rows(items, image_name, box_json=box_json)
+
+def columns_for(items: Union[List[Dict[str, Any]], ItemTable]) -> List[str]:
+    if len(items) == 0:
+        return list(EMPTY_COLUMNS)
+    has_page = bool((items.page > 0).any()) if isinstance(items, ItemTable) else any("page" in it for it in items)
+    return COLUMNS + (["page"] if has_page else [])
+
+def _typed(col: str, v: Any) -> Any:
+    """从 CSV 读回的字符串按列恢复数值类型（XLSX 里是数字单元格而不是文本）；文本去掉 XLSX 不允许的控制字符"""
+    if not isinstance(v, str) or v == "":
+        return v
+    try:
+        if col in _INT_COLS:
+            return int(float(v))
+        if col in _FLOAT_COLS:
+            return float(v)
+    except ValueError:
+        pass
+    return ILLEGAL_CHARACTERS_RE.sub("", v) if ILLEGAL_CHARACTERS_RE is not None else v
+
+class TabularWriter:
+    """
+    流式表格写出：<out_base>.csv 与可选的 <out_base>.xlsx，逐行追加。
+    with TabularWriter(base, cols) as w: w.write_rows(rows)；退出后 w.paths = (csv 路径, xlsx 路径或 None)
+    """
+    def __init__(self, out_base: str, columns: List[str], xlsx: bool = True, sheet: str = "dims"):
+        self.columns = list(columns)
+        self.csv_path = f"{out_base}.csv"
+        Path(self.csv_path).parent.mkdir(parents=True, exist_ok=True)
+        self._f = open(self.csv_path, "w", encoding="utf-8", newline="")
+        self._csv = csv.writer(self._f, lineterminator="\n")
+        self._csv.writerow(self.columns)
+        self.rows = 0
+        self.xlsx_path: Optional[str] = None
+        self._wb = None
+        self._sheet = sheet
+        if xlsx and Workbook is not None:
+            try:
+                self._wb = Workbook(write_only=True)
+                self._new_sheet()
+                self.xlsx_path = f"{out_base}.xlsx"
+            except Exception:
+                self._wb = None
+
+    def _new_sheet(self) -> None:
+        n = len(self._wb.worksheets)
+        self._ws = self._wb.create_sheet(self._sheet if n == 0 else f"{self._sheet}_{n + 1}")
+        self._ws.append(self.columns)
+        self._ws_rows = 1
+
+    def write_row(self, row: Dict[str, Any]) -> None:
+        vals = [row.get(c, "") for c in self.columns]
+        self._csv.writerow(vals)
+        if self._wb is not None:
+            # XLSX 写失败不影响 CSV：丢弃工作簿，xlsx_path 置 None
+            try:
+                if self._ws_rows >= XLSX_MAX_ROWS:
+                    self._new_sheet()
+                self._ws.append([_typed(c, v) for c, v in zip(self.columns, vals)])
+                self._ws_rows += 1
+            except Exception:
+                self._wb = None
+                self.xlsx_path = None
+        self.rows += 1
+
+    def write_rows(self, rows: Iterable[Dict[str, Any]]) -> None:
         for r in rows:
-            line = ",".join([str(r.get(c, "")) for c in cols])
-            f.write(line + "\n")
-
-    xlsx_path = None
-    if pd is not None:
-        try:
-            df = pd.DataFrame(rows)
-            xlsx_path = f"{out_base}.xlsx"
-            df.to_excel(xlsx_path, index=False)
-        except Exception:
-            xlsx_path = None
-    return csv_path, xlsx_path
+            self.write_row(r)
+
+    def close(self) -> Tuple[str, Optional[str]]:
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+            if self._wb is not None:
+                try:
+                    self._wb.save(self.xlsx_path)
+                except Exception:
+                    self.xlsx_path = None
+                self._wb = None
+        return self.paths
+
+    @property
+    def paths(self) -> Tuple[str, Optional[str]]:
+        return self.csv_path, self.xlsx_path
+
+    def __enter__(self) -> "TabularWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+def export_tabular(items: Union[List[Dict[str, Any]], ItemTable], out_base: str,
+                   image_name: str, xlsx: bool = True) -> Tuple[str, Optional[str]]:
+    with TabularWriter(out_base, columns_for(items), xlsx=xlsx) as w:
+        w.write_rows(iter_rows(items, image_name))
+    return w.paths
+
+class ConsolidatedExport:
+    """
+    批处理合并表：add_csv() 把单个文件导出的 CSV 逐行读出、追加到 <out_base>.csv / .xlsx。
+    列固定为 COLUMNS + page（单页文件 page 为空），只在内存里保留当前一行
+    """
+    def __init__(self, out_base: str, xlsx: bool = True):
+        self.writer = TabularWriter(out_base, COLUMNS + ["page"], xlsx=xlsx)
+
+    def add_csv(self, csv_path: str) -> int:
+        n = 0
+        with open(csv_path, "r", encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                self.writer.write_row(row)
+                n += 1
+        return n
+
+    def close(self) -> Tuple[str, Optional[str]]:
+        return self.writer.close()
+
+def export_jsonl(items: Union[List[Dict[str, Any]], ItemTable], path: str, image_name: str) -> str:
+    """JSON Lines：每个条目一行，字段与 CSV 相同（box 为数组）"""
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for row in iter_rows(items, image_name, box_json=False):
+            f.write(json.dumps(row, ensure_ascii=False))
+            f.write("\n")
+    return path
+
+# ---------------- Parquet / Arrow ----------------
+COLUMNAR_FORMATS = ("parquet", "arrow")
+_SUFFIX = {"parquet": ".parquet", "arrow": ".arrow"}
+
+def columnar_schema() -> "pa.Schema":
+    f32 = pa.float32()
+    return pa.schema([("bubble_id", pa.int32()), ("text", pa.string()), ("type", pa.dictionary(pa.int16(), pa.string())),
+                      ("conf", pa.float64()), ("cx", pa.float64()), ("cy", pa.float64())]
+                     + [(f"{a}{k}", f32) for k in range(1, 5) for a in ("x", "y")]
+                     + [("image", pa.string()), ("page", pa.int32())])
+
+def columnar_table(items: Union[List[Dict[str, Any]], ItemTable], image_name: str) -> "pa.Table":
+    """
+    条目 → pyarrow.Table（按 page, bubble_id 排序）：数值列直接由 ItemTable 的数组构造，
+    type 为字典编码（码表即 type_names），未分类为 null；无页码（单页文件）时 page 为 null
+    """
+    if pa is None:
+        raise RuntimeError("pyarrow is not installed; install it to export Parquet / Arrow")
+    table = as_table(items)
+    order, bids = _export_order(table)
+    boxes = table.boxes[order].reshape(-1, 8)
+    codes = table.type_code[order]
+    page = table.page[order]
+    cols = [pa.array(bids[order], pa.int32()),
+            pa.array([table.text[i] for i in order.tolist()], pa.string()),
+            pa.DictionaryArray.from_arrays(pa.array(codes, pa.int16(), mask=codes < 0),
+                                           pa.array(table.type_names, pa.string())),
+            pa.array(table.conf[order]), pa.array(table.centers[order, 0]), pa.array(table.centers[order, 1])]
+    cols += [pa.array(boxes[:, k].astype(np.float32)) for k in range(8)]
+    cols += [pa.array([image_name] * len(order), pa.string()), pa.array(page, pa.int32(), mask=page <= 0)]
+    return pa.Table.from_arrays(cols, schema=columnar_schema())
+
+def export_columnar(items: Union[List[Dict[str, Any]], ItemTable], path: str, image_name: str,
+                    fmt: str = "parquet") -> str:
+    """写出单个 Parquet（zstd 压缩）或 Arrow IPC 文件"""
+    if fmt not in COLUMNAR_FORMATS:
+        raise ValueError(f"unknown columnar format '{fmt}' (available: {', '.join(COLUMNAR_FORMATS)})")
+    t = columnar_table(items, image_name)
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    if fmt == "parquet":
+        pq.write_table(t, path, compression="zstd")
+    else:
+        with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, t.schema) as w:
+            w.write_table(t)
+    return path
+
+def dataset_path(dataset_dir: str, stem: str, fmt: str = "parquet") -> str:
+    """分区数据集中某个文件的位置：<dataset_dir>/drawing=<stem>/part-0.<ext>（hive 分区）"""
+    return str(Path(dataset_dir) / f"drawing={stem}" / f"part-0{_SUFFIX[fmt]}")
+
+__all__ = ["COLUMNS", "COLUMNAR_FORMATS", "iter_rows", "columns_for", "export_tabular", "TabularWriter",
+           "ConsolidatedExport", "export_jsonl", "columnar_schema", "columnar_table", "export_columnar", "dataset_path"]
@@ -17,3 +17,63 @@ def default_exclusion_zones(w: int, h: int) -> List[Tuple[float, float, float, f
         (0, 0, w * m, h), (0, 0, w, h * m), (w * (1 - m), 0, w, h), (0, h * (1 - m), w, h),
     ]
     return outer + [top_bar, left_bar, bottom_bar, right_bar, title_block]
+
+def quad_bbox(box) -> Tuple[float, float, float, float]:
+    xs = [p[0] for p in box]; ys = [p[1] for p in box]
+    return (min(xs), min(ys), max(xs), max(ys))
+
+def rect_area(r: Tuple[float, float, float, float]) -> float:
+    return max(0.0, r[2] - r[0]) * max(0.0, r[3] - r[1])
+
+def rect_intersection(a: Tuple[float, float, float, float], b: Tuple[float, float, float, float]) -> float:
+    w = min(a[2], b[2]) - max(a[0], b[0])
+    h = min(a[3], b[3]) - max(a[1], b[1])
+    return w * h if (w > 0 and h > 0) else 0.0
+
+def rect_iou(a: Tuple[float, float, float, float], b: Tuple[float, float, float, float]) -> float:
+    inter = rect_intersection(a, b)
+    if inter <= 0:
+        return 0.0
+    return inter / (rect_area(a) + rect_area(b) - inter)
+
+def nearest_point_on_edges(pt: Tuple[float, float], poly: List[Tuple[float, float]]) -> Tuple[float, float]:
+    """多边形（按边首尾相连）边上离 pt 最近的点，用于气泡引出线的落点"""
+    x0, y0 = pt
+    best = None
+    n = len(poly)
+    for i in range(n):
+        x1, y1 = poly[i]
+        x2, y2 = poly[(i + 1) % n]
+        vx, vy = x2 - x1, y2 - y1
+        seg_len2 = vx * vx + vy * vy
+        if seg_len2 <= 1e-6:
+            proj = (x1, y1)
+        else:
+            t = ((x0 - x1) * vx + (y0 - y1) * vy) / seg_len2
+            t = max(0.0, min(1.0, t))
+            proj = (x1 + t * vx, y1 + t * vy)
+        d2 = (proj[0] - x0) ** 2 + (proj[1] - y0) ** 2
+        if (best is None) or (d2 < best[0]):
+            best = (d2, proj)
+    return best[1] if best else (poly[0][0], poly[0][1])
+
+def point_segment_dist2(pt: Tuple[float, float], a: Tuple[float, float], b: Tuple[float, float]) -> float:
+    x0, y0 = pt
+    vx, vy = b[0] - a[0], b[1] - a[1]
+    seg_len2 = vx * vx + vy * vy
+    t = 0.0 if seg_len2 <= 1e-12 else max(0.0, min(1.0, ((x0 - a[0]) * vx + (y0 - a[1]) * vy) / seg_len2))
+    px, py = a[0] + t * vx, a[1] + t * vy
+    return (px - x0) ** 2 + (py - y0) ** 2
+
+def circle_hits_rect(c: Tuple[float, float], r: float, rect: Tuple[float, float, float, float]) -> bool:
+    px = min(max(c[0], rect[0]), rect[2])
+    py = min(max(c[1], rect[1]), rect[3])
+    return (px - c[0]) ** 2 + (py - c[1]) ** 2 < r * r
+
+def segments_cross(a: Tuple[float, float], b: Tuple[float, float],
+                   c: Tuple[float, float], d: Tuple[float, float]) -> bool:
+    """线段 ab 与 cd 是否严格相交（共端点、共线接触不算交叉）"""
+    def orient(p, q, r):
+        v = (q[0] - p[0]) * (r[1] - p[1]) - (q[1] - p[1]) * (r[0] - p[0])
+        return (v > 1e-9) - (v < -1e-9)
+    return (orient(a, b, c) * orient(a, b, d) < 0) and (orient(c, d, a) * orient(c, d, b) < 0)
@@ -7,10 +7,14 @@ from PIL import Image
 import numpy as np
 import gradio as gr
 
-from .ocr import run_ocr, ocr_prefill_at
+from .ocr import ocr_prefill_item_at, recognize_regions, warmup_ocr
+from .pipeline import ocr_image
+from .metrics import Metrics, collecting, stage
 from .cleaning import clean_items
 from .sorting import sort_reading_order
 from .drawing import draw_bubbles
+from .render_cache import BubbleRenderer
+from .preview import ViewTransform, parse_region
 from .exporter import export_tabular
 from .rules import classify_text
 
@@ -79,6 +83,48 @@ def _coerce_table_value(table_val) -> List[Dict[str, Any]]:
         rows_out.append({"bubble_id": bid, "text": txt, "type": tp, "conf": cf})
     return rows_out
 
+def _parse_offset(offset: str) -> Tuple[int, int]:
+    try:
+        dx, dy = tuple(map(int, (offset or "10,-10").split(",")))
+        return dx, dy
+    except Exception:
+        return (10, -10)
+
+def _hit_item(items: List[Dict[str, Any]], positions: List[Tuple[float, float]], x: float, y: float,
+              radius: float) -> Optional[int]:
+    """点击命中的条目下标：点在文本框内或气泡圆内，距离取到框 / 圆心的较小者；都不在 radius 范围内时返回 None"""
+    best, best_d = None, float(radius)
+    for i, it in enumerate(items):
+        box = it.get("box")
+        if box and len(box) == 4:
+            xs = [p[0] for p in box]; ys = [p[1] for p in box]
+            d = float(np.hypot(max(min(xs) - x, 0.0, x - max(xs)), max(min(ys) - y, 0.0, y - max(ys))))
+        else:
+            d = float(np.hypot(it["center"][0] - x, it["center"][1] - y))
+        if i < len(positions):
+            d = min(d, max(0.0, float(np.hypot(positions[i][0] - x, positions[i][1] - y)) - radius))
+        if d <= best_d:
+            best, best_d = i, d
+    return best
+
+def _next_bubble_id(items: List[Dict[str, Any]]) -> int:
+    ids = []
+    for it in items:
+        try:
+            ids.append(int(it.get("bubble_id")))
+        except (TypeError, ValueError):
+            continue
+    return max(ids, default=0) + 1
+
+def _renderer(renderer: Optional[BubbleRenderer], orig_img: Image.Image, bubble_radius, label_scale,
+              font_path, anchor, offset) -> BubbleRenderer:
+    """复用会话中的增量渲染器；换图时新建，样式参数变化时由 configure 整体重建"""
+    if renderer is None or not renderer.matches(orig_img):
+        renderer = BubbleRenderer(orig_img)
+    renderer.configure(radius=int(bubble_radius), text_scale=float(label_scale), font_path=(font_path or None),
+                       anchor=anchor, offset=_parse_offset(offset))
+    return renderer
+
 def build_gradio_app():
     import gradio as gr
 
@@ -101,9 +147,16 @@ def build_gradio_app():
                 offset = gr.Textbox(value="10,-10", label="气泡偏移 dx,dy")
                 font_path = gr.Textbox(value="", label="可选：TTF字体路径(提高数字清晰度)")
                 exclude = gr.Textbox(value="", label="可选：排除区域 'x1,y1,x2,y2;...'（像素）")
+                tiled = gr.Checkbox(value=False, label="分块高分辨率识别（大幅面图纸）")
+                tile_size = gr.Slider(640, 4096, value=1600, step=32, label="分块边长(px)")
+                refresh = gr.Checkbox(value=False, label="忽略缓存，强制重新识别")
                 run_btn = gr.Button("START")
             with gr.Column(scale=2):
                 anno_out = gr.Image(label="可点击的预览（选择模式后点击图片）", interactive=True)
+                with gr.Row():
+                    preview_max = gr.Slider(512, 4096, value=2048, step=128, label="预览最长边(px)")
+                    zoom_region = gr.Textbox(value="", label="放大区域 x1,y1,x2,y2（原图像素，留空=整图）")
+                    view_btn = gr.Button("刷新视图")
                 table_out = gr.Dataframe(
                     headers=_COLS,
                     row_count=(1, "dynamic"),
@@ -113,7 +166,7 @@ def build_gradio_app():
                 log_out = gr.Textbox(label="运行日志", interactive=False)
                 with gr.Row():
                     edit_mode = gr.Radio(["添加","删除"], value="添加", label="点击模式")
-                    manual_text = gr.Textbox(value="", label="添加时：手动文本（留空则自动OCR预填）")
+                    manual_text = gr.Textbox(value="", label="添加时：手动文本（留空则自动OCR预填；表格中清空 text 则按原框重新识别）")
                     prefill_patch = gr.Slider(16, 160, value=64, step=8, label="自动预填OCR范围(px)")
                 export_btn = gr.Button("导出 CSV / (XLSX) / JSON 到 out/时间戳")
                 csv_file = gr.File(label="CSV")
@@ -122,81 +175,96 @@ def build_gradio_app():
 
         items_state = gr.State([])        # list[dict]
         orig_img_state = gr.State(None)   # PIL Image
+        renderer_state = gr.State(None)   # BubbleRenderer：底图 RGBA + 气泡贴片缓存 + 预览金字塔
+        view_state = gr.State(None)       # ViewTransform.to_dict()：当前预览的显示→原图坐标变换
+
+        def _view(renderer: BubbleRenderer, zoom_region: str, preview_max) -> Tuple[Image.Image, Dict[str, Any]]:
+            """全分辨率结果留在内存，界面只拿限尺寸的整图 / 局部视图"""
+            img, tr = renderer.preview(parse_region(zoom_region), max_side=int(preview_max))
+            return img, tr.to_dict()
 
-        def _run_and_store(img, lang, min_conf, bubble_radius, label_scale, anchor, offset, exclude, font_path):
+        def _run_and_store(img, lang, min_conf, bubble_radius, label_scale, anchor, offset, exclude, font_path,
+                           tiled, tile_size, refresh, zoom_region, preview_max):
             if img is None:
                 raise gr.Error("请先上传一张图纸")
             img = img.convert("RGB")
             W, H = img.size
-            ocr_items, mode = run_ocr(img, lang=lang, det=True, rec=True)
-            zones = _parse_excludes(exclude)
-            items = clean_items(ocr_items, W, H, min_conf=min_conf, custom_excludes=zones)
-            items = sort_reading_order(items)
-
-            # 为 items 赋初始 bubble_id（1..N）
-            for i, it in enumerate(items, start=1):
-                it["bubble_id"] = i
-
-            try:
-                dx, dy = tuple(map(int, (offset or "10,-10").split(",")))
-            except Exception:
-                dx, dy = (10, -10)
-            anno = draw_bubbles(img, items, radius=bubble_radius, text_scale=label_scale,
-                                font_path=(font_path or None), anchor=anchor, offset=(dx,dy), avoid_overlap=True)
+            metrics = Metrics("uploaded_image")
+            with collecting(metrics):
+                # 原始 OCR 结果走磁盘缓存：只改清洗/气泡参数时再次 START 不重新识别
+                ocr_items, mode = ocr_image(img, {"lang": lang, "tiled": bool(tiled), "tile_size": int(tile_size),
+                                                  "tile_overlap": int(tile_size) // 8, "refresh": bool(refresh)})
+                zones = _parse_excludes(exclude)
+                with stage("clean") as rec:
+                    items = clean_items(ocr_items, W, H, min_conf=min_conf, custom_excludes=zones)
+                    rec.items = len(items)
+                with stage("sort", items=len(items)):
+                    items = sort_reading_order(items)
+
+                # 为 items 赋初始 bubble_id（1..N）
+                for i, it in enumerate(items, start=1):
+                    it["bubble_id"] = i
+
+                with stage("draw", items=len(items)):
+                    renderer = _renderer(None, img, bubble_radius, label_scale, font_path, anchor, offset)
+                    renderer.render(items)
+                    anno, view = _view(renderer, zoom_region, preview_max)
             rows = _to_table(items, "uploaded_image")
             table = _rows_to_grid(rows)
-            log = (
-                f"[INFO] image: {W}x{H}\n"
-                f"[INFO] PaddleOCR mode: {mode}; raw items: {len(ocr_items)}\n"
-                f"[INFO] after cleaning: {len(items)}"
-            )
-            return anno, items, table, img, log
+            log = "\n".join([
+                f"[INFO] image: {W}x{H}",
+                f"[INFO] PaddleOCR mode: {mode}; raw items: {len(ocr_items)}",
+                f"[INFO] after cleaning: {len(items)}",
+            ] + metrics.summary_lines())
+            return anno, items, table, img, log, renderer, view
 
         def _on_click(evt: "gr.SelectData", mode: str, items: List[Dict[str,Any]],
               orig_img: Image.Image, label_scale: float, bubble_radius: int,
               anchor: str, offset: str, font_path: Optional[str], lang: str,
-              prefill_patch: int, manual_text: str):
+              prefill_patch: int, manual_text: str, renderer: Optional[BubbleRenderer],
+              view: Optional[Dict[str, Any]], zoom_region: str, preview_max: int):
             if orig_img is None:
                 raise gr.Error("请先上传并运行一次 OCR")
 
-            # ------- 新增：把预览坐标 -> 原图坐标 -------
-            x, y = float(evt.index[0]), float(evt.index[1])
-            W, H = orig_img.size
-            disp_w = None
-            disp_h = None
-            # gradio 里 evt.image 可能是 numpy 或 PIL，做两种兼容
-            try:
-                import numpy as _np  # 已在文件顶部 import 过就不会重复
-                if isinstance(evt.image, _np.ndarray):
-                    disp_h, disp_w = evt.image.shape[:2]
-                elif hasattr(evt.image, "size"):
-                    disp_w, disp_h = evt.image.size[0], evt.image.size[1]
-            except Exception:
-                if hasattr(evt.image, "size"):
-                    disp_w, disp_h = evt.image.size[0], evt.image.size[1]
-            if disp_w and disp_h and (disp_w != W or disp_h != H):
-                sx = W / float(disp_w)
-                sy = H / float(disp_h)
-                x *= sx
-                y *= sy
-            # ---------------------------------------
-
-            try:
-                dx, dy = tuple(map(int, (offset or "10,-10").split(",")))
-            except Exception:
-                dx, dy = (10, -10)
+            # 预览坐标 -> 原图坐标：只经过当前视图的变换
+            x, y = ViewTransform.from_dict(view).to_original(float(evt.index[0]), float(evt.index[1]))
+            items = list(items or [])
+            renderer = _renderer(renderer, orig_img, bubble_radius, label_scale, font_path, anchor, offset)
+
+            if mode == "删除":
+                hit = _hit_item(items, renderer.positions, x, y, radius=float(bubble_radius))
+                if hit is None:
+                    gr.Info("点击处没有可删除的气泡或文本")
+                else:
+                    items.pop(hit)
+            else:
+                # 文本行定位 + 只识别该行（跳过检测）；手动文本优先
+                new = ocr_prefill_item_at(orig_img, x, y, lang=lang, patch=int(prefill_patch))
+                text = (manual_text or "").strip()
+                if new is None:
+                    if not text:
+                        raise gr.Error("点击处未识别到文本，请填写手动文本后再点击")
+                    r = float(bubble_radius) / 2.0
+                    box = [(x - r, y - r), (x + r, y - r), (x + r, y + r), (x - r, y + r)]
+                    new = {"box": box, "center": (x, y)}
+                if text:
+                    new["text"], new["conf"] = text, 1.0
+                new["type"] = classify_text(new["text"]) or ""
+                new["bubble_id"] = _next_bubble_id(items)
+                items.append(new)
 
             # 仍按阅读顺序排序，但不重置 bubble_id
             items = sort_reading_order(items)
-            anno = draw_bubbles(orig_img, items, radius=bubble_radius, text_scale=label_scale,
-                                font_path=(font_path or None), anchor=anchor, offset=(dx,dy), avoid_overlap=True)
+            renderer.render(items)
+            anno, view = _view(renderer, zoom_region, preview_max)
             rows = _to_table(items, "uploaded_image")
             table = _rows_to_grid(rows)
-            return anno, items, table
+            return anno, items, table, renderer, view
 
         def _on_table_edit(table_val, items: List[Dict[str,Any]], orig_img: Image.Image,
-                           label_scale: float, bubble_radius: int, anchor: str, offset: str, font_path: Optional[str]):
-            """用户编辑表格后：同步 items 的四个字段，并重绘"""
+                           label_scale: float, bubble_radius: int, anchor: str, offset: str, font_path: Optional[str],
+                           lang: str, renderer: Optional[BubbleRenderer], zoom_region: str, preview_max: int):
+            """用户编辑表格后：同步 items 的四个字段，只重绘编号变化的气泡；text 被清空的行按原框整批重新识别"""
             if orig_img is None or items is None:
                 raise gr.Error("请先上传并运行一次 OCR")
             coerced = _coerce_table_value(table_val)
@@ -213,26 +281,40 @@ def build_gradio_app():
                         items[i]["conf"] = float(row["conf"])
                     except Exception:
                         pass
+            reread = [i for i in range(n) if not (items[i].get("text") or "").strip()
+                      and items[i].get("box") and len(items[i]["box"]) == 4]
+            if reread:
+                results = recognize_regions(orig_img, [items[i]["box"] for i in reread], lang=lang)
+                for i, (txt, conf) in zip(reread, results):
+                    items[i]["text"] = txt
+                    items[i]["conf"] = float(conf)
+                    items[i]["type"] = classify_text(txt) or ""
             # 不改变 items 顺序，仅用新的 bubble_id 绘制
-            try:
-                dx, dy = tuple(map(int, (offset or "10,-10").split(",")))
-            except Exception:
-                dx, dy = (10, -10)
-            anno = draw_bubbles(orig_img, items, radius=bubble_radius, text_scale=label_scale,
-                                font_path=(font_path or None), anchor=anchor, offset=(dx,dy), avoid_overlap=True)
+            renderer = _renderer(renderer, orig_img, bubble_radius, label_scale, font_path, anchor, offset)
+            renderer.render(items)
+            anno, view = _view(renderer, zoom_region, preview_max)
             # 规范化表格显示（例如 conf 四舍五入）
             rows = _to_table(items, "uploaded_image")
             table_norm = _rows_to_grid(rows)
-            return anno, items, table_norm
+            return anno, items, table_norm, renderer, view
+
+        def _on_view(renderer: Optional[BubbleRenderer], zoom_region: str, preview_max: int):
+            if renderer is None:
+                raise gr.Error("请先上传并运行一次 OCR")
+            return _view(renderer, zoom_region, preview_max)
 
-        def _on_export(items: List[Dict[str,Any]], orig_img: Image.Image):
+        def _on_export(items: List[Dict[str,Any]], orig_img: Image.Image, renderer: Optional[BubbleRenderer]):
             if not items:
                 raise gr.Error("当前没有可导出的项。请先运行 OCR 或添加点位。")
             outdir = Path("out") / time.strftime("%Y%m%d_%H%M%S")
             outdir.mkdir(parents=True, exist_ok=True)
 
-            # 导出图像（用当前 bubble_id 绘制）
-            anno = draw_bubbles(orig_img, items, radius=18, text_scale=1.2, anchor="tr", offset=(10, -10))
+            # 导出图像：只在这里做一次全分辨率整图渲染（用当前 bubble_id 与界面上的气泡参数）
+            if renderer is not None:
+                anno = draw_bubbles(orig_img, items, radius=renderer.radius, text_scale=renderer.text_scale,
+                                    font_path=renderer.font_path, anchor=renderer.anchor, offset=renderer.offset)
+            else:
+                anno = draw_bubbles(orig_img, items, radius=18, text_scale=1.2, anchor="tr", offset=(10, -10))
             img_name = "uploaded_image"
             anno_path = outdir / f"{img_name}_bubbled.jpg"
             anno.save(anno_path, quality=95)
@@ -249,22 +331,34 @@ def build_gradio_app():
             return str(csv_path), (str(xlsx_path) if xlsx_path else None), str(json_path)
 
         run_btn.click(_run_and_store,
-                      inputs=[img_in, lang, min_conf, bubble_radius, label_scale, anchor, offset, exclude, font_path],
-                      outputs=[anno_out, items_state, table_out, orig_img_state, log_out])
+                      inputs=[img_in, lang, min_conf, bubble_radius, label_scale, anchor, offset, exclude, font_path,
+                              tiled, tile_size, refresh, zoom_region, preview_max],
+                      outputs=[anno_out, items_state, table_out, orig_img_state, log_out, renderer_state, view_state])
 
         anno_out.select(_on_click,
-                        inputs=[edit_mode, items_state, orig_img_state, label_scale, bubble_radius, anchor, offset, font_path, lang, prefill_patch, manual_text],
-                        outputs=[anno_out, items_state, table_out])
+                        inputs=[edit_mode, items_state, orig_img_state, label_scale, bubble_radius, anchor, offset, font_path, lang, prefill_patch, manual_text, renderer_state,
+                                view_state, zoom_region, preview_max],
+                        outputs=[anno_out, items_state, table_out, renderer_state, view_state])
 
         # —— 新增：表格编辑事件
         table_out.change(_on_table_edit,
-                         inputs=[table_out, items_state, orig_img_state, label_scale, bubble_radius, anchor, offset, font_path],
-                         outputs=[anno_out, items_state, table_out])
+                         inputs=[table_out, items_state, orig_img_state, label_scale, bubble_radius, anchor, offset, font_path, lang, renderer_state,
+                                 zoom_region, preview_max],
+                         outputs=[anno_out, items_state, table_out, renderer_state, view_state])
+
+        view_btn.click(_on_view, inputs=[renderer_state, zoom_region, preview_max], outputs=[anno_out, view_state])
 
-        export_btn.click(_on_export, inputs=[items_state, orig_img_state], outputs=[csv_file, xlsx_file, json_file])
+        export_btn.click(_on_export, inputs=[items_state, orig_img_state, renderer_state], outputs=[csv_file, xlsx_file, json_file])
 
     return demo
 
 def cmd_gradio(args):
+    # 启动时预加载 OCR 模型，后续 START / 点击预填共用同一引擎
+    if not getattr(args, "no_warmup", False):
+        try:
+            mode = warmup_ocr(lang=getattr(args, "lang", "en"))
+            print(f"[INFO] PaddleOCR warmed up: {mode}")
+        except Exception as e:
+            print(f"[WARN] OCR warmup failed: {e}")
     demo = build_gradio_app()
     demo.launch(share=args.share)
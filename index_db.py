@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+"""
+index_db.py — 全图库尺寸索引（SQLite）
+- drawings：每张图纸一行（图号 + 版本唯一），dims：清洗后的条目（页码、气泡号、类型、文本、数值、置信度、框）
+- 数值规范化：去掉 ⌀/R/M 前缀、"2×" 数量前缀，cm / m 换算为 mm，配合公差带代号（H7、g6…）与 ± 公差单独成列，
+  "⌀12 H7" 即 type='DIA' AND value=12 AND fit='H7'，走 (type, value) 索引。
+  注意 clean_items 目前不保留带公差带 / ± 的文本，fit / tol 只对 --add 补录的（人工修订过的）JSON 有值
+- 文本检索：FTS5 trigram 全文索引（规范化文本，Φ/Ø → ⌀、去空格、大写），子串匹配；
+  SQLite 不支持 FTS5 / trigram 时依次退回 unicode61 分词、LIKE 扫描
+- 写入按批提交：add() 只入缓冲，累计 batch_rows 行后一个事务内 executemany 写入；同一图纸重复入库时替换旧行
+- 批处理在主进程里汇入各 worker 写好的 {stem}_dims.json，worker 之间不争写锁
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import glob as _glob
+import json
+import re
+import sys
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+SCHEMA_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS drawings (
+    id INTEGER PRIMARY KEY,
+    drawing TEXT NOT NULL,
+    revision TEXT NOT NULL DEFAULT '',
+    source TEXT,
+    items INTEGER NOT NULL DEFAULT 0,
+    indexed_at REAL NOT NULL,
+    UNIQUE (drawing, revision)
+);
+CREATE TABLE IF NOT EXISTS dims (
+    id INTEGER PRIMARY KEY,
+    drawing_id INTEGER NOT NULL REFERENCES drawings(id) ON DELETE CASCADE,
+    page INTEGER NOT NULL DEFAULT 0,
+    bubble_id INTEGER,
+    type TEXT,
+    text TEXT NOT NULL,
+    norm TEXT NOT NULL,
+    value REAL,
+    fit TEXT,
+    tol REAL,
+    conf REAL,
+    cx REAL, cy REAL,
+    x1 REAL, y1 REAL, x2 REAL, y2 REAL, x3 REAL, y3 REAL, x4 REAL, y4 REAL
+);
+CREATE INDEX IF NOT EXISTS dims_type_value ON dims (type, value);
+CREATE INDEX IF NOT EXISTS dims_value ON dims (value);
+CREATE INDEX IF NOT EXISTS dims_drawing ON dims (drawing_id, page, bubble_id);
+CREATE INDEX IF NOT EXISTS drawings_revision ON drawings (revision);
+"""
+
+_FTS = """
+CREATE VIRTUAL TABLE IF NOT EXISTS dims_fts USING fts5(norm, content='dims', content_rowid='id'{tokenize});
+CREATE TRIGGER IF NOT EXISTS dims_fts_ai AFTER INSERT ON dims BEGIN
+    INSERT INTO dims_fts (rowid, norm) VALUES (new.id, new.norm);
+END;
+CREATE TRIGGER IF NOT EXISTS dims_fts_ad AFTER DELETE ON dims BEGIN
+    INSERT INTO dims_fts (dims_fts, rowid, norm) VALUES ('delete', old.id, old.norm);
+END;
+"""
+
+_DIA_GLYPHS = str.maketrans({"Φ": "⌀", "φ": "⌀", "Ø": "⌀", "ø": "⌀", "∅": "⌀", "×": "X", ",": "."})
+_COUNT = re.compile(r"^\d+[xX](?=[⌀RrM])")
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+_TOL = re.compile(r"±(\d+(?:\.\d+)?)")
+_UNIT = re.compile(r"(mm|cm|m)(?![A-Za-z0-9])", re.I)
+_UNIT_MM = {"mm": 1.0, "cm": 10.0, "m": 1000.0}
+_FIT = re.compile(r"[(\[]?([A-HJKMNP-Za-hjkmnp-z]{1,2}\d{1,2})(?![\d.])")
+_REV = re.compile(r"^(?P<drawing>.+?)[ _.-]+(?i:rev(?:ision)?)[ _.-]*(?P<rev>[A-Z]{1,2}|\d{1,3})$")
+
+def _canon(text: str) -> str:
+    return re.sub(r"\s+", "", (text or "").translate(_DIA_GLYPHS))
+
+def norm_text(text: str) -> str:
+    """检索用的规范化文本：直径符号统一为 ⌀、× → X、小数逗号 → 点、去空白、大写"""
+    return _canon(text).upper()
+
+def normalize_value(text: str, tp: Optional[str] = None) -> Tuple[Optional[float], Optional[str], Optional[float]]:
+    """
+    尺寸文本 → (数值, 公差带代号, ± 公差)。长度类换算为 mm；公差带代号保留大小写（H7 孔 / g6 轴）。
+    '2×⌀6.5' → 6.5，'M8×1.25' → 8，'45°' → 45，'⌀12 H7' → (12, 'H7', None)，'50±0.1' → (50, None, 0.1)
+    """
+    s = _COUNT.sub("", _canon(text))
+    m = _NUMBER.search(s)
+    if m is None:
+        return None, None, None
+    value = float(m.group(0))
+    rest = s[m.end():]
+    tol = None
+    t = _TOL.search(rest)
+    if t is not None:
+        tol = float(t.group(1))
+        rest = rest[:t.start()] + rest[t.end():]
+    fit = None
+    if tp in (None, "LEN", "DIA", "R"):
+        u = _UNIT.match(rest)
+        if u is not None:
+            value *= _UNIT_MM[u.group(1).lower()]
+            rest = rest[u.end():]
+        f = _FIT.match(rest)
+        if f is not None:
+            fit = f.group(1)
+    return value, fit, tol
+
+def norm_revision(revision: Optional[str]) -> str:
+    """版本号统一为去空白、大写（入库与查询共用）"""
+    return (revision or "").strip().upper()
+
+def split_revision(stem: str) -> Tuple[str, str]:
+    """文件名 → (图号, 版本)：'PN-1234_revC' / 'PN-1234 Rev B' → ('PN-1234', 'C')；无版本后缀时版本为空"""
+    m = _REV.match(stem)
+    if m is None:
+        return stem, ""
+    return m.group("drawing"), norm_revision(m.group("rev"))
+
+class DimIndex:
+    """
+    idx = DimIndex("dims.sqlite"); idx.add("PN-1234", "C", items); idx.close()
+    add() 只缓冲，满 batch_rows 行时一次事务写入；close() / flush() 写入剩余部分
+    """
+    def __init__(self, path: str, batch_rows: int = 20000):
+        self.path = str(path)
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.batch_rows = max(1, int(batch_rows))
+        self._pending: List[Tuple[str, str, Optional[str], List[Tuple[Any, ...]]]] = []
+        self._pending_rows = 0
+        self.fts = self._ensure_schema()
+
+    def _ensure_schema(self) -> Optional[str]:
+        """建表；返回全文索引的分词器（'trigram' / 'unicode61'），不支持 FTS5 时为 None"""
+        c = self.conn
+        c.executescript(_SCHEMA)
+        row = c.execute("SELECT sql FROM sqlite_master WHERE name = 'dims_fts'").fetchone()
+        if row is not None:
+            return "trigram" if "trigram" in row[0] else "unicode61"
+        for tok in ("trigram", "unicode61"):
+            try:
+                c.executescript(_FTS.format(tokenize=", tokenize='trigram'" if tok == "trigram" else ""))
+                if c.execute("SELECT count(*) FROM dims").fetchone()[0]:
+                    c.execute("INSERT INTO dims_fts (dims_fts) VALUES ('rebuild')")
+                c.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+                c.commit()
+                return tok
+            except sqlite3.OperationalError:
+                c.rollback()
+        return None
+
+    # ---------------- ingestion ----------------
+    @staticmethod
+    def _rows(items: Iterable[Dict[str, Any]]) -> List[Tuple[Any, ...]]:
+        rows = []
+        for it in items:
+            text = it.get("text") or ""
+            tp = it.get("type") or None
+            value, fit, tol = normalize_value(text, tp)
+            box = [c for p in it["box"] for c in p]
+            cx, cy = it["center"]
+            rows.append((int(it.get("page") or 0), it.get("bubble_id"), tp, text, norm_text(text), value, fit, tol,
+                         float(it.get("conf", 1.0)), float(cx), float(cy), *[float(v) for v in box]))
+        return rows
+
+    def add(self, drawing: str, revision: str, items: Iterable[Dict[str, Any]], source: Optional[str] = None) -> int:
+        """缓冲一张图纸的条目（dict 列表或 ItemTable）；返回行数"""
+        rows = self._rows(items)
+        self._pending.append((drawing, norm_revision(revision), source, rows))
+        self._pending_rows += len(rows)
+        if self._pending_rows >= self.batch_rows:
+            self.flush()
+        return len(rows)
+
+    def add_json(self, json_path: str, drawing: Optional[str] = None, revision: Optional[str] = None) -> int:
+        """读入 {stem}_dims.json；图号 / 版本默认由文件名拆出（去掉 _dims 后缀）"""
+        stem = Path(json_path).stem
+        stem = stem[:-5] if stem.endswith("_dims") else stem
+        d, r = split_revision(stem)
+        with open(json_path, "r", encoding="utf-8") as f:
+            items = json.load(f)
+        return self.add(drawing or d, r if revision is None else revision, items, source=str(json_path))
+
+    def flush(self) -> None:
+        if not self._pending:
+            return
+        c = self.conn
+        now = time.time()
+        with c:  # 一个事务
+            for drawing, revision, source, rows in self._pending:
+                c.execute("INSERT INTO drawings (drawing, revision, source, items, indexed_at) VALUES (?, ?, ?, ?, ?) "
+                          "ON CONFLICT (drawing, revision) DO UPDATE SET source = excluded.source, "
+                          "items = excluded.items, indexed_at = excluded.indexed_at",
+                          (drawing, revision, source, len(rows), now))
+                did = c.execute("SELECT id FROM drawings WHERE drawing = ? AND revision = ?",
+                                (drawing, revision)).fetchone()[0]
+                c.execute("DELETE FROM dims WHERE drawing_id = ?", (did,))
+                c.executemany("INSERT INTO dims (drawing_id, page, bubble_id, type, text, norm, value, fit, tol, conf, "
+                              "cx, cy, x1, y1, x2, y2, x3, y3, x4, y4) "
+                              "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                              ((did,) + r for r in rows))
+        self._pending.clear()
+        self._pending_rows = 0
+
+    def close(self) -> None:
+        if self.conn is not None:
+            self.flush()
+            self.conn.close()
+            self.conn = None
+
+    def __enter__(self) -> "DimIndex":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    # ---------------- query ----------------
+    def query(self, text: Optional[str] = None, type: Optional[str] = None, value: Optional[float] = None,
+              tol: float = 1e-6, fit: Optional[str] = None, drawing: Optional[str] = None,
+              revision: Optional[str] = None, min_conf: Optional[float] = None,
+              limit: Optional[int] = 100, by_drawing: bool = False) -> List[Dict[str, Any]]:
+        """
+        条件之间为 AND。text 为子串检索（规范化后比较，'⌀12 H7' 与 'Φ12H7' 相同）；
+        value 按 [value - tol, value + tol] 比较；drawing 支持 SQL LIKE 通配符（%、_）。
+        by_drawing=True 时按图纸汇总：每张命中的图纸一行（drawing, revision, matches）
+        """
+        self.flush()
+        where: List[str] = []
+        args: List[Any] = []
+        if text:
+            q = norm_text(text)
+            if self.fts == "trigram" and len(q) >= 3:
+                where.append("d.id IN (SELECT rowid FROM dims_fts WHERE dims_fts MATCH ?)")
+                args.append('"' + q.replace('"', '""') + '"')
+            else:
+                where.append("d.norm LIKE ? ESCAPE '\\'")
+                args.append("%" + q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%")
+        if type:
+            where.append("d.type = ?"); args.append(type)
+        if value is not None:
+            where.append("d.value BETWEEN ? AND ?"); args += [value - tol, value + tol]
+        if fit:
+            where.append("d.fit = ?"); args.append(fit)
+        if drawing:
+            where.append("g.drawing LIKE ?"); args.append(drawing)
+        if revision is not None:
+            where.append("g.revision = ?"); args.append(norm_revision(revision))
+        if min_conf is not None:
+            where.append("d.conf >= ?"); args.append(min_conf)
+        if by_drawing:
+            sql = "SELECT g.drawing, g.revision, count(*) AS matches FROM dims d JOIN drawings g ON g.id = d.drawing_id"
+        else:
+            sql = ("SELECT g.drawing, g.revision, d.page, d.bubble_id, d.type, d.text, d.value, d.fit, d.tol, d.conf, "
+                   "d.cx, d.cy FROM dims d JOIN drawings g ON g.id = d.drawing_id")
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        if by_drawing:
+            sql += " GROUP BY g.id ORDER BY g.drawing, g.revision"
+        else:
+            sql += " ORDER BY g.drawing, g.revision, d.page, d.bubble_id"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        cur = self.conn.execute(sql, args)
+        cols = [c[0] for c in cur.description]
+        return [dict(zip(cols, r)) for r in cur.fetchall()]
+
+    def stats(self) -> Dict[str, Any]:
+        self.flush()
+        c = self.conn
+        return {"drawings": c.execute("SELECT count(*) FROM drawings").fetchone()[0],
+                "dims": c.execute("SELECT count(*) FROM dims").fetchone()[0], "fts": self.fts}
+
+def index_summary(index: DimIndex, summary: Dict[str, Any], revision: Optional[str] = None) -> int:
+    """把 process_document 的摘要（outputs['json']）汇入索引；返回行数"""
+    path = (summary.get("outputs") or {}).get("json")
+    if not path:
+        return 0
+    return index.add_json(path, revision=revision)
+
+# ---------------- CLI: query ----------------
+def cmd_query(args: argparse.Namespace) -> None:
+    if not args.add and not Path(args.db).exists():
+        raise SystemExit(f"[ERROR] index not found: {args.db}")
+    with DimIndex(args.db) as idx:
+        if args.add:
+            files = sorted(_glob.glob(args.add, recursive=True))
+            n = sum(idx.add_json(f, revision=args.set_revision) for f in files)
+            idx.flush()
+            print(f"[OK] indexed {n} dims from {len(files)} files -> {args.db}", file=sys.stderr)
+            if not (args.text or args.type or args.value is not None or args.fit or args.drawing or args.revision):
+                print(json.dumps(idx.stats()), file=sys.stderr)
+                return
+        rows = idx.query(text=args.text, type=args.type, value=args.value, tol=args.tol, fit=args.fit,
+                         drawing=args.drawing, revision=args.revision, min_conf=args.min_conf,
+                         limit=args.limit, by_drawing=args.drawings)
+    if args.format == "json":
+        json.dump(rows, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+        return
+    cols = list(rows[0].keys()) if rows else []
+    w = csv.writer(sys.stdout, delimiter="," if args.format == "csv" else "\t", lineterminator="\n")
+    if cols:
+        w.writerow(cols)
+    w.writerows([["" if r[c] is None else r[c] for c in cols] for r in rows])
+    print(f"[INFO] {len(rows)} rows", file=sys.stderr)
+
+def add_query_args(ap: argparse.ArgumentParser) -> None:
+    ap.add_argument("--db", required=True, help="SQLite index written by run/batch --index_db")
+    ap.add_argument("--text", default=None, help="Substring of the dimension text, e.g. '⌀12 H7' (Φ/Ø/⌀ and spaces ignored)")
+    ap.add_argument("--type", default=None, choices=["LEN", "DIA", "R", "ANG", "ROUGH", "THREAD"])
+    ap.add_argument("--value", type=float, default=None, help="Normalized numeric value (mm for LEN/DIA/R)")
+    ap.add_argument("--tol", type=float, default=1e-6, help="Match --value within +/- tol")
+    ap.add_argument("--fit", default=None, help="ISO fit / tolerance class, e.g. H7 or g6 (case-sensitive; only filled for back-filled JSON whose text keeps the fit)")
+    ap.add_argument("--drawing", default=None, help="Drawing id; SQL LIKE wildcards allowed (PN-12%%)")
+    ap.add_argument("--revision", default=None, help="Revision letter or number")
+    ap.add_argument("--min_conf", type=float, default=None)
+    ap.add_argument("--drawings", action="store_true", help="List matching drawings with match counts instead of dims")
+    ap.add_argument("--limit", type=int, default=100, help="Maximum rows printed (0 = no limit)")
+    ap.add_argument("--format", default="table", choices=["table", "csv", "json"])
+    ap.add_argument("--add", default=None, help="First index existing *_dims.json files matching this glob")
+    ap.add_argument("--set_revision", default=None, help="Revision for --add files (default: parsed from the file name)")
+
+__all__ = ["DimIndex", "index_summary", "normalize_value", "norm_text", "split_revision", "norm_revision", "cmd_query", "add_query_args"]
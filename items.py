@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+"""
+items.py — 列式条目表 ItemTable
+- 条目原本是 {"text","conf","box","center",...} 的 dict 列表，box 为 4 个 tuple；大批量时内存与反复转换开销都大
+- ItemTable 用 NumPy 数组按列存放：boxes (N,4,2) float64、centers (N,2) float64、conf (N,) float64、
+  type_code (N,) int16（-1 = 未分类）、bubble_id (N,) int32（-1 = 未编号）、page (N,) int32（0 = 无页码），
+  文本是一列 Python 字符串
+- 兼容旧代码：table[i] / 迭代得到 ItemView，是对某一行的 dict 视图（读写都落到列上），
+  clean_items / sort_reading_order / draw_bubbles / export_tabular 既接受 dict 列表也接受 ItemTable
+- to_items() 转回普通 dict 列表（JSON 导出、Gradio 状态）；from_items() 反之。
+  坐标按 float64 存放，读回的值与写入时相同；it["box"] 是一次 tolist()，绘制 / 布局反复读取也不贵
+"""
+from __future__ import annotations
+
+from collections.abc import MutableMapping
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# 类型编码：下标即 type_code；表内出现新类型名（如界面上手填）时追加到该表自己的 type_names
+TYPE_NAMES = ("", "LEN", "DIA", "R", "ANG", "ROUGH", "THREAD")
+
+def _quad(arr: np.ndarray) -> List[Tuple[float, float]]:
+    return [(x, y) for x, y in arr.tolist()]
+
+_COLUMN_KEYS = ("text", "conf", "box", "center", "type", "bubble_id", "page")
+
+class ItemTable:
+    __slots__ = ("boxes", "centers", "conf", "type_code", "bubble_id", "page", "text", "type_names", "extra")
+
+    def __init__(self, boxes: np.ndarray, centers: np.ndarray, conf: np.ndarray, text: List[str],
+                 type_code: Optional[np.ndarray] = None, bubble_id: Optional[np.ndarray] = None,
+                 page: Optional[np.ndarray] = None, type_names: Optional[Sequence[str]] = None,
+                 extra: Optional[Dict[int, Dict[str, Any]]] = None):
+        n = len(text)
+        self.boxes = np.asarray(boxes, dtype=np.float64).reshape(n, 4, 2)
+        self.centers = np.asarray(centers, dtype=np.float64).reshape(n, 2)
+        self.conf = np.asarray(conf, dtype=np.float64).reshape(n)
+        self.text = list(text)
+        self.type_code = np.full(n, -1, np.int16) if type_code is None else np.asarray(type_code, np.int16)
+        self.bubble_id = np.full(n, -1, np.int32) if bubble_id is None else np.asarray(bubble_id, np.int32)
+        self.page = np.zeros(n, np.int32) if page is None else np.asarray(page, np.int32)
+        self.type_names = list(type_names or TYPE_NAMES)
+        self.extra: Dict[int, Dict[str, Any]] = dict(extra or {})  # 行号 → 不在列中的其它键（稀疏）
+
+    # ---------------- construction ----------------
+    @classmethod
+    def empty(cls) -> "ItemTable":
+        return cls(np.zeros((0, 4, 2)), np.zeros((0, 2)), np.zeros(0), [])
+
+    @classmethod
+    def from_items(cls, items: Iterable[Dict[str, Any]]) -> "ItemTable":
+        if isinstance(items, ItemTable):
+            return items
+        items = list(items)
+        n = len(items)
+        if n == 0:
+            return cls.empty()
+        boxes = np.array([it["box"] for it in items], dtype=np.float64).reshape(n, 4, 2)
+        centers = np.array([it["center"] for it in items], dtype=np.float64).reshape(n, 2)
+        conf = np.fromiter((float(it.get("conf", 1.0)) for it in items), dtype=np.float64, count=n)
+        table = cls(boxes, centers, conf, [it.get("text") or "" for it in items])
+        names = {k: i for i, k in enumerate(table.type_names)}
+        for i, it in enumerate(items):
+            tp = it.get("type")
+            if tp is not None:
+                if tp not in names:
+                    names[tp] = len(table.type_names)
+                    table.type_names.append(tp)
+                table.type_code[i] = names[tp]
+            if it.get("bubble_id") is not None:
+                table.bubble_id[i] = int(it["bubble_id"])
+            if it.get("page") is not None:
+                table.page[i] = int(it["page"])
+            rest = {k: v for k, v in it.items() if k not in _COLUMN_KEYS}
+            if rest:
+                table.extra[i] = rest
+        return table
+
+    @classmethod
+    def concat(cls, tables: Sequence["ItemTable"]) -> "ItemTable":
+        tables = [t for t in tables if len(t)]
+        if not tables:
+            return cls.empty()
+        names: List[str] = list(tables[0].type_names)
+        codes = []
+        extra: Dict[int, Dict[str, Any]] = {}
+        base = 0
+        for t in tables:
+            for k in t.type_names:
+                if k not in names:
+                    names.append(k)
+            remap = np.array([names.index(k) for k in t.type_names], dtype=np.int16)
+            codes.append(np.where(t.type_code >= 0, remap[np.maximum(t.type_code, 0)], -1).astype(np.int16))
+            extra.update({base + i: v for i, v in t.extra.items()})
+            base += len(t)
+        return cls(np.concatenate([t.boxes for t in tables]), np.concatenate([t.centers for t in tables]),
+                   np.concatenate([t.conf for t in tables]), [s for t in tables for s in t.text],
+                   np.concatenate(codes), np.concatenate([t.bubble_id for t in tables]),
+                   np.concatenate([t.page for t in tables]), names, extra)
+
+    # ---------------- columns → rows ----------------
+    def __len__(self) -> int:
+        return len(self.text)
+
+    def __getitem__(self, i: int) -> "ItemView":
+        n = len(self.text)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError(i)
+        return ItemView(self, i)
+
+    def __iter__(self) -> Iterator["ItemView"]:
+        return (ItemView(self, i) for i in range(len(self.text)))
+
+    def take(self, idx: Sequence[int]) -> "ItemTable":
+        """按下标取子表（也用于重排）；数组是新拷贝，与原表互不影响"""
+        idx = np.asarray(idx, dtype=np.int64).reshape(-1)
+        pos = {int(old): new for new, old in enumerate(idx.tolist()) if int(old) in self.extra}
+        return ItemTable(self.boxes[idx], self.centers[idx], self.conf[idx], [self.text[i] for i in idx.tolist()],
+                         self.type_code[idx], self.bubble_id[idx], self.page[idx], self.type_names,
+                         {new: dict(self.extra[old]) for old, new in pos.items()})
+
+    def types(self) -> List[Optional[str]]:
+        names = self.type_names
+        return [names[c] if c >= 0 else None for c in self.type_code.tolist()]
+
+    def set_types(self, types: Sequence[Optional[str]]) -> None:
+        names = {k: i for i, k in enumerate(self.type_names)}
+        codes = np.full(len(types), -1, np.int16)
+        for i, tp in enumerate(types):
+            if tp is None:
+                continue
+            if tp not in names:
+                names[tp] = len(self.type_names)
+                self.type_names.append(tp)
+            codes[i] = names[tp]
+        self.type_code = codes
+
+    def item(self, i: int) -> Dict[str, Any]:
+        """第 i 行转为普通 dict（字段与 dict 列表中的条目相同）"""
+        it: Dict[str, Any] = {
+            "text": self.text[i], "conf": float(self.conf[i]),
+            "box": _quad(self.boxes[i]),
+            "center": (float(self.centers[i, 0]), float(self.centers[i, 1])),
+        }
+        if self.type_code[i] >= 0:
+            it["type"] = self.type_names[int(self.type_code[i])]
+        if self.bubble_id[i] >= 0:
+            it["bubble_id"] = int(self.bubble_id[i])
+        if self.page[i] > 0:
+            it["page"] = int(self.page[i])
+        if i in self.extra:
+            it.update(self.extra[i])
+        return it
+
+    def to_items(self) -> List[Dict[str, Any]]:
+        return [self.item(i) for i in range(len(self.text))]
+
+def as_table(items: Any) -> ItemTable:
+    return items if isinstance(items, ItemTable) else ItemTable.from_items(items)
+
+class ItemView(MutableMapping):
+    """ItemTable 中一行的 dict 视图；写入直接改表的列。未编号 / 未分类 / 无页码时对应键不存在"""
+    __slots__ = ("table", "index")
+
+    def __init__(self, table: ItemTable, index: int):
+        self.table = table
+        self.index = index
+
+    def _present(self, key: str) -> bool:
+        t, i = self.table, self.index
+        if key == "type":
+            return bool(t.type_code[i] >= 0)
+        if key == "bubble_id":
+            return bool(t.bubble_id[i] >= 0)
+        if key == "page":
+            return bool(t.page[i] > 0)
+        if key in ("text", "conf", "box", "center"):
+            return True
+        return key in t.extra.get(i, {})
+
+    def __getitem__(self, key: str) -> Any:
+        t, i = self.table, self.index
+        if not self._present(key):
+            raise KeyError(key)
+        if key == "text":
+            return t.text[i]
+        if key == "conf":
+            return float(t.conf[i])
+        if key == "box":
+            return _quad(t.boxes[i])
+        if key == "center":
+            return (float(t.centers[i, 0]), float(t.centers[i, 1]))
+        if key == "type":
+            return t.type_names[int(t.type_code[i])]
+        if key == "bubble_id":
+            return int(t.bubble_id[i])
+        if key == "page":
+            return int(t.page[i])
+        return t.extra[i][key]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        t, i = self.table, self.index
+        if key == "text":
+            t.text[i] = value
+        elif key == "conf":
+            t.conf[i] = float(value)
+        elif key == "box":
+            t.boxes[i] = np.asarray(value, dtype=np.float64).reshape(4, 2)
+        elif key == "center":
+            t.centers[i] = np.asarray(value, dtype=np.float64).reshape(2)
+        elif key == "type":
+            # None 即未分类（与 from_items / set_types 一致），不进 type_names
+            if value is None:
+                t.type_code[i] = -1
+                return
+            if value not in t.type_names:
+                t.type_names.append(value)
+            t.type_code[i] = t.type_names.index(value)
+        elif key == "bubble_id":
+            t.bubble_id[i] = int(value)
+        elif key == "page":
+            t.page[i] = int(value)
+        else:
+            t.extra.setdefault(i, {})[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        t, i = self.table, self.index
+        if not self._present(key):
+            raise KeyError(key)
+        if key == "type":
+            t.type_code[i] = -1
+        elif key == "bubble_id":
+            t.bubble_id[i] = -1
+        elif key == "page":
+            t.page[i] = 0
+        elif key in ("text", "conf", "box", "center"):
+            raise KeyError(f"column '{key}' cannot be removed")
+        else:
+            del t.extra[i][key]
+
+    def __iter__(self) -> Iterator[str]:
+        return (k for k in list(_COLUMN_KEYS) + list(self.table.extra.get(self.index, {})) if self._present(k))
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f"ItemView({dict(self)!r})"
+
+__all__ = ["ItemTable", "ItemView", "TYPE_NAMES", "as_table"]
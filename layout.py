@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+"""
+layout.py — 气泡位置求解（与绘制分离，Gradio / 导出 / CLI 共用）
+- 每个条目先按 anchor/offset/radius 得到锚点，再在锚点周围的候选位置中取第一个可用的
+- 已放置的气泡、所有文本框（及可选的引出线）登记在 spatial.GridIndex 中，每个候选的冲突检查是近常数时间，
+  整页放置时间随条目数近似线性
+- avoid_text=False 时只避让其他气泡，结果与原先逐个比较的贪心算法一致
+- method="global"：以贪心结果为起点，对全部条目的候选位置做局部搜索，
+  最小化 气泡重叠 + 引出线交叉 / 压气泡 + 引出线长度（+ 压文本框、出图幅），有时间预算，出错时退回贪心
+"""
+from __future__ import annotations
+
+import math
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .geometry import nearest_point_on_edges, point_segment_dist2, quad_bbox, segments_cross
+from .spatial import GridIndex
+
+Point = Tuple[float, float]
+Segment = Tuple[Point, Point]
+
+_ANGLES = tuple((math.cos(math.radians(a)), math.sin(math.radians(a))) for a in (0, 45, 90, 135, 180, 225, 270, 315))
+
+def item_target(it: Dict[str, Any], w: int, h: int) -> Point:
+    """气泡指向的点：文本框质心，没有框时用 center"""
+    box = it.get("box")
+    if not box or len(box) != 4:
+        cx, cy = it.get("center", (w * 0.5, h * 0.5))
+        return (cx, cy)
+    return (sum(p[0] for p in box) / 4.0, sum(p[1] for p in box) / 4.0)
+
+def resolve_anchor(target: Point, w: int, h: int, anchor: str = "tr") -> str:
+    """anchor='auto' 时按所在页面区域朝页面内侧放置"""
+    if anchor != "auto":
+        return anchor
+    bx, by = target
+    leftness = bx < w*0.33; rightness = bx > w*0.67
+    topness = by < h*0.33; bottomness = by > h*0.67
+    if leftness and topness:   return "br"
+    if leftness and bottomness: return "tr"
+    if rightness and topness: return "bl"
+    if rightness and bottomness: return "tl"
+    return "tr"
+
+def anchor_point(target: Point, w: int, h: int, radius: int = 16, anchor: str = "tr",
+                 offset: Tuple[int, int] = (8, -8)) -> Point:
+    sel_anchor = resolve_anchor(target, w, h, anchor)
+    ax = {"tl": -1, "tr": 1, "bl": -1, "br": 1}.get(sel_anchor, 1)
+    ay = {"tl": -1, "tr": -1, "bl": 1, "br": 1}.get(sel_anchor, -1)
+    return (target[0] + ax*(abs(offset[0]) + radius*1.2), target[1] + ay*(abs(offset[1]) + radius*1.2))
+
+def candidates(anchor_pt: Point, radius: int, rings: int = 3) -> List[Point]:
+    """锚点周围的候选位置：由近到远的同心环，每环 8 个方向；第一个即锚点本身"""
+    x, y = anchor_pt
+    out = []
+    for rtry in range(0, radius*rings, max(2, radius//3)):
+        for (ca, sa) in _ANGLES:
+            out.append((x + rtry*ca, y + rtry*sa))
+    return out
+
+def leader_end(center: Point, box: Optional[Sequence[Point]]) -> Optional[Point]:
+    if not box or len(box) != 4:
+        return None
+    return nearest_point_on_edges(center, list(box))
+
+def greedy_layout(
+    items: List[Dict[str, Any]],
+    w: int,
+    h: int,
+    radius: int = 16,
+    anchor: str = "tr",
+    offset: Tuple[int, int] = (8, -8),
+    avoid_overlap: bool = True,
+    avoid_text: bool = False
+) -> List[Point]:
+    """
+    按条目顺序逐个放置，返回每个气泡的圆心。
+    avoid_overlap：气泡圆心间距 > 2.2×radius；avoid_text：另外不压文本框、已有引出线，
+    自己的引出线也不穿过已有气泡。所有候选都不满足时依次退回“只避让气泡”、锚点本身。
+    """
+    radius = int(radius)
+    min_dist = radius * 2.2
+    bubbles = GridIndex(cell=max(16.0, min_dist))
+    obstacles: Optional[GridIndex] = None
+    if avoid_text:
+        obstacles = GridIndex(cell=max(32.0, radius * 4.0))
+        for it in items:
+            box = it.get("box")
+            if box and len(box) == 4:
+                obstacles.add_rect(quad_bbox(box))
+
+    out: List[Point] = []
+    for it in items:
+        target = item_target(it, w, h)
+        anc = anchor_point(target, w, h, radius, anchor, offset)
+        if not avoid_overlap:
+            out.append(anc)
+            continue
+        box = it.get("box")
+        cands = candidates(anc, radius, rings=5 if avoid_text else 3)
+        n_plain = len(cands) if obstacles is None else len(candidates(anc, radius, rings=3))
+        pos: Optional[Point] = None
+        fallback: Optional[Point] = None  # 第一个只避让气泡即可用的候选
+        for k, c in enumerate(cands):
+            if bubbles.circle_near(c, min_dist):
+                continue
+            if fallback is None and k < n_plain:
+                fallback = c
+            if obstacles is not None:
+                if obstacles.circle_blocked(c, radius):
+                    continue
+                end = leader_end(c, box)
+                if end is not None and bubbles.segment_hits_circle(c, end):
+                    continue
+            pos = c
+            break
+        if pos is None:
+            pos = fallback if fallback is not None else anc
+        bubbles.add_circle(pos, radius)
+        if obstacles is not None:
+            end = leader_end(pos, box)
+            if end is not None:
+                obstacles.add_segment(pos, end)
+        out.append(pos)
+    return out
+
+# ---------------- global layout ----------------
+# 代价权重：引出线长度与 anchor/offset 给定长度之差按 radius 归一、权重 1（更短会压到自己的文字，同样计代价）
+_W_OVERLAP = 100.0  # 两个气泡圆心距 <= 2.2×radius
+_W_COVER = 20.0     # 气泡压到别人的引出线
+_W_CROSS = 10.0     # 两条引出线交叉
+_W_TEXT = 20.0      # 气泡压文本框（avoid_text）
+_W_OUT = 50.0       # 气泡超出图幅
+
+def _global_candidates(target: Point, w: int, h: int, radius: int, anchor: str,
+                       offset: Tuple[int, int]) -> List[Point]:
+    """指定锚点优先，其余三个角作备选；每个锚点取自身及半径 radius、2×radius 两环各 8 个方向"""
+    first = resolve_anchor(target, w, h, anchor)
+    out: List[Point] = []
+    for a in [first] + [c for c in ("tr", "tl", "br", "bl") if c != first]:
+        x, y = anchor_point(target, w, h, radius, a, offset)
+        out.append((x, y))
+        for rr in (radius, radius * 2):
+            for (ca, sa) in _ANGLES:
+                out.append((x + rr*ca, y + rr*sa))
+    return out
+
+def global_layout(
+    items: List[Dict[str, Any]],
+    w: int,
+    h: int,
+    radius: int = 16,
+    anchor: str = "tr",
+    offset: Tuple[int, int] = (8, -8),
+    avoid_text: bool = False,
+    time_budget: float = 0.2,
+    start: Optional[List[Point]] = None
+) -> List[Point]:
+    """
+    所有条目一起求解：从 start（默认贪心结果）出发，按当前代价从高到低逐个条目在候选位置里选
+    使“自身代价 + 与邻居的成对代价”最小的位置，位置变化后把受影响的邻居重新排队；
+    每一步只接受严格下降，总代价不会高于起点。time_budget 秒用完即返回当前解。
+    """
+    deadline = time.perf_counter() + max(0.0, float(time_budget))
+    radius = int(radius)
+    if start is None:
+        start = greedy_layout(items, w, h, radius=radius, anchor=anchor, offset=offset, avoid_text=avoid_text)
+    n = len(items)
+    if n == 0:
+        return []
+    min_dist = radius * 2.2
+    r2 = float(radius * radius)
+    boxes = [it.get("box") if it.get("box") and len(it["box"]) == 4 else None for it in items]
+    text: Optional[GridIndex] = None
+    if avoid_text:
+        text = GridIndex(cell=max(32.0, radius * 4.0))
+        for box in boxes:
+            if box is not None:
+                text.add_rect(quad_bbox(box))
+
+    def leader(i: int, p: Point) -> Optional[Segment]:
+        end = leader_end(p, boxes[i])
+        return (p, end) if end is not None else None
+
+    def seg_len(s: Optional[Segment]) -> float:
+        return math.hypot(s[1][0] - s[0][0], s[1][1] - s[0][1]) if s is not None else 0.0
+
+    base = [seg_len(leader(i, anchor_point(item_target(it, w, h), w, h, radius, anchor, offset)))
+            for i, it in enumerate(items)]
+
+    def unary(i: int, p: Point, s: Optional[Segment]) -> float:
+        c = 0.0
+        if s is not None:
+            c += abs(seg_len(s) - base[i]) / radius
+        if p[0] - radius < 0 or p[1] - radius < 0 or p[0] + radius > w or p[1] + radius > h:
+            c += _W_OUT
+        if text is not None and text.circle_blocked(p, radius):
+            c += _W_TEXT
+        return c
+
+    pos: List[Point] = list(start)
+    seg: List[Optional[Segment]] = [leader(i, pos[i]) for i in range(n)]
+    grid = GridIndex(cell=max(32.0, radius * 4.0))
+    sids: List[Tuple[int, Optional[int]]] = []
+    for i in range(n):
+        b = grid.add_circle(pos[i], radius, owner=i)
+        s = seg[i]
+        sids.append((b, grid.add_segment(s[0], s[1], owner=i) if s is not None else None))
+
+    def window(p: Point, s: Optional[Segment]) -> Tuple[float, float, float, float]:
+        x1, y1, x2, y2 = p[0] - min_dist, p[1] - min_dist, p[0] + min_dist, p[1] + min_dist
+        if s is not None:
+            x1 = min(x1, s[1][0] - radius); y1 = min(y1, s[1][1] - radius)
+            x2 = max(x2, s[1][0] + radius); y2 = max(y2, s[1][1] + radius)
+        return (x1, y1, x2, y2)
+
+    def pair_cost(i: int, p: Point, s: Optional[Segment], limit: float) -> float:
+        c = 0.0
+        for j in grid.owners_in(*window(p, s)):
+            if j == i:
+                continue
+            q, t = pos[j], seg[j]
+            d = math.hypot(p[0] - q[0], p[1] - q[1])
+            if d <= min_dist:
+                c += _W_OVERLAP * (1.0 + (min_dist - d) / radius)
+            if t is not None and point_segment_dist2(p, t[0], t[1]) < r2:
+                c += _W_COVER
+            if s is not None and point_segment_dist2(q, s[0], s[1]) < r2:
+                c += _W_COVER
+            if s is not None and t is not None and segments_cross(s[0], s[1], t[0], t[1]):
+                c += _W_CROSS
+            if c >= limit:
+                break
+        return c
+
+    def move(i: int, p: Point, s: Optional[Segment]) -> None:
+        b, l = sids[i]
+        grid.remove(b)
+        if l is not None:
+            grid.remove(l)
+        pos[i], seg[i] = p, s
+        sids[i] = (grid.add_circle(p, radius, owner=i),
+                   grid.add_segment(s[0], s[1], owner=i) if s is not None else None)
+
+    cur = [unary(i, pos[i], seg[i]) + pair_cost(i, pos[i], seg[i], math.inf) for i in range(n)]
+    queue = deque(sorted(range(n), key=lambda k: -cur[k]))
+    queued = set(queue)
+    while queue and time.perf_counter() < deadline:
+        i = queue.popleft()
+        queued.discard(i)
+        best_c = unary(i, pos[i], seg[i]) + pair_cost(i, pos[i], seg[i], math.inf)
+        best: Optional[Tuple[Point, Optional[Segment]]] = None
+        scored = []
+        for p in _global_candidates(item_target(items[i], w, h), w, h, radius, anchor, offset):
+            s = leader(i, p)
+            scored.append((unary(i, p, s), p, s))
+        scored.sort(key=lambda z: z[0])
+        for u, p, s in scored:
+            if u >= best_c - 1e-9:
+                break  # 成对代价非负，后面的候选不可能更好
+            c = u + pair_cost(i, p, s, best_c - u)
+            if c < best_c - 1e-9:
+                best_c, best = c, (p, s)
+        if best is None:
+            continue
+        affected = grid.owners_in(*window(pos[i], seg[i])) | grid.owners_in(*window(*best))
+        move(i, *best)
+        for j in affected:
+            if j != i and j not in queued:
+                queue.append(j)
+                queued.add(j)
+    return pos
+
+def layout_bubbles(
+    items: List[Dict[str, Any]],
+    w: int,
+    h: int,
+    radius: int = 16,
+    anchor: str = "tr",
+    offset: Tuple[int, int] = (8, -8),
+    avoid_overlap: bool = True,
+    avoid_text: bool = False,
+    method: str = "greedy",
+    time_budget: float = 0.2
+) -> List[Point]:
+    """求解所有气泡的圆心（顺序同 items）。method: "greedy" 逐个放置 / "global" 整页优化（失败时退回贪心）"""
+    greedy = greedy_layout(items, w, h, radius=radius, anchor=anchor, offset=offset,
+                           avoid_overlap=avoid_overlap, avoid_text=avoid_text)
+    if method != "global" or not avoid_overlap:
+        return greedy
+    try:
+        return global_layout(items, w, h, radius=radius, anchor=anchor, offset=offset, avoid_text=avoid_text,
+                             time_budget=time_budget, start=greedy)
+    except Exception:
+        return greedy
+
+__all__ = ["layout_bubbles", "greedy_layout", "global_layout", "anchor_point", "item_target", "leader_end"]
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+metrics.py — 流水线分阶段计时 / 条目数 / 峰值内存
+用法：
+    m = Metrics("drawing.png")
+    with collecting(m):
+        with stage("clean", items=len(items)): ...
+    m.to_dict()  # 结构化 JSON
+- 当前 Metrics 存在 contextvar 里，没有激活时 stage() 几乎零开销
+- 线程池里的任务需用 bind(fn) 包一层，才能把记录写回提交方的 Metrics
+- profile_path 非空时，对所有计时阶段启用 cProfile，结束后写出 .prof
+"""
+from __future__ import annotations
+
+import contextvars
+import cProfile
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+_ACTIVE: "contextvars.ContextVar[Optional[Metrics]]" = contextvars.ContextVar("bubble_metrics", default=None)
+
+def peak_rss_mb() -> Optional[float]:
+    """进程迄今的峰值常驻内存（MB）；平台不支持时返回 None"""
+    try:
+        import resource
+        v = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux 单位 KB，macOS 单位 B
+        return round(v / (1024.0 * 1024.0) if sys.platform == "darwin" else v / 1024.0, 1)
+    except Exception:
+        pass
+    try:
+        import psutil  # Windows
+        mi = psutil.Process().memory_info()
+        return round(getattr(mi, "peak_wset", mi.rss) / (1024.0 * 1024.0), 1)
+    except Exception:
+        return None
+
+class StageRecord:
+    """stage() 产出的句柄：阶段内可补写条目数 rec.items = n"""
+    __slots__ = ("items",)
+
+    def __init__(self, items: Optional[int] = None):
+        self.items = items
+
+class Metrics:
+    def __init__(self, name: str = "", profile_path: Optional[str] = None):
+        self.name = name
+        self.stages: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+        self.profile_path = profile_path
+        self._profiler = cProfile.Profile() if profile_path else None
+        self._prof_depth = 0
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float, items: Optional[int] = None) -> None:
+        rss = peak_rss_mb()
+        with self._lock:
+            st = self.stages.setdefault(name, {"calls": 0, "seconds": 0.0, "items": None, "peak_rss_mb": None})
+            st["calls"] += 1
+            st["seconds"] += seconds
+            if items is not None:
+                st["items"] = (st["items"] or 0) + int(items)
+            if rss is not None:
+                st["peak_rss_mb"] = max(st["peak_rss_mb"] or 0.0, rss)
+
+    def add_share(self, d: Dict[str, Any], share: float) -> None:
+        """
+        把多文件共用的一段处理（to_dict() 结果，如组批 OCR）按份额记入本文件：
+        秒数与条目数乘以 share，总耗时同样计入，批处理汇总后与实际耗时一致
+        """
+        with self._lock:
+            for k, v in d.get("stages", {}).items():
+                st = self.stages.setdefault(k, {"calls": 0, "seconds": 0.0, "items": None, "peak_rss_mb": None})
+                st["calls"] += 1
+                st["seconds"] += float(v.get("seconds") or 0.0) * share
+                if v.get("items") is not None:
+                    st["items"] = (st["items"] or 0) + int(round(v["items"] * share))
+                if v.get("peak_rss_mb") is not None:
+                    st["peak_rss_mb"] = max(st["peak_rss_mb"] or 0.0, v["peak_rss_mb"])
+            self.started -= float(d.get("total_seconds") or 0.0) * share
+
+    def _prof_enter(self) -> None:
+        # cProfile 只跟踪启用它的线程：只在提交方线程里开关
+        if self._profiler is None or threading.current_thread() is not threading.main_thread():
+            return
+        if self._prof_depth == 0:
+            self._profiler.enable()
+        self._prof_depth += 1
+
+    def _prof_exit(self) -> None:
+        if self._profiler is None or threading.current_thread() is not threading.main_thread():
+            return
+        self._prof_depth -= 1
+        if self._prof_depth == 0:
+            self._profiler.disable()
+
+    def finish(self) -> None:
+        if self.finished is None:
+            self.finished = time.perf_counter()
+        if self._profiler is not None and self.profile_path:
+            self._profiler.dump_stats(self.profile_path)
+
+    def to_dict(self) -> Dict[str, Any]:
+        end = self.finished if self.finished is not None else time.perf_counter()
+        with self._lock:
+            stages = {k: dict(v, seconds=round(v["seconds"], 4)) for k, v in self.stages.items()}
+        return {"name": self.name, "total_seconds": round(end - self.started, 4),
+                "peak_rss_mb": peak_rss_mb(), "stages": stages}
+
+    def summary_lines(self) -> List[str]:
+        d = self.to_dict()
+        lines = [f"[METRICS] total {d['total_seconds']:.3f}s, peak RSS {d['peak_rss_mb']} MB"]
+        for k, v in d["stages"].items():
+            items = f", {v['items']} items" if v["items"] is not None else ""
+            lines.append(f"[METRICS]   {k:<16} {v['seconds']:8.3f}s x{v['calls']}{items}")
+        return lines
+
+def aggregate(dicts: List[Dict[str, Any]], name: str = "aggregate") -> Dict[str, Any]:
+    """合并多份 to_dict() 结果（批处理汇总）：秒数/次数/条目数求和，内存取最大"""
+    stages: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+    total = 0.0
+    peak: Optional[float] = None
+    for d in dicts:
+        if not d:
+            continue
+        total += float(d.get("total_seconds") or 0.0)
+        if d.get("peak_rss_mb") is not None:
+            peak = max(peak or 0.0, d["peak_rss_mb"])
+        for k, v in d.get("stages", {}).items():
+            st = stages.setdefault(k, {"calls": 0, "seconds": 0.0, "items": None, "peak_rss_mb": None})
+            st["calls"] += v.get("calls", 0)
+            st["seconds"] = round(st["seconds"] + float(v.get("seconds") or 0.0), 4)
+            if v.get("items") is not None:
+                st["items"] = (st["items"] or 0) + v["items"]
+            if v.get("peak_rss_mb") is not None:
+                st["peak_rss_mb"] = max(st["peak_rss_mb"] or 0.0, v["peak_rss_mb"])
+    return {"name": name, "files": len([d for d in dicts if d]), "total_seconds": round(total, 4),
+            "peak_rss_mb": peak, "stages": stages}
+
+def current() -> Optional[Metrics]:
+    return _ACTIVE.get()
+
+@contextmanager
+def collecting(m: Metrics) -> Iterator[Metrics]:
+    token = _ACTIVE.set(m)
+    try:
+        yield m
+    finally:
+        _ACTIVE.reset(token)
+        m.finish()
+
+@contextmanager
+def stage(name: str, items: Optional[int] = None) -> Iterator[StageRecord]:
+    rec = StageRecord(items)
+    m = _ACTIVE.get()
+    if m is None:
+        yield rec
+        return
+    m._prof_enter()
+    t0 = time.perf_counter()
+    try:
+        yield rec
+    finally:
+        dt = time.perf_counter() - t0
+        m._prof_exit()
+        m.record(name, dt, rec.items)
+
+def bind(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """把当前 contextvar（含激活的 Metrics）带进线程池任务；每次调用用独立副本，可并发"""
+    ctx = contextvars.copy_context()
+
+    def _run(*args, **kwargs):
+        return ctx.copy().run(fn, *args, **kwargs)
+    return _run
+
+__all__ = ["Metrics", "collecting", "stage", "bind", "current", "aggregate", "peak_rss_mb"]
@@ -1,6 +1,10 @@
 # -*- coding: utf-8 -*-
 """
 ocr.py — PaddleOCR v2/v3 统一封装（修复 numpy 数组的布尔判断歧义）
+- run_ocr / ocr_prefill_at 通过 backends.checkout_backend 借用已加载的后端，默认 "paddle"
+- run_ocr_batch：多张图（页面/分块）按尺寸分组、pad 到组内统一尺寸，每组只调用一次 predict
+- recognize_regions：已知文本框（四边形 / 矩形）时跳过检测，裁出文本行小图整批只做识别（+ 可选方向分类）；
+  点击预填、重读编辑过的框走这条路径，CPU 上几十毫秒
 - 关闭文档预处理（不改几何）
 - v3: 预测前“最长边=960 + pad到32倍数”，预测后按比例反映射回原图
 - v2: 直接 .ocr() + angle_cls
@@ -14,12 +18,17 @@ ocr.py — PaddleOCR v2/v3 统一封装（修复 numpy 数组的布尔判断歧
 from __future__ import annotations
 
 import inspect
+from functools import lru_cache
 from math import ceil
-from typing import Any, Dict, List, Tuple, Optional
+from typing import Any, Dict, List, Sequence, Tuple, Optional
 
 import numpy as np
 from PIL import Image
 
+from .metrics import stage
+from .backends import (OCRBackend, register_backend, checkout_backend, warmup_backend,
+                       configure_engine_pool, reserve_engine_pool, clear_engine_pool)
+
 try:
     import cv2
 except Exception:
@@ -81,6 +90,129 @@ def _det_resize_v3(
 
     return resized, rw, rh
 
+def group_by_shape(
+    shapes: Sequence[Tuple[int, int]],
+    batch_size: int = 4,
+    max_waste: float = 0.25
+) -> List[List[int]]:
+    """
+    把 (h, w) 相近的图分到同一批：按尺寸降序贪心装批，
+    pad 到组内最大 h/w 后浪费的面积比例不超过 max_waste；返回每批的下标列表
+    """
+    batch_size = max(1, int(batch_size))
+    order = sorted(range(len(shapes)), key=lambda i: (shapes[i][0], shapes[i][1]), reverse=True)
+    groups: List[List[int]] = []
+    cur: List[int] = []
+    gh = gw = 0
+    area = 0
+    for i in order:
+        h, w = shapes[i]
+        if cur and len(cur) < batch_size:
+            nh, nw = max(gh, h), max(gw, w)
+            if 1.0 - (area + h * w) / float(nh * nw * (len(cur) + 1)) <= max_waste:
+                cur.append(i)
+                gh, gw, area = nh, nw, area + h * w
+                continue
+        if cur:
+            groups.append(cur)
+        cur, gh, gw, area = [i], h, w, h * w
+    if cur:
+        groups.append(cur)
+    return groups
+
+def _pad_to(arr: np.ndarray, h: int, w: int) -> np.ndarray:
+    """右/下补零到 (h, w)；内容仍左上对齐，坐标无需偏移"""
+    if arr.shape[0] == h and arr.shape[1] == w:
+        return arr
+    canvas = np.zeros((h, w, arr.shape[2]), dtype=arr.dtype)
+    canvas[:arr.shape[0], :arr.shape[1]] = arr
+    return canvas
+
+# -------- text-line crops (recognition only) --------
+def _as_quad(region: Sequence[Any]) -> Quad:
+    """四边形原样返回；(x1, y1, x2, y2) 矩形转为顺时针四边形"""
+    if len(region) == 4 and not isinstance(region[0], (list, tuple, np.ndarray)):
+        x1, y1, x2, y2 = [float(v) for v in region]
+        return [(x1, y1), (x2, y1), (x2, y2), (x1, y2)]
+    return [(float(p[0]), float(p[1])) for p in region[:4]]
+
+def crop_quad(arr_rgb: np.ndarray, region: Sequence[Any], pad: float = 2.0) -> np.ndarray:
+    """
+    按文本框取识别用的小图：四边向外扩 pad 像素后透视拉正（无 cv2 时取外接矩形）；
+    高 ≥ 1.5×宽 的竖排框转 90°，与 PaddleOCR 的 get_rotate_crop_image 一致
+    """
+    q = np.array(_as_quad(region), dtype=np.float32)
+    u = q[1] - q[0]; v = q[3] - q[0]
+    u = u / max(1e-6, float(np.hypot(*u))); v = v / max(1e-6, float(np.hypot(*v)))
+    q = q + pad * np.stack([-u - v, u - v, u + v, v - u]).astype(np.float32)
+    w = int(round(max(np.hypot(*(q[1] - q[0])), np.hypot(*(q[2] - q[3])))))
+    h = int(round(max(np.hypot(*(q[3] - q[0])), np.hypot(*(q[2] - q[1])))))
+    H, W = arr_rgb.shape[:2]
+    if cv2 is not None and w > 0 and h > 0:
+        dst = np.array([[0, 0], [w, 0], [w, h], [0, h]], dtype=np.float32)
+        crop = cv2.warpPerspective(arr_rgb, cv2.getPerspectiveTransform(q, dst), (w, h),
+                                   flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_REPLICATE)
+    else:
+        x1 = max(0, int(np.floor(q[:, 0].min()))); y1 = max(0, int(np.floor(q[:, 1].min())))
+        x2 = min(W, int(np.ceil(q[:, 0].max()))); y2 = min(H, int(np.ceil(q[:, 1].max())))
+        crop = np.ascontiguousarray(arr_rgb[y1:max(y1 + 1, y2), x1:max(x1 + 1, x2)])
+    if crop.shape[0] >= 1.5 * crop.shape[1]:
+        crop = np.ascontiguousarray(np.rot90(crop))
+    return crop
+
+def _upscale_to(crop: np.ndarray, min_height: int, max_upscale: float = 4.0) -> np.ndarray:
+    h, w = crop.shape[:2]
+    if h <= 0 or h >= min_height:
+        return crop
+    r = min(float(max_upscale), float(min_height) / float(h))
+    size = (max(1, int(round(w * r))), max(1, int(round(h * r))))
+    return np.asarray(Image.fromarray(crop).resize(size, Image.BICUBIC))
+
+def _runs(mask: np.ndarray, gap: int) -> List[Tuple[int, int]]:
+    """一维布尔序列中间隔不超过 gap 的 True 段 → [(起, 止)]（止为开区间）"""
+    idx = np.flatnonzero(mask)
+    if idx.size == 0:
+        return []
+    cut = np.flatnonzero(np.diff(idx) > gap + 1)
+    starts = np.concatenate(([idx[0]], idx[cut + 1]))
+    ends = np.concatenate((idx[cut], [idx[-1]])) + 1
+    return list(zip(starts.tolist(), ends.tolist()))
+
+def _nearest_run(runs: List[Tuple[int, int]], p: int) -> Tuple[int, int]:
+    return min(runs, key=lambda r: 0 if r[0] <= p < r[1] else min(abs(r[0] - p), abs(r[1] - 1 - p)))
+
+def ink_line_box(
+    img: Image.Image,
+    x: float, y: float,
+    patch: int = 64,
+    ink_thr: int = 128,
+    line_frac: float = 0.6
+) -> Optional[Tuple[int, int, int, int]]:
+    """
+    点击处所在文本行的外接矩形（原图坐标），只在点击点周围 ±patch 内找；找不到墨迹时返回 None。
+    先去掉贯穿小块的长线（尺寸线 / 边框：一行或一列墨迹占比 ≥ line_frac），
+    再取离点击点最近的墨迹行段，并在该段内按字符间距合并出最近的列段。
+    """
+    W, H = img.size
+    x1 = max(0, int(x - patch)); y1 = max(0, int(y - patch))
+    x2 = min(W, int(x + patch)); y2 = min(H, int(y + patch))
+    if x2 - x1 < 2 or y2 - y1 < 2:
+        return None
+    ink = np.asarray(img.crop((x1, y1, x2, y2)).convert("L")) < ink_thr
+    ink[ink.mean(axis=1) >= line_frac, :] = False
+    ink[:, ink.mean(axis=0) >= line_frac] = False
+    px, py = int(x) - x1, int(y) - y1
+    rows = _runs(ink.any(axis=1), gap=1)
+    if not rows:
+        return None
+    r0, r1 = _nearest_run(rows, py)
+    # 字符间距约为行高的一半以内；更远的墨迹属于相邻文本
+    cols = _runs(ink[r0:r1].any(axis=0), gap=max(3, int((r1 - r0) * 0.6)))
+    if not cols:
+        return None
+    c0, c1 = _nearest_run(cols, px)
+    return (x1 + c0, y1 + r0, x1 + c1, y1 + r1)
+
 # -------- PaddleOCR init (v2/v3) --------
 def _create_paddle_ocr(
     lang: str = "en",
@@ -111,6 +243,17 @@ def _create_paddle_ocr(
         return PaddleOCR(**kwargs), "v2"
     raise ValueError("Unsupported PaddleOCR version")
 
+@lru_cache(maxsize=1)
+def paddle_mode() -> str:
+    """已安装的 PaddleOCR 为 v2 还是 v3：只看构造签名判断，不加载模型（缓存 key 等用）"""
+    from paddleocr import PaddleOCR
+    params = inspect.signature(PaddleOCR).parameters
+    if "use_textline_orientation" in params:
+        return "v3"
+    if "use_angle_cls" in params:
+        return "v2"
+    raise ValueError("Unsupported PaddleOCR version")
+
 # -------- parsers --------
 def _parse_v2_ocr(res: Any) -> List[Dict[str, Any]]:
     out: List[Dict[str, Any]] = []
@@ -135,6 +278,39 @@ def _parse_v2_ocr(res: Any) -> List[Dict[str, Any]]:
         pass
     return out
 
+def _parse_v2_rec(res: Any) -> Tuple[str, float]:
+    """v2 .ocr(det=False) 的结果 [[(text, score)]] → (text, score)"""
+    while isinstance(res, list) and len(res) == 1 and isinstance(res[0], list):
+        res = res[0]
+    try:
+        txt, conf = res[0]
+        return str(txt), float(conf)
+    except Exception:
+        return "", 0.0
+
+def _find_pipeline_attr(ocr: Any, name: str, depth: int = 3):
+    """在 PaddleOCR v3 对象及其内部管线包装（paddlex_pipeline / _pipeline …）里找子模型属性"""
+    seen = set()
+    frontier = [ocr]
+    for _ in range(depth):
+        nxt = []
+        for o in frontier:
+            if o is None or id(o) in seen:
+                continue
+            seen.add(id(o))
+            v = getattr(o, name, None)
+            if v is not None:
+                return v
+            nxt += [getattr(o, a, None) for a in ("paddlex_pipeline", "_pipeline", "pipeline")]
+        frontier = nxt
+    return None
+
+def _run_module(mod: Any, bgr: List[np.ndarray], batch_size: int) -> List[Any]:
+    """管线内的 PaddleX 预测器可直接调用（生成器）；paddleocr 的独立模块包装走 .predict"""
+    if callable(mod):
+        return list(mod(bgr, batch_size=batch_size))
+    return list(mod.predict(input=bgr, batch_size=batch_size))
+
 def _as_attr_or_key(obj, name):
     """优先取属性，取不到再取 dict[key]；避免直接做布尔判断"""
     v = getattr(obj, name, None)
@@ -167,6 +343,147 @@ def _parse_v3_predict(pred: Any) -> List[Dict[str, Any]]:
             out.append({"text": txt, "conf": conf, "box": quad, "center": (cx, cy)})
     return out
 
+# -------- PaddleOCR backends --------
+class PaddleBackend(OCRBackend):
+    """PaddleOCR（自动识别 v2/v3）。v3: 最长边=limit_side_len + pad 到 stride 倍数后预测，再按比例反映射；v2: .ocr() + angle_cls"""
+    version: Optional[str] = None
+
+    def load(self) -> None:
+        self.ocr, self.mode = _create_paddle_ocr(
+            lang=self.lang, det_model_dir=self.det_model_dir, rec_model_dir=self.rec_model_dir
+        )
+        if self.version and self.mode != self.version:
+            raise ValueError(f"installed PaddleOCR is {self.mode}, backend '{self.name}' requires {self.version}")
+
+    def predict(self, images: Sequence[np.ndarray], limit_side_len: int = 960, pad_stride: int = 32,
+                allow_upscale: bool = False, batch_size: int = 1) -> List[List[Dict[str, Any]]]:
+        if self.mode == "v3":
+            return self._predict_v3(images, limit_side_len, pad_stride, allow_upscale, batch_size)
+        # v2 的 .ocr() 只接受单张图，逐张识别
+        out: List[List[Dict[str, Any]]] = []
+        for arr_rgb in images:
+            with stage("ocr.predict"):
+                res = self.ocr.ocr(arr_rgb, cls=True)
+            with stage("ocr.parse") as rec:
+                items = _parse_v2_ocr(res)
+                rec.items = len(items)
+            out.append(items)
+        return out
+
+    def _predict_v3(self, images: Sequence[np.ndarray], limit_side_len: int, pad_stride: int,
+                    allow_upscale: bool, batch_size: int) -> List[List[Dict[str, Any]]]:
+        with stage("ocr.resize", items=len(images)):
+            prepared = [_det_resize_v3(arr, limit_side_len=limit_side_len, pad_stride=pad_stride,
+                                       allow_upscale=allow_upscale) for arr in images]
+        out: List[List[Dict[str, Any]]] = [[] for _ in images]
+        for group in group_by_shape([p[0].shape[:2] for p in prepared], batch_size):
+            gh = max(prepared[i][0].shape[0] for i in group)
+            gw = max(prepared[i][0].shape[1] for i in group)
+            batch = [_pad_to(prepared[i][0], gh, gw) for i in group]
+            with stage("ocr.predict", items=len(group)):
+                pred = self.ocr.predict(input=batch if len(batch) > 1 else batch[0])
+            preds = pred if isinstance(pred, list) else [pred]
+            if len(preds) != len(group):
+                raise RuntimeError(f"PaddleOCR returned {len(preds)} results for a batch of {len(group)}")
+            with stage("ocr.parse") as rec:
+                for i, p in zip(group, preds):
+                    _, rw, rh = prepared[i]
+                    items: List[Dict[str, Any]] = []
+                    for it in _parse_v3_predict(p):
+                        # 反映射回原图（pad 左上对齐，无偏移）
+                        mapped: Quad = [(x / rw, y / rh) for (x, y) in it["box"]]
+                        items.append({"text": it["text"], "conf": it["conf"], "box": mapped,
+                                      "center": _quad_center(mapped)})
+                    out[i] = items
+                rec.items = sum(len(out[i]) for i in group)
+        return out
+
+    # ---- recognition only ----
+    def recognize(self, crops: Sequence[np.ndarray], batch_size: int = 8,
+                  cls: bool = False) -> List[Tuple[str, float]]:
+        """文本行小图（RGB）整批识别；v3 用识别子模型，v2 用 text_recognizer，都取不到时退化为基类的检测+识别"""
+        crops = list(crops)
+        if not crops:
+            return []
+        bgr = [np.ascontiguousarray(c[:, :, ::-1]) for c in crops]
+        if self.mode == "v3":
+            rec = self._v3_module("rec")
+            if rec is None:
+                return super().recognize(crops, batch_size=batch_size, cls=cls)
+            if cls:
+                bgr = self._orient_v3(bgr, batch_size)
+            with stage("ocr.recognize", items=len(bgr)):
+                preds = _run_module(rec, bgr, batch_size)
+            return [(str(_as_attr_or_key(p, "rec_text") or ""), float(_as_attr_or_key(p, "rec_score") or 0.0))
+                    for p in preds]
+        recognizer = getattr(self.ocr, "text_recognizer", None)
+        with stage("ocr.recognize", items=len(bgr)):
+            if recognizer is None:
+                return [_parse_v2_rec(self.ocr.ocr(c, det=False, cls=cls)) for c in bgr]
+            classifier = getattr(self.ocr, "text_classifier", None)
+            if cls and classifier is not None:
+                bgr, _, _ = classifier(bgr)
+            res, _ = recognizer(bgr)
+        return [(str(r[0]), float(r[1])) for r in res]
+
+    def _v3_module(self, which: str):
+        """
+        v3 的识别 / 文本行方向子模型：优先复用已加载管线里的同一份权重（结果与整图识别一致，不重复加载），
+        取不到时按需构造独立的 TextRecognition / TextLineOrientationClassification（只构造一次）
+        """
+        cache = self.__dict__.setdefault("_v3_modules", {})
+        if which in cache:
+            return cache[which]
+        attr = "text_rec_model" if which == "rec" else "textline_orientation_model"
+        mod = _find_pipeline_attr(self.ocr, attr)
+        if mod is None:
+            try:
+                import paddleocr
+                if which == "rec":
+                    kwargs = {"model_dir": self.rec_model_dir} if self.rec_model_dir else {}
+                    # 默认识别模型为中英文，其它语种没有指定模型目录时不冒险替换
+                    if kwargs or self.lang in ("en", "ch"):
+                        mod = paddleocr.TextRecognition(**kwargs)
+                else:
+                    mod = paddleocr.TextLineOrientationClassification()
+            except Exception:
+                mod = None
+        cache[which] = mod
+        return mod
+
+    def _orient_v3(self, bgr: List[np.ndarray], batch_size: int) -> List[np.ndarray]:
+        clf = self._v3_module("cls")
+        if clf is None:
+            return bgr
+        with stage("ocr.cls", items=len(bgr)):
+            preds = _run_module(clf, bgr, batch_size)
+        out = []
+        for a, p in zip(bgr, preds):
+            ids = _as_attr_or_key(p, "class_ids")
+            flipped = not _is_empty(ids) and int(ids[0]) == 1  # 1 = 180°
+            out.append(np.ascontiguousarray(a[::-1, ::-1]) if flipped else a)
+        return out
+
+register_backend("paddle")(PaddleBackend)
+
+@register_backend("paddle-v2")
+class PaddleV2Backend(PaddleBackend):
+    version = "v2"
+
+@register_backend("paddle-v3")
+class PaddleV3Backend(PaddleBackend):
+    version = "v3"
+
+def warmup_ocr(
+    lang: str = "en",
+    det_model_dir: Optional[str] = None,
+    rec_model_dir: Optional[str] = None,
+    backend: str = "paddle",
+    backend_options: Optional[Dict[str, Any]] = None
+) -> str:
+    """启动时预加载模型并跑一次空白小图，首个真实请求不再付初始化开销"""
+    return warmup_backend(backend, lang, det_model_dir, rec_model_dir, backend_options)
+
 # -------- main entry --------
 def run_ocr(
     img: Image.Image,
@@ -177,38 +494,124 @@ def run_ocr(
     pad_stride: int = 32,
     allow_upscale: bool = False,
     det_model_dir: Optional[str] = None,
-    rec_model_dir: Optional[str] = None
+    rec_model_dir: Optional[str] = None,
+    backend: str = "paddle",
+    backend_options: Optional[Dict[str, Any]] = None
 ) -> Tuple[List[Dict[str, Any]], str]:
-    ocr, mode = _create_paddle_ocr(
-        lang=lang, det=det, rec=rec,
-        det_model_dir=det_model_dir, rec_model_dir=rec_model_dir
-    )
-
     arr_rgb = np.array(img.convert("RGB"))
 
-    if mode == "v3":
-        det_in_bgr, rw, rh = _det_resize_v3(
-            arr_rgb, limit_side_len=limit_side_len,
-            pad_stride=pad_stride, allow_upscale=allow_upscale
-        )
-        pred = ocr.predict(input=det_in_bgr)
-        parsed = _parse_v3_predict(pred)
-
-        items: List[Dict[str, Any]] = []
-        for it in parsed:
-            box = it["box"]
-            # 反映射回原图（pad 左上对齐，无偏移）
-            mapped: Quad = [(x / rw, y / rh) for (x, y) in box]
-            cx, cy = _quad_center(mapped)
-            items.append({"text": it["text"], "conf": it["conf"], "box": mapped, "center": (cx, cy)})
-        return items, "v3"
-
-    # v2
-    res = ocr.ocr(arr_rgb, cls=True)
-    items = _parse_v2_ocr(res)
-    return items, "v2"
+    with checkout_backend(backend, lang, det_model_dir, rec_model_dir, backend_options) as be:
+        items = be.predict([arr_rgb], limit_side_len=limit_side_len,
+                           pad_stride=pad_stride, allow_upscale=allow_upscale)[0]
+        return items, be.mode
+
+def run_ocr_batch(
+    images: Sequence[Any],
+    lang: str = "en",
+    batch_size: int = 4,
+    limit_side_len: int = 960,
+    pad_stride: int = 32,
+    allow_upscale: bool = False,
+    det_model_dir: Optional[str] = None,
+    rec_model_dir: Optional[str] = None,
+    backend: str = "paddle",
+    backend_options: Optional[Dict[str, Any]] = None
+) -> Tuple[List[List[Dict[str, Any]]], str]:
+    """
+    批量识别多张图（PIL.Image 或 RGB ndarray）：尺寸相近的图 pad 成一批，每批调用一次 predict。
+    返回 (每张图的条目列表, mode)，顺序与输入一致，坐标为各自原图坐标。
+    """
+    arrs = [np.asarray(im.convert("RGB")) if isinstance(im, Image.Image) else im for im in images]
+    if not arrs:
+        return [], ""
+    with checkout_backend(backend, lang, det_model_dir, rec_model_dir, backend_options) as be:
+        results = be.predict(arrs, limit_side_len=limit_side_len, pad_stride=pad_stride,
+                             allow_upscale=allow_upscale, batch_size=batch_size)
+        return results, be.mode
+
+# -------- recognition only (known boxes) --------
+def recognize_regions(
+    img: Any,
+    regions: Sequence[Sequence[Any]],
+    lang: str = "en",
+    pad: float = 2.0,
+    cls: bool = False,
+    batch_size: int = 8,
+    min_height: int = 0,
+    max_upscale: float = 4.0,
+    det_model_dir: Optional[str] = None,
+    rec_model_dir: Optional[str] = None,
+    backend: str = "paddle",
+    backend_options: Optional[Dict[str, Any]] = None
+) -> List[Tuple[str, float]]:
+    """
+    跳过检测，只识别给定区域（四边形 [(x,y)×4] 或矩形 (x1,y1,x2,y2)，原图坐标）。
+    img 为 PIL.Image 或 RGB ndarray；一次借出后端、整批识别，返回与 regions 等长的 [(text, conf)]。
+    min_height > 0 时矮于该高度的小图按比例放大（最多 max_upscale 倍），给识别模型更多像素。
+    """
+    if not regions:
+        return []
+    arr = np.asarray(img.convert("RGB")) if isinstance(img, Image.Image) else img
+    with stage("ocr.crop", items=len(regions)):
+        crops = [crop_quad(arr, r, pad=pad) for r in regions]
+        if min_height > 0:
+            crops = [_upscale_to(c, min_height, max_upscale) for c in crops]
+    with checkout_backend(backend, lang, det_model_dir, rec_model_dir, backend_options) as be:
+        return be.recognize(crops, batch_size=batch_size, cls=cls)
 
 # -------- small patch OCR (prefill) --------
+def _prefill_detect(
+    img: Image.Image, x: float, y: float, lang: str, patch: int, limit_side_len: int, pad_stride: int,
+    det_model_dir: Optional[str], rec_model_dir: Optional[str], backend: str,
+    backend_options: Optional[Dict[str, Any]]
+) -> Optional[Dict[str, Any]]:
+    """慢路径：对点击处小块做完整检测+识别，取置信度最高的非 "0" 文本（坐标映射回原图）"""
+    W, H = img.size
+    x1 = max(0, int(x - patch)); y1 = max(0, int(y - patch))
+    x2 = min(W, int(x + patch)); y2 = min(H, int(y + patch))
+    arr_rgb = np.array(img.crop((x1, y1, x2, y2)).convert("RGB"))
+
+    with checkout_backend(backend, lang, det_model_dir, rec_model_dir, backend_options) as be:
+        parsed = be.predict([arr_rgb], limit_side_len=limit_side_len, pad_stride=pad_stride)[0]
+
+    candidates = [it for it in parsed if (it.get("text") or "").strip() not in ("", "0")]
+    if not candidates:
+        return None
+    best = max(candidates, key=lambda it: float(it.get("conf") or 0.0))
+    box: Quad = [(px + x1, py + y1) for (px, py) in best["box"]]
+    return {"text": best["text"].strip(), "conf": float(best.get("conf") or 0.0), "box": box,
+            "center": _quad_center(box)}
+
+def ocr_prefill_item_at(
+    img: Image.Image,
+    x: float, y: float,
+    lang: str = "en",
+    patch: int = 64,
+    limit_side_len: int = 960,
+    pad_stride: int = 32,
+    det_model_dir: Optional[str] = None,
+    rec_model_dir: Optional[str] = None,
+    backend: str = "paddle",
+    backend_options: Optional[Dict[str, Any]] = None,
+    min_conf: float = 0.5
+) -> Optional[Dict[str, Any]]:
+    """
+    点击处的文本条目 {"text","conf","box","center"}（原图坐标），没有文本时返回 None。
+    快路径：ink_line_box 找出点击处文本行 → 只识别这一行；
+    找不到墨迹、或识别为空 / "0" / 置信度低于 min_conf 时，退回对小块做完整检测+识别。
+    """
+    bb = ink_line_box(img, x, y, patch=patch)
+    if bb is not None:
+        (txt, conf), = recognize_regions(img, [bb], lang=lang, det_model_dir=det_model_dir,
+                                         rec_model_dir=rec_model_dir, backend=backend,
+                                         backend_options=backend_options)
+        txt = (txt or "").strip()
+        if txt and txt != "0" and conf >= min_conf:
+            box = _as_quad(bb)
+            return {"text": txt, "conf": float(conf), "box": box, "center": _quad_center(box)}
+    return _prefill_detect(img, x, y, lang, patch, limit_side_len, pad_stride,
+                           det_model_dir, rec_model_dir, backend, backend_options)
+
 def ocr_prefill_at(
     img: Image.Image,
     x: float, y: float,
@@ -217,41 +620,15 @@ def ocr_prefill_at(
     limit_side_len: int = 960,
     pad_stride: int = 32,
     det_model_dir: Optional[str] = None,
-    rec_model_dir: Optional[str] = None
+    rec_model_dir: Optional[str] = None,
+    backend: str = "paddle",
+    backend_options: Optional[Dict[str, Any]] = None
 ) -> str:
-    ocr, mode = _create_paddle_ocr(
-        lang=lang, det=True, rec=True,
-        det_model_dir=det_model_dir, rec_model_dir=rec_model_dir
-    )
-    W, H = img.size
-    x1 = max(0, int(x - patch)); y1 = max(0, int(y - patch))
-    x2 = min(W, int(x + patch)); y2 = min(H, int(y + patch))
-    crop = img.crop((x1, y1, x2, y2)).convert("RGB")
-    arr_rgb = np.array(crop)
-
-    candidates: List[Tuple[str, float]] = []
-
-    if mode == "v3":
-        det_in_bgr, _, _ = _det_resize_v3(arr_rgb, limit_side_len=limit_side_len, pad_stride=pad_stride)
-        pred = ocr.predict(input=det_in_bgr)
-        parsed = _parse_v3_predict(pred)
-        for it in parsed:
-            t = (it.get("text") or "").strip()
-            s = float(it.get("conf") or 0.0)
-            if t and t != "0":
-                candidates.append((t, s))
-    else:
-        res = ocr.ocr(arr_rgb, cls=True)
-        parsed = _parse_v2_ocr(res)
-        for it in parsed:
-            t = (it.get("text") or "").strip()
-            s = float(it.get("conf") or 0.0)
-            if t and t != "0":
-                candidates.append((t, s))
-
-    if not candidates:
-        return ""
-    candidates.sort(key=lambda z: z[1], reverse=True)
-    return candidates[0][0]
+    it = ocr_prefill_item_at(img, x, y, lang=lang, patch=patch, limit_side_len=limit_side_len,
+                             pad_stride=pad_stride, det_model_dir=det_model_dir, rec_model_dir=rec_model_dir,
+                             backend=backend, backend_options=backend_options)
+    return it["text"] if it is not None else ""
 
-__all__ = ["run_ocr", "ocr_prefill_at"]
+__all__ = ["run_ocr", "run_ocr_batch", "group_by_shape", "recognize_regions", "crop_quad", "ink_line_box",
+           "ocr_prefill_at", "ocr_prefill_item_at", "warmup_ocr", "paddle_mode", "configure_engine_pool",
+           "reserve_engine_pool", "clear_engine_pool", "PaddleBackend", "PaddleV2Backend", "PaddleV3Backend"]
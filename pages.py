@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+pages.py — 多页 PDF / 多帧 TIFF 按页惰性解码
+- page_count 只读目录结构，不解码像素
+- decode_page 每次只打开并解码一页，处理完即可释放，整套图纸的内存峰值与页数无关
+- PyMuPDF 不是线程安全的：所有 PDF 访问经由同一把锁串行，OCR 仍可在多线程中并行
+"""
+from __future__ import annotations
+
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from PIL import Image
+
+from .pdf_text import open_pdf, render_page, read_page_layers
+
+_PDF_LOCK = threading.Lock()
+
+def is_pdf(path: str) -> bool:
+    return Path(path).suffix.lower() == ".pdf"
+
+def page_count(path: str) -> int:
+    if is_pdf(path):
+        with _PDF_LOCK:
+            doc = open_pdf(path)
+            try:
+                return int(doc.page_count)
+            finally:
+                doc.close()
+    with Image.open(path) as im:
+        return int(getattr(im, "n_frames", 1) or 1)
+
+def _frame_at_dpi(frame: Image.Image, dpi: Optional[float]) -> Image.Image:
+    """按 TIFF 自带的 dpi 信息重采样到目标 dpi；无 dpi 信息或未指定时保持原样"""
+    src = frame.info.get("dpi")
+    if not dpi or not src:
+        return frame.convert("RGB")
+    try:
+        sx = float(dpi) / float(src[0]); sy = float(dpi) / float(src[1])
+    except (TypeError, ValueError, ZeroDivisionError, IndexError):
+        return frame.convert("RGB")
+    if abs(sx - 1.0) < 1e-3 and abs(sy - 1.0) < 1e-3:
+        return frame.convert("RGB")
+    size = (max(1, int(round(frame.width * sx))), max(1, int(round(frame.height * sy))))
+    return frame.convert("RGB").resize(size, Image.LANCZOS)
+
+def decode_page(
+    path: str,
+    page_no: int,
+    opts: Dict[str, Any]
+) -> Tuple[Image.Image, Optional[List[Dict[str, Any]]], List[Tuple[float, float, float, float]]]:
+    """
+    解码第 page_no 页（1 起）：返回 (RGB 图, 文本层条目, 位图区域)。
+    非 PDF 或 pdf_mode=ocr 时文本层为 None（需整页 OCR）。
+    """
+    if is_pdf(path):
+        dpi = float(opts.get("pdf_dpi", 300))
+        with _PDF_LOCK:
+            doc = open_pdf(path)
+            try:
+                if not (1 <= page_no <= doc.page_count):
+                    raise ValueError(f"page {page_no} out of range (1..{doc.page_count})")
+                page = doc[page_no - 1]
+                if opts.get("pdf_mode", "text") == "ocr":
+                    return render_page(page, dpi), None, []
+                img, items, regions = read_page_layers(page, dpi)
+                return img, items, regions
+            finally:
+                doc.close()
+
+    with Image.open(path) as im:
+        n = int(getattr(im, "n_frames", 1) or 1)
+        if not (1 <= page_no <= n):
+            raise ValueError(f"page {page_no} out of range (1..{n})")
+        if page_no > 1:
+            im.seek(page_no - 1)
+        return _frame_at_dpi(im, opts.get("tiff_dpi")), None, []
+
+__all__ = ["is_pdf", "page_count", "decode_page"]
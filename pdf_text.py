@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+pdf_text.py — 矢量 PDF 直接读取文本层（PyMuPDF），跳过 OCR
+- 文本层按“行”输出，坐标按 dpi/72 换算到渲染图像的像素坐标（含页面旋转）
+- 返回与 run_ocr 相同的 {"text","conf","box","center"} 结构，conf 固定为 1.0
+- 没有文本层的页面整页光栅化后 OCR；有文本层的页面只对其中嵌入的位图区域做 OCR
+"""
+from __future__ import annotations
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from PIL import Image
+
+from .geometry import quad_bbox, rect_intersection, rect_area
+
+try:
+    import pymupdf as fitz  # PyMuPDF >= 1.24
+except Exception:
+    try:
+        import fitz  # 旧版 PyMuPDF
+    except Exception:
+        fitz = None  # type: ignore
+
+Rect = Tuple[float, float, float, float]
+OcrFn = Callable[[Image.Image], Tuple[List[Dict[str, Any]], str]]
+
+def _require_fitz():
+    if fitz is None:
+        raise RuntimeError("PyMuPDF 未安装（pip install pymupdf），无法读取 PDF。")
+    return fitz
+
+def open_pdf(path: str):
+    return _require_fitz().open(path)
+
+def _page_matrix(page, dpi: float):
+    """未旋转页面坐标(pt) → 渲染像素坐标"""
+    z = float(dpi) / 72.0
+    return page.rotation_matrix * fitz.Matrix(z, z)
+
+def render_page(page, dpi: float = 300) -> Image.Image:
+    pix = page.get_pixmap(matrix=fitz.Matrix(dpi / 72.0, dpi / 72.0), alpha=False)
+    return Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+
+def _to_pixels(bbox, mat) -> Rect:
+    r = fitz.Rect(bbox) * mat
+    r.normalize()
+    return (r.x0, r.y0, r.x1, r.y1)
+
+def extract_text_items(page, dpi: float = 300) -> List[Dict[str, Any]]:
+    """读取页面文本层，每一行一个条目"""
+    mat = _page_matrix(page, dpi)
+    out: List[Dict[str, Any]] = []
+    data = page.get_text("dict")
+    for block in data.get("blocks", []):
+        if block.get("type", 0) != 0:
+            continue
+        for line in block.get("lines", []):
+            txt = "".join(span.get("text", "") for span in line.get("spans", [])).strip()
+            if not txt:
+                continue
+            x1, y1, x2, y2 = _to_pixels(line["bbox"], mat)
+            box = [(x1, y1), (x2, y1), (x2, y2), (x1, y2)]
+            out.append({"text": txt, "conf": 1.0, "box": box, "center": ((x1 + x2) / 2.0, (y1 + y2) / 2.0)})
+    return out
+
+def image_regions(page, dpi: float = 300, min_side: float = 32.0) -> List[Rect]:
+    """页面中嵌入位图的像素区域（这些区域没有文本层，需要 OCR）"""
+    mat = _page_matrix(page, dpi)
+    out: List[Rect] = []
+    for info in page.get_image_info():
+        r = _to_pixels(info["bbox"], mat)
+        if (r[2] - r[0]) >= min_side and (r[3] - r[1]) >= min_side:
+            out.append(r)
+    return out
+
+def read_page_layers(page, dpi: float = 300) -> Tuple[Image.Image, List[Dict[str, Any]], List[Rect]]:
+    """一次性取出页面所需的全部 PyMuPDF 数据：(渲染图, 文本层条目, 位图区域)"""
+    return render_page(page, dpi), extract_text_items(page, dpi), image_regions(page, dpi)
+
+def ocr_fallback(
+    img: Image.Image,
+    items: List[Dict[str, Any]],
+    regions: List[Rect],
+    ocr_fn: OcrFn,
+    full_page: bool = False
+) -> Tuple[List[Dict[str, Any]], str]:
+    """
+    对缺少文本层的部分做 OCR，返回 (items, mode)：
+      mode = "pdf-text"     纯文本层
+             "pdf-text+ocr" 文本层 + 位图区域 OCR
+             "pdf-ocr"      无文本层，整页 OCR
+    full_page=True 时不裁图：整页识别一次，只保留中心落在位图区域内的条目（回放后端的结果是整页坐标）
+    """
+    if not items:
+        ocr_items, _ = ocr_fn(img)
+        return ocr_items, "pdf-ocr"
+    if not regions:
+        return items, "pdf-text"
+
+    items = list(items)
+    text_bbs = [quad_bbox(it["box"]) for it in items]
+    W, H = img.size
+    page_items: Optional[List[Dict[str, Any]]] = None
+    if full_page:
+        page_items, _ = ocr_fn(img)
+    for (x1, y1, x2, y2) in regions:
+        cx1, cy1 = max(0, int(x1)), max(0, int(y1))
+        cx2, cy2 = min(W, int(x2 + 0.5)), min(H, int(y2 + 0.5))
+        if cx2 - cx1 < 8 or cy2 - cy1 < 8:
+            continue
+        if page_items is not None:
+            sub_items = [{**it, "box": [(x - cx1, y - cy1) for (x, y) in it["box"]],
+                          "center": (it["center"][0] - cx1, it["center"][1] - cy1)}
+                         for it in page_items if cx1 <= it["center"][0] < cx2 and cy1 <= it["center"][1] < cy2]
+        else:
+            sub_items, _ = ocr_fn(img.crop((cx1, cy1, cx2, cy2)))
+        for it in sub_items:
+            box = [(x + cx1, y + cy1) for (x, y) in it["box"]]
+            bb = quad_bbox(box)
+            # 与文本层重复的（位图上叠了文字）以文本层为准
+            if any(rect_intersection(bb, t) > 0.5 * max(1e-6, rect_area(bb)) for t in text_bbs):
+                continue
+            cx, cy = it["center"]
+            items.append({"text": it["text"], "conf": it["conf"], "box": box, "center": (cx + cx1, cy + cy1)})
+    return items, "pdf-text+ocr"
+
+def extract_page_items(
+    page,
+    dpi: float = 300,
+    ocr_fn: Optional[OcrFn] = None
+) -> Tuple[Image.Image, List[Dict[str, Any]], str]:
+    """返回 (渲染图, items, mode)；ocr_fn 为 None 时不做任何 OCR 回退"""
+    img, items, regions = read_page_layers(page, dpi)
+    if ocr_fn is None:
+        return img, items, "pdf-text"
+    items, mode = ocr_fallback(img, items, regions, ocr_fn)
+    return img, items, mode
+
+__all__ = ["open_pdf", "render_page", "extract_text_items", "image_regions", "read_page_layers", "ocr_fallback",
+           "extract_page_items"]
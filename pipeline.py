@@ -0,0 +1,418 @@
+# -*- coding: utf-8 -*-
+"""
+pipeline.py — 单张图纸的完整流水线：识别 → 清洗 → 排序编号 → 绘制 → 导出
+cli run / batch 共用；opts 为普通 dict（argparse 参数），可跨进程传递
+多页 PDF / TIFF 逐页流式处理：每页解码 → 处理 → 写出标注图 → 释放，最后输出带 page 列的合并表
+多个单页图像可用 process_files 一起处理：OCR 按 opts['ocr_batch'] 组批，其余阶段逐个文件进行
+"""
+from __future__ import annotations
+
+import json
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+from .ocr import run_ocr, run_ocr_batch, reserve_engine_pool, paddle_mode
+from .backends import PdfTextBackend, ReplayBackend
+from .tiling import run_ocr_tiled
+from .cascade import rescue_low_conf
+from .premask import blank_zones, is_blank, premask_zones
+from .cache import OcrCache, cached_ocr, DEFAULT_MAX_BYTES
+from .pdf_text import ocr_fallback
+from .pages import is_pdf, page_count, decode_page
+from .cleaning import clean_items
+from .sorting import sort_reading_order
+from .drawing import draw_bubbles
+from .exporter import dataset_path, export_columnar, export_jsonl, export_tabular
+from .items import ItemTable
+from .metrics import Metrics, bind, collecting, current, stage
+
+Log = Callable[[str], None]
+
+def parse_excludes(s: str) -> List[Tuple[float, float, float, float]]:
+    s = (s or "").strip()
+    if not s:
+        return []
+    out = []
+    for seg in s.split(";"):
+        try:
+            x1,y1,x2,y2 = [float(v) for v in seg.split(",")]
+            out.append((x1,y1,x2,y2))
+        except Exception:
+            continue
+    return out
+
+def backend_spec(opts: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    """opts → (后端名, 后端选项)；replay 后端从 opts['replay'] 读取录制结果"""
+    name = opts.get("ocr_backend") or "paddle"
+    options: Dict[str, Any] = {}
+    if name == "replay" and opts.get("replay"):
+        options["path"] = opts["replay"]
+    return name, options
+
+def engine_copies(opts: Dict[str, Any], workers: int = 1) -> int:
+    """同一引擎配置需要的并发副本数：workers（页线程 / 服务 worker）× 每页的分块并发"""
+    tile = max(1, int(opts.get("tile_workers") or 1)) if opts.get("tiled") else 1
+    return max(1, int(workers)) * tile
+
+def ocr_settings(opts: Dict[str, Any]) -> Dict[str, Any]:
+    """决定原始 OCR 结果的全部设置，作为缓存 key 的一部分"""
+    backend, _ = backend_spec(opts)
+    try:
+        mode = paddle_mode() if backend.startswith("paddle") else ""
+    except Exception:
+        mode = "unknown"
+    settings: Dict[str, Any] = {
+        "backend": backend,
+        "lang": opts.get("lang", "en"),
+        "limit_side_len": opts.get("limit_side_len", 960),
+        "pad_stride": opts.get("pad_stride", 32),
+        "det_model_dir": opts.get("det_model_dir"),
+        "rec_model_dir": opts.get("rec_model_dir"),
+        "paddle_mode": mode,
+    }
+    if opts.get("premask") == "zones":
+        # 涂白排除区会改变识别结果；空白跳过是无损的，不进 key
+        settings.update(premask="zones", exclude=opts.get("exclude", ""))
+    if opts.get("tiled"):
+        settings.update(tiled=True, tile_size=opts.get("tile_size", 1600), tile_overlap=opts.get("tile_overlap", 200),
+                        tile_scale=opts.get("tile_scale", 1.0))
+    return settings
+
+def open_cache(opts: Dict[str, Any]) -> Optional[OcrCache]:
+    # 只缓存 PaddleOCR：回放 / 文本层后端本身就是毫秒级
+    if opts.get("no_cache") or not backend_spec(opts)[0].startswith("paddle"):
+        return None
+    max_mb = opts.get("cache_max_mb")
+    max_bytes = int(max_mb * 1024 * 1024) if max_mb else DEFAULT_MAX_BYTES
+    return OcrCache(opts.get("cache_dir"), max_bytes=max_bytes)
+
+def ocr_image(img: Image.Image, opts: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], str]:
+    """识别整图；命中缓存时 mode 带 'cached' 后缀"""
+    with stage("ocr") as rec:
+        items, mode, hit = cached_ocr(img, ocr_settings(opts), lambda: _ocr_image_uncached(img, opts),
+                                      open_cache(opts), refresh=bool(opts.get("refresh")))
+        rec.items = len(items)
+    return items, (f"{mode} cached" if hit else mode)
+
+def premask_image(img: Image.Image, opts: Dict[str, Any]) -> Optional[Image.Image]:
+    """
+    OCR 前遮罩：zones 模式涂白外边框 / 标题栏 / --exclude；整页空白时返回 None（不必识别）。
+    分块模式逐块判断空白（run_ocr_tiled skip_blank），这里不再整页算一遍；回放后端不看像素，不做遮罩
+    """
+    mode = opts.get("premask", "blank")
+    if mode == "off" or backend_spec(opts)[0] == ReplayBackend.name:
+        return img
+    with stage("ocr.premask"):
+        if mode == "zones":
+            img = blank_zones(img, premask_zones(img.width, img.height, parse_excludes(opts.get("exclude", ""))))
+        return None if not opts.get("tiled") and is_blank(img) else img
+
+def _ocr_image_uncached(img: Image.Image, opts: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], str]:
+    backend, backend_options = backend_spec(opts)
+    masked = premask_image(img, opts)
+    if masked is None:
+        return [], "blank"
+    img = masked
+    # 回放后端每次都返回整页条目，分块会按块偏移重复叠加，这里始终整页识别
+    if opts.get("tiled") and backend != ReplayBackend.name:
+        items, mode = run_ocr_tiled(img, lang=opts.get("lang", "en"), tile_size=opts.get("tile_size", 1600),
+                                    overlap=opts.get("tile_overlap", 200), scale=opts.get("tile_scale", 1.0),
+                                    workers=opts.get("tile_workers", 1),
+                                    det_model_dir=opts.get("det_model_dir"), rec_model_dir=opts.get("rec_model_dir"),
+                                    backend=backend, backend_options=backend_options,
+                                    batch_size=opts.get("ocr_batch") or 1,
+                                    skip_blank=opts.get("premask", "blank") != "off")
+        return items, f"{mode} tiled"
+    return run_ocr(img, lang=opts.get("lang", "en"), det=True, rec=True,
+                   limit_side_len=opts.get("limit_side_len", 960), pad_stride=opts.get("pad_stride", 32),
+                   det_model_dir=opts.get("det_model_dir"), rec_model_dir=opts.get("rec_model_dir"),
+                   backend=backend, backend_options=backend_options)
+
+def ocr_images(imgs: List[Image.Image], opts: Dict[str, Any]) -> List[Tuple[List[Dict[str, Any]], str]]:
+    """
+    多张图一起识别，返回每张图的 (items, mode)：先逐张查缓存，未命中的按 opts['ocr_batch'] 组批识别后写回缓存。
+    分块模式下逐张分块识别，块在图内组批。
+    """
+    cache = open_cache(opts)
+    settings = ocr_settings(opts)
+    refresh = bool(opts.get("refresh"))
+    out: List[Optional[Tuple[List[Dict[str, Any]], str]]] = [None] * len(imgs)
+    keys: List[Optional[str]] = [None] * len(imgs)
+    todo: List[int] = []
+    with stage("ocr") as rec:
+        for i, img in enumerate(imgs):
+            if cache is not None:
+                keys[i] = cache.key(img, settings)
+                hit = None if refresh else cache.get(keys[i])  # type: ignore[arg-type]
+                if hit is not None:
+                    out[i] = (hit[0], f"{hit[1]} cached")
+                    continue
+            todo.append(i)
+        if todo:
+            if opts.get("tiled"):
+                fresh = [_ocr_image_uncached(imgs[i], opts) for i in todo]
+            else:
+                backend, backend_options = backend_spec(opts)
+                masked = [premask_image(imgs[i], opts) for i in todo]
+                live = [k for k, im in enumerate(masked) if im is not None]
+                results, mode = run_ocr_batch([masked[k] for k in live], lang=opts.get("lang", "en"),
+                                              batch_size=opts.get("ocr_batch") or 1,
+                                              limit_side_len=opts.get("limit_side_len", 960),
+                                              pad_stride=opts.get("pad_stride", 32),
+                                              det_model_dir=opts.get("det_model_dir"),
+                                              rec_model_dir=opts.get("rec_model_dir"),
+                                              backend=backend, backend_options=backend_options)
+                fresh = [([], "blank")] * len(todo)
+                for k, items in zip(live, results):
+                    fresh[k] = (items, mode)
+            for i, (items, mode) in zip(todo, fresh):
+                out[i] = (items, mode)
+                if cache is not None:
+                    try:
+                        cache.put(keys[i], items, mode)  # type: ignore[arg-type]
+                    except OSError:
+                        pass
+        rec.items = sum(len(o[0]) for o in out if o is not None)
+    return out  # type: ignore[return-value]
+
+def annotate(img: Image.Image, ocr_items: List[Dict[str, Any]], opts: Dict[str, Any]) -> Tuple[ItemTable, Image.Image]:
+    W, H = img.size
+    custom_excludes = parse_excludes(opts.get("exclude", ""))
+    if float(opts.get("rescue_band") or 0.0) > 0:
+        backend, backend_options = backend_spec(opts)
+        rescue_low_conf(img, ocr_items, min_conf=opts.get("min_conf", 0.60), band=float(opts["rescue_band"]),
+                        min_height=int(opts.get("rescue_height") or 48), lang=opts.get("lang", "en"),
+                        det_model_dir=opts.get("det_model_dir"), rec_model_dir=opts.get("rec_model_dir"),
+                        backend=backend, backend_options=backend_options)
+    with stage("clean") as rec:
+        # 清洗之后各阶段共用列式条目表（items.ItemTable），不再逐条转换 dict / tuple
+        items = clean_items(ItemTable.from_items(ocr_items), W, H, min_conf=opts.get("min_conf", 0.60),
+                            custom_excludes=custom_excludes)
+        rec.items = len(items)
+    with stage("sort", items=len(items)):
+        items_sorted = sort_reading_order(items, method=opts.get("sort", "rows"), deskew=bool(opts.get("deskew")),
+                                          zone_grid=tuple(opts.get("zone_grid") or (8, 6)), size=(W, H))
+
+    # 给每个气泡编号 1 到 n
+    items_sorted.bubble_id[:] = np.arange(1, len(items_sorted) + 1, dtype=np.int32)
+
+    dx, dy = opts.get("offset", (10, -10))
+    with stage("draw", items=len(items_sorted)):
+        anno = draw_bubbles(img, items_sorted, radius=opts.get("bubble_radius", 18), text_scale=opts.get("label_scale", 1.2),
+                            font_path=opts.get("font"), anchor=opts.get("anchor", "tr"), offset=(dx, dy), avoid_overlap=True,
+                            avoid_text=bool(opts.get("avoid_text")), layout=opts.get("layout", "greedy"),
+                            layout_budget=float(opts.get("layout_budget_ms", 200)) / 1000.0)
+    return items_sorted, anno
+
+def write_tables(items: Union[List[Dict[str, Any]], ItemTable], out_dir: str, stem: str, image_name: str,
+                 log: Log = print, opts: Optional[Dict[str, Any]] = None) -> Dict[str, Optional[str]]:
+    """
+    CSV / XLSX / JSON 总是写出；opts['jsonl'] 另写 {stem}_dims.jsonl，
+    opts['columnar']（parquet / arrow）另写 {stem}_dims.<ext>，或在 opts['dataset_dir'] 下写入 drawing=<stem> 分区
+    """
+    opts = opts or {}
+    Path(out_dir).mkdir(parents=True, exist_ok=True)
+    base = str(Path(out_dir) / f"{stem}_dims")
+    with stage("export_tabular", items=len(items)):
+        csv_path, xlsx_path = export_tabular(items, base, image_name=image_name)
+    log(f"[OK] table -> {csv_path}" + (f" | {xlsx_path}" if xlsx_path else " (xlsx skipped)"))
+
+    out_json = str(Path(out_dir) / f"{stem}_dims.json")
+    with stage("export_json", items=len(items)):
+        with open(out_json, "w", encoding="utf-8") as f:
+            json.dump(items.to_items() if isinstance(items, ItemTable) else items, f, ensure_ascii=False, indent=2)
+    log(f"[OK] JSON -> {out_json}")
+    paths: Dict[str, Optional[str]] = {"csv": csv_path, "xlsx": xlsx_path, "json": out_json}
+
+    if opts.get("jsonl"):
+        with stage("export_jsonl", items=len(items)):
+            paths["jsonl"] = export_jsonl(items, f"{base}.jsonl", image_name)
+        log(f"[OK] JSON Lines -> {paths['jsonl']}")
+    fmt = opts.get("columnar") or "off"
+    if fmt != "off":
+        path = dataset_path(opts["dataset_dir"], stem, fmt) if opts.get("dataset_dir") else f"{base}.{fmt}"
+        with stage("export_columnar", items=len(items)):
+            paths[fmt] = export_columnar(items, path, image_name, fmt=fmt)
+        log(f"[OK] {fmt} -> {path}")
+    return paths
+
+def write_outputs(items: Union[List[Dict[str, Any]], ItemTable], anno: Image.Image, out_dir: str, stem: str, image_name: str,
+                  log: Log = print, opts: Optional[Dict[str, Any]] = None) -> Dict[str, Optional[str]]:
+    Path(out_dir).mkdir(parents=True, exist_ok=True)
+    out_img = str(Path(out_dir) / f"{stem}_bubbled.jpg")
+    with stage("save_image"):
+        anno.save(out_img, quality=95)
+    log(f"[OK] annotated image -> {out_img}")
+    paths: Dict[str, Optional[str]] = {"image": out_img}
+    paths.update(write_tables(items, out_dir, stem, image_name, log=log, opts=opts))
+    return paths
+
+def load_and_ocr(input_path: str, opts: Dict[str, Any]) -> Tuple[Image.Image, List[Dict[str, Any]], str]:
+    """
+    解码 opts['page'] 指定的一页（默认第 1 页）并得到原始条目：
+    图像 / TIFF 帧走 OCR；PDF 默认读文本层，无文本层的页面或位图区域回退 OCR（pdf_mode=ocr 时整页 OCR）
+    """
+    with stage("load"):
+        img, text_items, regions = decode_page(input_path, int(opts.get("page") or 1), opts)
+    if text_items is None:
+        items, mode = ocr_image(img, opts)
+        return img, items, mode
+    if backend_spec(opts)[0] == PdfTextBackend.name:
+        return img, text_items, "pdf-text"  # 只用文本层，不做 OCR 回退
+    items, mode = ocr_fallback(img, text_items, regions, lambda im: ocr_image(im, opts),
+                               full_page=backend_spec(opts)[0] == ReplayBackend.name)
+    return img, items, mode
+
+def process_file(input_path: str, opts: Dict[str, Any], out_dir: Optional[str] = None, stem: Optional[str] = None,
+                 log: Log = print) -> Dict[str, Any]:
+    """处理单个图像 / PDF 文件的一页，返回摘要 dict（供 batch 汇总）"""
+    img, ocr_items, mode = load_and_ocr(input_path, opts)
+    W, H = img.size
+    log(f"[INFO] image loaded: {input_path} ({W}x{H})")
+    log(f"[INFO] OCR mode: {mode}; raw items: {len(ocr_items)}")
+
+    items, anno = annotate(img, ocr_items, opts)
+    log(f"[INFO] after cleaning: {len(items)}")
+
+    paths = write_outputs(items, anno, out_dir or opts.get("out_dir", "out"), stem or Path(input_path).stem,
+                          Path(input_path).name, log=log, opts=opts)
+    return {"input": str(input_path), "size": [W, H], "mode": mode,
+            "raw_items": len(ocr_items), "items": len(items), "outputs": paths}
+
+def process_document(input_path: str, opts: Dict[str, Any], out_dir: Optional[str] = None, stem: Optional[str] = None,
+                     log: Log = print) -> Dict[str, Any]:
+    """
+    process_document 外层：记录分阶段耗时 / 条目数 / 峰值内存，结果放在摘要的 "metrics" 中。
+    opts['metrics'] 为真时另写 {stem}_metrics.json 并打印阶段表；opts['profile'] 为真时写 {stem}.prof（cProfile）
+    """
+    out_dir = out_dir or opts.get("out_dir", "out")
+    stem = stem or Path(input_path).stem
+    reserve_engine_pool(engine_copies(opts, opts.get("page_workers") or 1))
+    if current() is not None:
+        return _process_document(input_path, opts, out_dir, stem, log)
+
+    profile_path = str(Path(out_dir) / f"{stem}.prof") if opts.get("profile") else None
+    if profile_path:
+        Path(out_dir).mkdir(parents=True, exist_ok=True)
+    m = Metrics(str(input_path), profile_path=profile_path)
+    with collecting(m):
+        summary = _process_document(input_path, opts, out_dir, stem, log)
+    _attach_metrics(summary, m, opts, out_dir, stem, log)
+    if profile_path:
+        log(f"[OK] profile -> {profile_path}")
+    return summary
+
+def _attach_metrics(summary: Dict[str, Any], m: Metrics, opts: Dict[str, Any], out_dir: str, stem: str,
+                    log: Log) -> None:
+    summary["metrics"] = m.to_dict()
+    if opts.get("metrics"):
+        out_metrics = str(Path(out_dir) / f"{stem}_metrics.json")
+        with open(out_metrics, "w", encoding="utf-8") as f:
+            json.dump(summary["metrics"], f, ensure_ascii=False, indent=2)
+        for line in m.summary_lines():
+            log(line)
+        log(f"[OK] metrics -> {out_metrics}")
+
+def process_files(jobs: List[Tuple[str, str]], opts: Dict[str, Any], out_dir: Optional[str] = None,
+                  log: Log = print) -> List[Dict[str, Any]]:
+    """
+    一组 (路径, stem) 一起处理，返回与 process_document 相同结构的摘要列表（顺序同输入）。
+    单页光栅图先全部解码、组批 OCR，再逐个清洗 / 绘制 / 导出；PDF 与多页文件逐个走 process_document。
+    组批 OCR 的耗时按文件数均摊记入各自的 metrics。任一文件出错时整组抛出异常。
+    """
+    out_dir = out_dir or opts.get("out_dir", "out")
+    reserve_engine_pool(engine_copies(opts, opts.get("page_workers") or 1))
+    summaries: List[Optional[Dict[str, Any]]] = [None] * len(jobs)
+    group: List[int] = []
+    for i, (path, stem) in enumerate(jobs):
+        if is_pdf(path) or page_count(path) > 1:
+            summaries[i] = process_document(path, opts, out_dir=out_dir, stem=stem, log=log)
+        else:
+            group.append(i)
+    if not group:
+        return summaries  # type: ignore[return-value]
+
+    shared = Metrics(f"{len(group)} files")
+    with collecting(shared):
+        with stage("load"):
+            imgs = [decode_page(jobs[i][0], 1, opts)[0] for i in group]
+        results = ocr_images(imgs, opts)
+    shared_d = shared.to_dict()
+
+    for k, i in enumerate(group):
+        path, stem = jobs[i]
+        img, (ocr_items, mode) = imgs[k], results[k]
+        imgs[k] = None  # type: ignore[call-overload]  写完即释放
+        m = Metrics(str(path))
+        m.add_share(shared_d, 1.0 / len(group))
+        with collecting(m):
+            W, H = img.size
+            log(f"[INFO] image loaded: {path} ({W}x{H})")
+            log(f"[INFO] OCR mode: {mode}; raw items: {len(ocr_items)}")
+            items, anno = annotate(img, ocr_items, opts)
+            log(f"[INFO] after cleaning: {len(items)}")
+            paths = write_outputs(items, anno, out_dir, stem, Path(path).name, log=log, opts=opts)
+        summary = {"input": str(path), "size": [W, H], "mode": mode,
+                   "raw_items": len(ocr_items), "items": len(items), "outputs": paths}
+        _attach_metrics(summary, m, opts, out_dir, stem, log)
+        summaries[i] = summary
+    return summaries  # type: ignore[return-value]
+
+def _process_document(input_path: str, opts: Dict[str, Any], out_dir: str, stem: str, log: Log) -> Dict[str, Any]:
+    """
+    处理整套图纸：单页文件或指定了 page 时等同 process_file；
+    多页时逐页流式处理，page_workers 控制同时在途的页数（内存峰值 ≈ page_workers 页）。
+    输出 {stem}_pNNN_bubbled.jpg 每页一张，以及带 page 列的合并表 {stem}_dims.*
+    """
+    n = page_count(input_path)
+    if opts.get("page") or n <= 1:
+        return process_file(input_path, opts, out_dir=out_dir, stem=stem, log=log)
+
+    Path(out_dir).mkdir(parents=True, exist_ok=True)
+    workers = max(1, int(opts.get("page_workers") or 1))
+    log(f"[INFO] document: {input_path} ({n} pages, {workers} page workers)")
+
+    def _one(page_no: int) -> Dict[str, Any]:
+        img, raw, mode = load_and_ocr(input_path, dict(opts, page=page_no))
+        items, anno = annotate(img, raw, opts)
+        items.page[:] = page_no
+        out_img = str(Path(out_dir) / f"{stem}_p{page_no:03d}_bubbled.jpg")
+        with stage("save_image"):
+            anno.save(out_img, quality=95)
+        return {"page": page_no, "size": list(img.size), "mode": mode, "raw_items": len(raw),
+                "items": items, "image": out_img}
+
+    done_pages: Dict[int, Dict[str, Any]] = {}
+    if workers == 1:
+        for p in range(1, n + 1):
+            done_pages[p] = _one(p)
+            log(f"[OK] page {p}/{n}: {len(done_pages[p]['items'])} items -> {done_pages[p]['image']}")
+    else:
+        pending: Dict[Future, int] = {}
+        queue = iter(range(1, n + 1))
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            while True:
+                while len(pending) < workers:
+                    p = next(queue, None)
+                    if p is None:
+                        break
+                    pending[ex.submit(bind(_one), p)] = p
+                if not pending:
+                    break
+                done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                for fut in done:
+                    p = pending.pop(fut)
+                    done_pages[p] = fut.result()
+                    log(f"[OK] page {p}/{n}: {len(done_pages[p]['items'])} items -> {done_pages[p]['image']}")
+
+    all_items = ItemTable.concat([done_pages[p]["items"] for p in range(1, n + 1)])
+    paths = write_tables(all_items, out_dir, stem, Path(input_path).name, log=log, opts=opts)
+    paths["images"] = [done_pages[p]["image"] for p in range(1, n + 1)]  # type: ignore[assignment]
+    return {"input": str(input_path), "pages": n,
+            "mode": ",".join(sorted({done_pages[p]["mode"] for p in done_pages})),
+            "raw_items": sum(done_pages[p]["raw_items"] for p in done_pages),
+            "items": len(all_items), "outputs": paths}
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+premask.py — OCR 之前的遮罩：不把识别时间花在空白与排除区上
+- ink_grid：按 cell×cell 小格统计墨迹像素数（最暗通道低于 ink_thr，浅色彩色线条 / 文字也算墨迹），按行条带向量化计算
+- has_ink：矩形区域是否有墨迹；按覆盖该矩形的所有小格求和，只会多留不会漏（空白判定无损）
+- 分块识别时跳过没有墨迹的块；整页空白时不调用 OCR
+- zones 模式另把外边框条带、标题栏与 --exclude 区域涂白后再识别。注意：clean_items 对排除区内的
+  R / DIA / ANG 条目仍予保留，涂白后这些条目不会再被识别，因此该模式需显式开启
+"""
+from __future__ import annotations
+
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image, ImageChops, ImageDraw
+
+Rect = Tuple[float, float, float, float]
+
+MODES = ("off", "blank", "zones")
+
+def ink_grid(gray: np.ndarray, cell: int = 32, ink_thr: int = 200) -> np.ndarray:
+    """
+    灰度图每个 cell×cell 小格中的墨迹像素数，形状 (ceil(H/cell), ceil(W/cell))。
+    传入 RGB 时按最暗通道判断（浅色彩色线条也算墨迹），比先转灰度慢
+    """
+    h, w = gray.shape[:2]
+    gh, gw = -(-h // cell), -(-w // cell)
+    full = w // cell
+    out = np.zeros((gh, gw), dtype=np.int32)
+    for r in range(gh):
+        strip = gray[r * cell:(r + 1) * cell]
+        dark = (strip.min(axis=2) if strip.ndim == 3 else strip) < ink_thr
+        if full:
+            out[r, :full] = dark[:, :full * cell].reshape(dark.shape[0], full, cell).sum(axis=(0, 2))
+        if full < gw:
+            out[r, full] = int(dark[:, full * cell:].sum())
+    return out
+
+def has_ink(grid: np.ndarray, rect: Rect, cell: int = 32, min_pixels: int = 8) -> bool:
+    x1, y1, x2, y2 = rect
+    c1, r1 = max(0, int(x1) // cell), max(0, int(y1) // cell)
+    c2, r2 = -(-int(np.ceil(x2)) // cell), -(-int(np.ceil(y2)) // cell)
+    return int(grid[r1:r2, c1:c2].sum()) >= min_pixels
+
+def darkest_channel(img: Image.Image) -> np.ndarray:
+    """各像素 RGB 最暗通道（uint8 二维数组）；PIL 内做，比对 RGB ndarray 取 min 快数倍"""
+    if img.mode in ("L", "1"):
+        return np.asarray(img.convert("L"))
+    r, g, b = img.convert("RGB").split()
+    return np.asarray(ImageChops.darker(ImageChops.darker(r, g), b))
+
+def is_blank(img: Image.Image, cell: int = 32, min_pixels: int = 8) -> bool:
+    # 按最暗通道判断：先转灰度会把黄色等浅色彩色文字当成空白
+    grid = ink_grid(darkest_channel(img), cell)
+    return int(grid.sum()) < min_pixels
+
+def premask_zones(w: int, h: int, custom: Optional[Sequence[Rect]] = None, m: float = 0.025) -> List[Rect]:
+    """
+    OCR 前涂白的区域：外边框条带与标题栏（与 geometry.default_exclusion_zones 的同名区域一致）加自定义排除区。
+    default_exclusion_zones 中 6% 宽的上下左右条带常有边缘尺寸，不在此涂白
+    """
+    zones: List[Rect] = [(0, 0, w * m, h), (0, 0, w, h * m), (w * (1 - m), 0, w, h), (0, h * (1 - m), w, h),
+                         (0.62 * w, 0.62 * h, w, h)]
+    return zones + list(custom or [])
+
+def blank_zones(img: Image.Image, zones: Sequence[Rect]) -> Image.Image:
+    """返回把 zones 涂白后的副本（原图不变，坐标不变）"""
+    out = img.convert("RGB").copy()
+    d = ImageDraw.Draw(out)
+    for (x1, y1, x2, y2) in zones:
+        d.rectangle((x1, y1, x2, y2), fill=(255, 255, 255))
+    return out
+
+__all__ = ["MODES", "ink_grid", "darkest_channel", "has_ink", "is_blank", "premask_zones", "blank_zones"]
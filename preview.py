@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+preview.py — 大图的缩略预览与局部放大
+- PreviewPyramid：对全分辨率图建 1/2、1/4 … 的金字塔（Image.reduce 盒式平均），
+  view() 取不超过 max_side 的整图预览或任意区域的放大视图，只处理该区域、对应层级的像素
+- 原图局部改动后 update(rect) 只重算各层中对应的小块（按 2^k 对齐，与整层重建结果一致），
+  最近一次的视图也只重采样对应的小块（Image.resize 的 box 参数），编辑后取预览不再整图缩放
+- ViewTransform：显示坐标 ↔ 原图坐标的唯一换算：orig = origin + display / scale；可存入 gr.State
+"""
+from __future__ import annotations
+
+import math
+from typing import Any, Dict, List, Optional, Tuple
+
+from PIL import Image
+
+Rect = Tuple[int, int, int, int]
+
+DEFAULT_MAX_SIDE = 2048
+
+class ViewTransform:
+    def __init__(self, origin: Tuple[float, float] = (0.0, 0.0), scale: Tuple[float, float] = (1.0, 1.0),
+                 size: Tuple[int, int] = (0, 0)):
+        self.origin = (float(origin[0]), float(origin[1]))
+        self.scale = (float(scale[0]), float(scale[1]))
+        self.size = (int(size[0]), int(size[1]))  # 显示图尺寸
+
+    def to_original(self, x: float, y: float) -> Tuple[float, float]:
+        return (self.origin[0] + x / self.scale[0], self.origin[1] + y / self.scale[1])
+
+    def to_display(self, x: float, y: float) -> Tuple[float, float]:
+        return ((x - self.origin[0]) * self.scale[0], (y - self.origin[1]) * self.scale[1])
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"origin": list(self.origin), "scale": list(self.scale), "size": list(self.size)}
+
+    @classmethod
+    def from_dict(cls, d: Optional[Dict[str, Any]]) -> "ViewTransform":
+        if not d:
+            return cls()
+        return cls(tuple(d.get("origin", (0, 0))), tuple(d.get("scale", (1, 1))), tuple(d.get("size", (0, 0))))
+
+class PreviewPyramid:
+    def __init__(self, img: Image.Image, min_side: int = 512):
+        """img 为全分辨率图（引用，不复制；原地修改后调用 update）"""
+        self.W, self.H = img.size
+        self.levels: List[Image.Image] = [img]
+        f = 2
+        while max(self.W, self.H) / f >= min_side:
+            self.levels.append(img.reduce(f))
+            f *= 2
+        # 最近一次视图：(region, max_side) → (图, 变换, 层级)
+        self._last: Optional[Tuple[Tuple[Any, ...], Image.Image, ViewTransform, int]] = None
+
+    def update(self, rect: Rect) -> None:
+        """原图 rect 区域改动后，刷新各缩小层的对应块"""
+        src = self.levels[0]
+        for k in range(1, len(self.levels)):
+            f = 2 ** k
+            x1 = (rect[0] // f) * f; y1 = (rect[1] // f) * f
+            x2 = min(self.W, -(-rect[2] // f) * f); y2 = min(self.H, -(-rect[3] // f) * f)
+            if x1 >= x2 or y1 >= y2:
+                continue
+            self.levels[k].paste(src.crop((x1, y1, x2, y2)).reduce(f), (x1 // f, y1 // f))
+        if self._last is not None:
+            self._patch_view(rect)
+
+    def _patch_view(self, rect: Rect) -> None:
+        _, img, tr, k = self._last  # type: ignore[misc]
+        f = 2 ** k
+        lvl = self.levels[k]
+        sx, sy = tr.scale
+        # 脏区映射到显示坐标，外扩 2px 覆盖重采样核
+        dx1 = max(0, int(math.floor((rect[0] - tr.origin[0]) * sx)) - 2)
+        dy1 = max(0, int(math.floor((rect[1] - tr.origin[1]) * sy)) - 2)
+        dx2 = min(img.width, int(math.ceil((rect[2] - tr.origin[0]) * sx)) + 2)
+        dy2 = min(img.height, int(math.ceil((rect[3] - tr.origin[1]) * sy)) + 2)
+        if dx1 >= dx2 or dy1 >= dy2:
+            return
+        if sx == 1.0 / f and sy == 1.0 / f:
+            img.paste(lvl.crop((int(tr.origin[0]) // f + dx1, int(tr.origin[1]) // f + dy1,
+                                int(tr.origin[0]) // f + dx2, int(tr.origin[1]) // f + dy2)), (dx1, dy1))
+            return
+        box = ((tr.origin[0] + dx1 / sx) / f, (tr.origin[1] + dy1 / sy) / f,
+               (tr.origin[0] + dx2 / sx) / f, (tr.origin[1] + dy2 / sy) / f)
+        img.paste(lvl.resize((dx2 - dx1, dy2 - dy1), Image.BILINEAR, box=box), (dx1, dy1))
+
+    def view(self, region: Optional[Rect] = None,
+             max_side: int = DEFAULT_MAX_SIDE) -> Tuple[Image.Image, ViewTransform]:
+        """
+        region（原图坐标，默认整图）缩放到最长边不超过 max_side；不放大。
+        从不低于目标分辨率的最粗层级裁剪，只对该小块做最后一步重采样。
+        """
+        key = (tuple(region) if region is not None else None, int(max_side))
+        if self._last is not None and self._last[0] == key:
+            return self._last[1], self._last[2]
+        x1, y1, x2, y2 = region if region is not None else (0, 0, self.W, self.H)
+        x1 = max(0, int(x1)); y1 = max(0, int(y1)); x2 = min(self.W, int(x2)); y2 = min(self.H, int(y2))
+        if x2 <= x1 or y2 <= y1:
+            x1, y1, x2, y2 = 0, 0, self.W, self.H
+        rw, rh = x2 - x1, y2 - y1
+        s = min(1.0, float(max_side) / float(max(rw, rh)))
+        k = max(0, min(len(self.levels) - 1, int(math.floor(math.log2(1.0 / s))) if s < 1.0 else 0))
+        f = 2 ** k
+        lvl = self.levels[k]
+        crop = lvl.crop((x1 // f, y1 // f, min(lvl.width, -(-x2 // f)), min(lvl.height, -(-y2 // f))))
+        # 以层级裁剪框的实际覆盖范围为准（对齐到 f 后可能略大于 region）
+        ox, oy = (x1 // f) * f, (y1 // f) * f
+        cw, ch = crop.width * f, crop.height * f
+        out_w = max(1, int(round(cw * s))); out_h = max(1, int(round(ch * s)))
+        if (out_w, out_h) != crop.size:
+            crop = crop.resize((out_w, out_h), Image.BILINEAR)
+        tr = ViewTransform((ox, oy), (out_w / float(cw), out_h / float(ch)), (out_w, out_h))
+        self._last = (key, crop, tr, k)
+        return crop, tr
+
+def parse_region(s: str) -> Optional[Rect]:
+    """'x1,y1,x2,y2'（原图像素）→ Rect；空或非法时返回 None（整图）"""
+    try:
+        x1, y1, x2, y2 = [int(float(v)) for v in (s or "").split(",")]
+    except ValueError:
+        return None
+    return (min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2))
+
+__all__ = ["ViewTransform", "PreviewPyramid", "parse_region", "DEFAULT_MAX_SIDE"]
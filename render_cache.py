@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+render_cache.py — Gradio 编辑器的增量渲染
+- 底图只转换一次 RGBA；合成结果（RGB）常驻，每次编辑原地更新
+- 每个气泡（圆 + 引出线 + 编号）单独画成小 RGBA 贴片，按 (位置, 编号, 文本框) 签名缓存
+- 条目变化时只重画变化的贴片，并只对“变化前后贴片覆盖的矩形”重新合成：
+  取底图该区域，按条目顺序叠加与之相交的贴片，再贴回结果图。一次编辑的开销与变化范围成正比，与图幅无关
+- 样式参数（半径、字体、锚点、偏移、布局）变化时整体重建
+- 合成结果上挂一个 preview.PreviewPyramid，脏区同步刷新各缩小层；界面只传 preview() 的限尺寸视图
+导出仍用 drawing.draw_bubbles 整图渲染；两者在气泡互不重叠处逐像素一致。
+"""
+from __future__ import annotations
+
+import uuid
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from PIL import Image, ImageDraw
+
+from .drawing import bubble_colors, bubble_extent, draw_bubble, load_font
+from .layout import layout_bubbles
+from .preview import DEFAULT_MAX_SIDE, PreviewPyramid, ViewTransform
+from .spatial import GridIndex
+
+Rect = Tuple[int, int, int, int]
+Sig = Tuple[Any, ...]
+
+class _Sprite:
+    __slots__ = ("rect", "image")
+
+    def __init__(self, rect: Rect, image: Image.Image):
+        self.rect = rect
+        self.image = image
+
+def _sig(it: Dict[str, Any], idx: int, center: Tuple[float, float]) -> Sig:
+    box = it.get("box")
+    box_t = tuple((float(x), float(y)) for (x, y) in box) if box and len(box) == 4 else None
+    return (round(center[0], 3), round(center[1], 3), str(it.get("bubble_id", idx)), box_t)
+
+def _merge_rects(rects: List[Rect], limit: int = 32) -> List[Rect]:
+    """合并相交的脏矩形；数量仍过多时退化为一个总包围框"""
+    out: List[Rect] = []
+    for r in sorted(rects):
+        for k, o in enumerate(out):
+            if r[0] <= o[2] and o[0] <= r[2] and r[1] <= o[3] and o[1] <= r[3]:
+                out[k] = (min(r[0], o[0]), min(r[1], o[1]), max(r[2], o[2]), max(r[3], o[3]))
+                break
+        else:
+            out.append(r)
+    if len(out) > limit:
+        out = [(min(r[0] for r in out), min(r[1] for r in out), max(r[2] for r in out), max(r[3] for r in out))]
+    return out
+
+class BubbleRenderer:
+    def __init__(
+        self,
+        img: Image.Image,
+        radius: int = 18,
+        text_scale: float = 1.2,
+        font_path: Optional[str] = None,
+        anchor: str = "tr",
+        offset: Tuple[int, int] = (10, -10),
+        avoid_text: bool = False,
+        layout: str = "greedy",
+        layout_budget: float = 0.2
+    ):
+        self.source = img
+        # 会话状态可能被拷贝：在图像 info 里留一个标记，用它而不是对象身份判断是否同一张图
+        self.token = uuid.uuid4().hex
+        img.info["bubble_renderer"] = self.token
+        self.base = img.convert("RGBA")
+        self.out = img.convert("RGB")
+        self.W, self.H = self.base.size
+        self.pyramid = PreviewPyramid(self.out)
+        self.settings: Tuple[Any, ...] = ()
+        self._sprites: Dict[Sig, _Sprite] = {}
+        self._sigs: List[Sig] = []
+        self._geom_key: Optional[Tuple[Any, ...]] = None
+        self._positions: List[Tuple[float, float]] = []
+        self.configure(radius, text_scale, font_path, anchor, offset, avoid_text, layout, layout_budget)
+
+    def configure(self, radius: int = 18, text_scale: float = 1.2, font_path: Optional[str] = None,
+                  anchor: str = "tr", offset: Tuple[int, int] = (10, -10), avoid_text: bool = False,
+                  layout: str = "greedy", layout_budget: float = 0.2) -> None:
+        """更新样式参数；与当前不同时丢弃全部贴片，下次 render 整体重建"""
+        settings = (int(radius), float(text_scale), font_path or None, anchor, tuple(offset), bool(avoid_text),
+                    layout, float(layout_budget))
+        if settings == self.settings:
+            return
+        self.settings = settings
+        self.radius, self.text_scale, self.font_path, self.anchor, self.offset, self.avoid_text, \
+            self.layout, self.layout_budget = settings
+        self.font = load_font(self.font_path, self.radius, self.text_scale)
+        self.colors = bubble_colors()
+        self._sprites.clear()
+        self._geom_key = None
+        if self._sigs:
+            self._sigs = []
+            self.out.paste(self.source.convert("RGB"))
+            self.pyramid.update((0, 0, self.W, self.H))
+
+    def matches(self, img: Image.Image) -> bool:
+        return img is self.source or img.info.get("bubble_renderer") == self.token
+
+    def _layout(self, items: List[Dict[str, Any]]) -> List[Tuple[float, float]]:
+        # 只改编号 / 文本时几何不变，直接复用上次的气泡位置（global 布局较贵）
+        key = tuple(tuple(map(tuple, it["box"])) if it.get("box") and len(it["box"]) == 4
+                    else ("c",) + tuple(it.get("center", ())) for it in items)
+        if key != self._geom_key:
+            self._positions = layout_bubbles(items, self.W, self.H, radius=self.radius, anchor=self.anchor,
+                                             offset=self.offset, avoid_overlap=True, avoid_text=self.avoid_text,
+                                             method=self.layout, time_budget=self.layout_budget)
+            self._geom_key = key
+        return self._positions
+
+    @property
+    def positions(self) -> List[Tuple[float, float]]:
+        """最近一次 render 的气泡圆心（与 items 顺序一致）"""
+        return list(self._positions)
+
+    def _sprite(self, it: Dict[str, Any], idx: int, center: Tuple[float, float]) -> _Sprite:
+        x1, y1, x2, y2 = bubble_extent(it, center, self.radius)
+        layer = Image.new("RGBA", (max(1, x2 - x1), max(1, y2 - y1)), (0, 0, 0, 0))
+        draw_bubble(ImageDraw.Draw(layer, "RGBA"), it, idx, center, self.radius, self.font, self.colors,
+                    origin=(x1, y1))
+        return _Sprite((x1, y1, x2, y2), layer)
+
+    def _clip(self, r: Rect) -> Optional[Rect]:
+        c = (max(0, r[0]), max(0, r[1]), min(self.W, r[2]), min(self.H, r[3]))
+        return c if c[0] < c[2] and c[1] < c[3] else None
+
+    def _composite(self, rect: Rect, order: List[Sig], index: GridIndex) -> None:
+        region = self.base.crop(rect)
+        for k in sorted(index.owners_in(rect[0], rect[1], rect[2] - 1, rect[3] - 1)):
+            sp = self._sprites[order[k]]
+            ix1, iy1 = max(rect[0], sp.rect[0]), max(rect[1], sp.rect[1])
+            ix2, iy2 = min(rect[2], sp.rect[2]), min(rect[3], sp.rect[3])
+            if ix1 >= ix2 or iy1 >= iy2:
+                continue
+            region.alpha_composite(sp.image, dest=(ix1 - rect[0], iy1 - rect[1]),
+                                   source=(ix1 - sp.rect[0], iy1 - sp.rect[1], ix2 - sp.rect[0], iy2 - sp.rect[1]))
+        self.out.paste(region.convert("RGB"), rect[:2])
+        self.pyramid.update(rect)
+
+    def render(self, items: List[Dict[str, Any]]) -> Image.Image:
+        """
+        按 items 的当前状态更新并返回合成图（常驻对象，下次 render 会原地修改；需要保留时自行 copy）
+        """
+        positions = self._layout(items)
+        sigs: List[Sig] = []
+        for idx, (it, center) in enumerate(zip(items, positions), start=1):
+            sig = _sig(it, idx, center)
+            sigs.append(sig)
+            if sig not in self._sprites:
+                self._sprites[sig] = self._sprite(it, idx, center)
+
+        old, new = Counter(self._sigs), Counter(sigs)
+        changed = list((old - new).keys()) + list((new - old).keys())
+        if not changed and sigs == self._sigs:
+            return self.out
+        # 顺序变化也会影响重叠处的叠放次序：把这些贴片也计入脏区
+        if not changed:
+            changed = [a for a, b in zip(sigs, self._sigs) if a != b]
+
+        dirty = [c for c in (self._clip(self._sprites[s].rect) for s in changed) if c is not None]
+        index = GridIndex(cell=max(64.0, self.radius * 6.0))
+        for k, s in enumerate(sigs):
+            index.add_rect(self._sprites[s].rect, owner=k)
+        for rect in _merge_rects(dirty):
+            self._composite(rect, sigs, index)
+
+        for s in list(old - new):
+            if s not in new:
+                self._sprites.pop(s, None)
+        self._sigs = sigs
+        return self.out
+
+    def preview(self, region: Optional[Rect] = None,
+                max_side: int = DEFAULT_MAX_SIDE) -> Tuple[Image.Image, ViewTransform]:
+        """当前合成图的限尺寸视图（整图或 region 放大），及显示→原图坐标变换"""
+        return self.pyramid.view(region, max_side=max_side)
+
+__all__ = ["BubbleRenderer"]
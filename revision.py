@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+"""
+revision.py — 图纸改版的增量处理
+- 新旧两版原图（不是带气泡的标注图）逐像素比较：灰度差按 cell×cell 小格计数（复用 premask.ink_grid），
+  超过阈值的小格外扩一格后连成矩形区域；与区域相交的旧条目框并入区域，保证文本不被切开
+- 只对变化区域裁图 OCR（整批 ocr_images，命中 OCR 缓存）；回放后端与 PDF 文本层整页读取后按区域筛选
+- 区域外的旧条目原样保留（bubble_id 不变）；区域内新旧条目按框 IoU 配对：
+  文本 / 类型相同为未变，不同为修改（沿用旧 bubble_id），未配上的新条目为新增（按阅读顺序接在最大编号之后），
+  未配上的旧条目为删除（编号空出，不重排）
+- 两版尺寸不同（重新出图改了幅面 / DPI）时整页重识别，仍按 IoU 配对沿用编号
+- 输出与 run 相同（标注图 + CSV/XLSX/JSON），另写变更报告 {stem}_changes.json
+只处理单页（多页文件用 --page 指定页码）；扫描件若有整体平移，差异会覆盖大部分图面，效果接近整页重识别
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image, ImageChops
+
+from .premask import ink_grid, blank_zones, premask_zones
+from .pages import decode_page
+from .cleaning import clean_items
+from .sorting import sort_reading_order
+from .drawing import draw_bubbles
+from .backends import ReplayBackend
+from .metrics import Metrics, collecting, stage
+from .pipeline import (Log, backend_spec, load_and_ocr, ocr_images, parse_excludes, write_outputs,
+                       _attach_metrics)
+
+Rect = Tuple[float, float, float, float]
+
+def _components(mask: np.ndarray) -> List[Tuple[int, int, int, int]]:
+    """二值小格图的 8 连通区域 → 外接框 (r1, c1, r2, c2)，右下不含"""
+    seen = np.zeros_like(mask, dtype=bool)
+    gh, gw = mask.shape
+    out = []
+    for r0, c0 in zip(*np.nonzero(mask)):
+        if seen[r0, c0]:
+            continue
+        seen[r0, c0] = True
+        stack = [(int(r0), int(c0))]
+        r1, c1, r2, c2 = r0, c0, r0, c0
+        while stack:
+            r, c = stack.pop()
+            r1, c1, r2, c2 = min(r1, r), min(c1, c), max(r2, r), max(c2, c)
+            for rr in (r - 1, r, r + 1):
+                for cc in (c - 1, c, c + 1):
+                    if 0 <= rr < gh and 0 <= cc < gw and mask[rr, cc] and not seen[rr, cc]:
+                        seen[rr, cc] = True
+                        stack.append((rr, cc))
+        out.append((int(r1), int(c1), int(r2) + 1, int(c2) + 1))
+    return out
+
+def _overlaps(a: Rect, b: Rect) -> bool:
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+def merge_rects(rects: Sequence[Rect]) -> List[Rect]:
+    """合并相交的矩形，直到两两不相交"""
+    rects = [tuple(r) for r in rects]
+    merged = True
+    while merged:
+        merged = False
+        out: List[Rect] = []
+        for r in rects:
+            for k, o in enumerate(out):
+                if _overlaps(r, o):
+                    out[k] = (min(r[0], o[0]), min(r[1], o[1]), max(r[2], o[2]), max(r[3], o[3]))
+                    merged = True
+                    break
+            else:
+                out.append(r)
+        rects = out
+    return rects
+
+def changed_regions(old: Image.Image, new: Image.Image, cell: int = 32, threshold: int = 48,
+                    min_pixels: int = 6, pad: int = 16) -> List[Rect]:
+    """
+    新旧原图的变化区域（像素坐标，互不相交）。灰度差 > threshold 的像素在小格内达到 min_pixels 即算变化
+    （抗锯齿 / JPEG 噪声只有零星几个像素）；尺寸不同时返回整页
+    """
+    W, H = new.size
+    if old.size != new.size:
+        return [(0.0, 0.0, float(W), float(H))]
+    diff = ImageChops.invert(ImageChops.difference(old.convert("L"), new.convert("L")))
+    grid = ink_grid(np.asarray(diff), cell, ink_thr=255 - threshold)
+    mask = grid >= min_pixels
+    if not mask.any():
+        return []
+    # 外扩一格：笔画边缘的变化常落在相邻小格里不足 min_pixels
+    grown = mask.copy()
+    grown[1:] |= mask[:-1]; grown[:-1] |= mask[1:]
+    grown[:, 1:] |= grown[:, :-1].copy(); grown[:, :-1] |= grown[:, 1:].copy()
+    rects = [(max(0.0, c1 * cell - pad), max(0.0, r1 * cell - pad), min(float(W), c2 * cell + pad),
+              min(float(H), r2 * cell + pad)) for r1, c1, r2, c2 in _components(grown)]
+    return merge_rects(rects)
+
+def _bboxes(items: Sequence[Dict[str, Any]]) -> np.ndarray:
+    if not items:
+        return np.zeros((0, 4))
+    q = np.array([it["box"] for it in items], dtype=np.float64).reshape(len(items), 4, 2)
+    return np.concatenate([q.min(axis=1), q.max(axis=1)], axis=1)
+
+def expand_to_items(regions: Sequence[Rect], boxes: np.ndarray, size: Tuple[int, int]) -> List[Rect]:
+    """把与区域相交的旧条目框并入区域（重复到稳定），避免裁图把文本切成两半"""
+    regions = list(regions)
+    while True:
+        out = []
+        for r in regions:
+            hit = (boxes[:, 0] < r[2]) & (r[0] < boxes[:, 2]) & (boxes[:, 1] < r[3]) & (r[1] < boxes[:, 3])
+            if hit.any():
+                b = boxes[hit]
+                r = (min(r[0], float(b[:, 0].min())), min(r[1], float(b[:, 1].min())),
+                     min(float(size[0]), max(r[2], float(b[:, 2].max()))),
+                     min(float(size[1]), max(r[3], float(b[:, 3].max()))))
+            out.append(r)
+        out = merge_rects(out)
+        if out == regions:
+            return out
+        regions = out
+
+def _inside(centers: np.ndarray, regions: Sequence[Rect]) -> np.ndarray:
+    if not len(centers) or not regions:
+        return np.zeros(len(centers), dtype=bool)
+    z = np.asarray(regions, dtype=np.float64)
+    cx, cy = centers[:, 0:1], centers[:, 1:2]
+    return ((z[:, 0] <= cx) & (cx < z[:, 2]) & (z[:, 1] <= cy) & (cy < z[:, 3])).any(axis=1)
+
+def match_items(old_boxes: np.ndarray, new_boxes: np.ndarray, min_iou: float = 0.3) -> List[Tuple[int, int]]:
+    """按外接框 IoU 从大到小贪心一对一配对，返回 (旧下标, 新下标)"""
+    if not len(old_boxes) or not len(new_boxes):
+        return []
+    a, b = old_boxes[:, None, :], new_boxes[None, :, :]
+    iw = np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+    ih = np.clip(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None)
+    inter = iw * ih
+    area = lambda q: (q[..., 2] - q[..., 0]) * (q[..., 3] - q[..., 1])
+    iou = inter / np.maximum(area(a) + area(b) - inter, 1e-9)
+    pairs = []
+    used_o, used_n = set(), set()
+    for k in np.argsort(-iou, axis=None).tolist():
+        i, j = divmod(k, iou.shape[1])
+        if iou[i, j] < min_iou:
+            break
+        if i in used_o or j in used_n:
+            continue
+        used_o.add(i); used_n.add(j)
+        pairs.append((i, j))
+    return pairs
+
+def ocr_regions(img: Image.Image, regions: Sequence[Rect], input_path: str, opts: Dict[str, Any],
+                has_text_layer: bool) -> List[Dict[str, Any]]:
+    """变化区域内的原始条目（原图坐标）"""
+    if not regions:
+        return []
+    if has_text_layer or backend_spec(opts)[0] == ReplayBackend.name:
+        # 文本层 / 回放：整页读取本来就是毫秒级，按区域筛选即可
+        _, items, _ = load_and_ocr(input_path, opts)
+        centers = np.array([it["center"] for it in items], dtype=np.float64).reshape(len(items), 2)
+        return [it for it, ok in zip(items, _inside(centers, regions).tolist()) if ok]
+    if opts.get("premask") == "zones":
+        img = blank_zones(img, premask_zones(img.width, img.height, parse_excludes(opts.get("exclude", ""))))
+    boxes = [tuple(int(round(v)) for v in r) for r in regions]
+    crops = [img.crop(b) for b in boxes]
+    out: List[Dict[str, Any]] = []
+    for (x0, y0, _, _), (items, _) in zip(boxes, ocr_images(crops, opts)):
+        for it in items:
+            it = dict(it)
+            it["box"] = [(float(x) + x0, float(y) + y0) for x, y in it["box"]]
+            it["center"] = (float(it["center"][0]) + x0, float(it["center"][1]) + y0)
+            out.append(it)
+    return out
+
+def _brief(it: Dict[str, Any]) -> Dict[str, Any]:
+    return {"bubble_id": it.get("bubble_id"), "text": it.get("text", ""), "type": it.get("type"),
+            "center": [round(float(it["center"][0]), 2), round(float(it["center"][1]), 2)]}
+
+def revise_document(input_path: str, prev_json: str, prev_image: str, opts: Dict[str, Any],
+                    out_dir: Optional[str] = None, stem: Optional[str] = None, log: Log = print) -> Dict[str, Any]:
+    """
+    以上一版的结果（prev_json = {stem}_dims.json，prev_image = 上一版原图）为基准处理新版 input_path。
+    返回与 process_document 相同结构的摘要，另含 "changes"（变更统计）
+    """
+    out_dir = out_dir or opts.get("out_dir", "out")
+    stem = stem or Path(input_path).stem
+    page = int(opts.get("page") or 1)
+    m = Metrics(str(input_path))
+    t0 = time.perf_counter()
+    with collecting(m):
+        with stage("load"):
+            img, text_items, _ = decode_page(input_path, page, opts)
+            old_img = decode_page(prev_image, page, opts)[0]
+            with open(prev_json, "r", encoding="utf-8") as f:
+                old_items: List[Dict[str, Any]] = json.load(f)
+        old_items = [it for it in old_items if int(it.get("page") or page) == page]
+        for k, it in enumerate(old_items, start=1):
+            it.setdefault("bubble_id", k)
+        W, H = img.size
+        log(f"[INFO] revision: {input_path} ({W}x{H}) vs {prev_image}; previous items: {len(old_items)}")
+
+        with stage("revise.diff") as rec:
+            old_boxes = _bboxes(old_items)
+            regions = changed_regions(old_img, img, cell=int(opts.get("diff_cell") or 32),
+                                      threshold=int(opts.get("diff_threshold") or 48),
+                                      pad=int(opts.get("region_pad") or 16))
+            regions = expand_to_items(regions, old_boxes, (W, H)) if regions else []
+            rec.items = len(regions)
+        del old_img
+        area = sum((r[2] - r[0]) * (r[3] - r[1]) for r in regions) / float(W * H)
+        log(f"[INFO] changed regions: {len(regions)} ({area:.1%} of the sheet)")
+
+        raw = ocr_regions(img, regions, input_path, opts, text_items is not None)
+        with stage("clean") as rec:
+            fresh = clean_items(raw, W, H, min_conf=opts.get("min_conf", 0.60),
+                                custom_excludes=parse_excludes(opts.get("exclude", "")))
+            rec.items = len(fresh)
+
+        with stage("revise.match"):
+            old_centers = np.array([it["center"] for it in old_items], dtype=np.float64).reshape(len(old_items), 2)
+            touched = _inside(old_centers, regions)
+            kept = [it for it, t in zip(old_items, touched.tolist()) if not t]
+            cand = [it for it, t in zip(old_items, touched.tolist()) if t]
+            pairs = match_items(_bboxes(cand), _bboxes(fresh))
+            matched_new = {j for _, j in pairs}
+            matched_old = {i for i, _ in pairs}
+            unchanged, modified = 0, []
+            items: List[Dict[str, Any]] = list(kept)
+            for i, j in pairs:
+                it = dict(fresh[j], bubble_id=cand[i]["bubble_id"])
+                if (it.get("text") or "").strip() == (cand[i].get("text") or "").strip() and it.get("type") == cand[i].get("type"):
+                    unchanged += 1
+                else:
+                    modified.append({"bubble_id": it["bubble_id"], "old": _brief(cand[i]), "new": _brief(it)})
+                items.append(it)
+            added = [fresh[j] for j in range(len(fresh)) if j not in matched_new]
+            added = sort_reading_order(added, method=opts.get("sort", "rows"), deskew=bool(opts.get("deskew")),
+                                       zone_grid=tuple(opts.get("zone_grid") or (8, 6)), size=(W, H))
+            next_id = max([int(it["bubble_id"]) for it in old_items] or [0]) + 1
+            for k, it in enumerate(added):
+                it["bubble_id"] = next_id + k
+            items.extend(added)
+            items.sort(key=lambda it: int(it["bubble_id"]))
+            removed = [_brief(cand[i]) for i in range(len(cand)) if i not in matched_old]
+
+        dx, dy = opts.get("offset", (10, -10))
+        with stage("draw", items=len(items)):
+            anno = draw_bubbles(img, items, radius=opts.get("bubble_radius", 18), text_scale=opts.get("label_scale", 1.2),
+                                font_path=opts.get("font"), anchor=opts.get("anchor", "tr"), offset=(dx, dy),
+                                avoid_overlap=True, avoid_text=bool(opts.get("avoid_text")),
+                                layout=opts.get("layout", "greedy"),
+                                layout_budget=float(opts.get("layout_budget_ms", 200)) / 1000.0)
+        paths = write_outputs(items, anno, out_dir, stem, Path(input_path).name, log=log, opts=opts)
+
+    changes = {
+        "previous": {"json": str(prev_json), "image": str(prev_image)},
+        "regions": [[round(v, 1) for v in r] for r in regions],
+        "changed_area": round(area, 4),
+        "carried": len(kept), "unchanged": unchanged,
+        "added": [_brief(it) for it in added], "removed": removed, "modified": modified,
+        "seconds": round(time.perf_counter() - t0, 3),
+    }
+    out_changes = str(Path(out_dir) / f"{stem}_changes.json")
+    with open(out_changes, "w", encoding="utf-8") as f:
+        json.dump(changes, f, ensure_ascii=False, indent=2)
+    paths["changes"] = out_changes
+    log(f"[OK] changes: +{len(added)} -{len(removed)} ~{len(modified)} "
+        f"(carried {len(kept)}, re-read unchanged {unchanged}) -> {out_changes}")
+    summary = {"input": str(input_path), "size": [W, H], "mode": "revision", "raw_items": len(raw),
+               "items": len(items), "outputs": paths,
+               "changes": {"added": len(added), "removed": len(removed), "modified": len(modified),
+                           "carried": len(kept), "unchanged": unchanged, "changed_area": changes["changed_area"]}}
+    _attach_metrics(summary, m, opts, out_dir, stem, log)
+    return summary
+
+def add_revise_args(ap: argparse.ArgumentParser) -> None:
+    ap.add_argument("--input", required=True, help="Revised drawing (image, or PDF with --page)")
+    ap.add_argument("--prev_json", required=True, help="Previous run's <stem>_dims.json (bubble ids are carried over)")
+    ap.add_argument("--prev_image", required=True, help="Previous revision's original (un-bubbled) image or PDF")
+    ap.add_argument("--page", type=int, default=None, help="Page of a multi-page PDF/TIFF (1-based; default 1)")
+    ap.add_argument("--diff_threshold", type=int, default=48, help="Gray-level difference counted as a changed pixel")
+    ap.add_argument("--diff_cell", type=int, default=32, help="Diff grid cell size in pixels")
+    ap.add_argument("--region_pad", type=int, default=16, help="Padding around changed regions before re-OCR")
+
+__all__ = ["revise_document", "changed_regions", "expand_to_items", "match_items", "merge_rects", "ocr_regions",
+           "add_revise_args"]
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 import re
+from functools import lru_cache
 from typing import Optional
 
 # -----------------------------
@@ -31,3 +32,30 @@ def classify_text(t: str) -> Optional[str]:
     if _GRID_NUM.match(s):
         return "LEN"
     return None
+
+# -----------------------------
+# Combined classifier (same result as classify_text)
+# -----------------------------
+# 各分支仍是原来的锚定正则，按 classify_text 的判断顺序排成一条交替式：
+# 先排除的几类 → 各尺寸类型（_DIM_PATTERNS 的顺序）→ 网格数字。re.match 取第一个整体匹配的分支，
+# 与逐个尝试的结果一致；外层命名组最后闭合，m.lastgroup 即为命中的分支名
+_SKIP_PATTERNS = (_SECTION, _MISC_SKIP, _GRID_LET, _DATE_FMT)
+_COMBINED = re.compile("|".join(
+    [f"(?P<SKIP{i}>{p.pattern})" for i, p in enumerate(_SKIP_PATTERNS)] +
+    [f"(?P<{k}>{p.pattern})" for k, p in _DIM_PATTERNS.items()] +
+    [f"(?P<GRIDNUM>{_GRID_NUM.pattern})"]
+))
+
+@lru_cache(maxsize=65536)
+def classify_text_cached(s: str) -> Optional[str]:
+    """classify_text 的单正则 + 记忆化版本；图纸上大量重复的文本（如相同尺寸）只匹配一次"""
+    s = (s or "").strip()
+    if not s:
+        return None
+    m = _COMBINED.match(s)
+    if m is None:
+        return None
+    k = m.lastgroup
+    if k is None or k.startswith("SKIP"):
+        return None
+    return "LEN" if k == "GRIDNUM" else k
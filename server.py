@@ -0,0 +1,460 @@
+# -*- coding: utf-8 -*-
+"""
+server.py — 本地 HTTP 推理服务（serve 子命令），只用标准库 asyncio
+- POST /v1/process：请求体为图像 / PDF（原始字节，或 multipart/form-data 的第一个文件），
+  查询参数可覆盖部分流水线选项（min_conf、lang、page、sort…）；返回 JSON：条目、CSV 文本、标注图（base64 JPEG）
+- 有界队列：排队数达到 queue_size 时直接返回 429（带 Retry-After），不在内存里无限堆积请求体
+- workers 个调度协程各自取一批请求（最多 max_batch 个，首个请求到达后最多再等 batch_wait_ms），
+  在线程池里解码 → 同一 OCR 设置的光栅页合成一次 ocr_images（跨请求组批，走 run_ocr_batch）→ 逐个清洗 / 绘制；
+  引擎池保留 workers 份已加载的模型，启动时全部预热
+- GET /healthz：存活与队列状态；GET /metrics：Prometheus 文本格式的请求数、队列深度、批大小与各阶段累计耗时
+- 离线测试：--ocr-backend replay --replay xxx_dims.json，不需要模型
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import base64
+import csv
+import email.parser
+import email.policy
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from .backends import PdfTextBackend, ReplayBackend, checkout_backend, engine_pool_limits, reserve_engine_pool
+from .exporter import columns_for, iter_rows
+from .metrics import Metrics, aggregate, collecting, stage
+from .pages import decode_page
+from .pdf_text import ocr_fallback
+from .pipeline import annotate, backend_spec, engine_copies, ocr_image, ocr_images, ocr_settings
+from .premask import MODES as PREMASK_MODES
+from .sorting import METHODS as SORT_METHODS
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 411: "Length Required",
+            413: "Payload Too Large", 422: "Unprocessable Entity", 429: "Too Many Requests",
+            500: "Internal Server Error", 503: "Service Unavailable", 504: "Gateway Timeout"}
+
+_SUFFIX = {"application/pdf": ".pdf", "image/tiff": ".tif", "image/png": ".png", "image/jpeg": ".jpg",
+           "image/bmp": ".bmp", "image/webp": ".webp"}
+
+def _flag(v: str) -> bool:
+    return v.lower() in ("1", "true", "yes", "on")
+
+def _choice(*values: str):
+    """枚举参数：不在取值范围内时抛 ValueError（_submit 里转成 400，而不是到 worker 里才失败成 500）"""
+    def conv(v: str) -> str:
+        if v not in values:
+            raise ValueError(f"expected one of {', '.join(values)}")
+        return v
+    return conv
+
+# 每个请求可覆盖的选项（其余沿用 serve 启动参数）；枚举值与 CLI choices 一致
+REQUEST_PARAMS = {
+    "min_conf": float, "lang": str, "page": int, "sort": _choice(*SORT_METHODS), "deskew": _flag, "exclude": str,
+    "bubble_radius": int, "label_scale": float, "anchor": _choice("tl", "tr", "bl", "br"), "avoid_text": _flag,
+    "layout": _choice("greedy", "global"), "rescue_band": float, "premask": _choice(*PREMASK_MODES),
+    "pdf_mode": _choice("text", "ocr"), "pdf_dpi": float,
+}
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str, headers: Optional[Dict[str, str]] = None, close: bool = False):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+        self.close = close  # 请求体未读完，连接不能复用
+
+class Job:
+    __slots__ = ("id", "data", "suffix", "opts", "want_image", "want_csv", "future", "queued_at")
+
+    def __init__(self, job_id: int, data: bytes, suffix: str, opts: Dict[str, Any], want_image: bool,
+                 want_csv: bool, future: "asyncio.Future[Dict[str, Any]]"):
+        self.id = job_id
+        self.data = data
+        self.suffix = suffix
+        self.opts = opts
+        self.want_image = want_image
+        self.want_csv = want_csv
+        self.future = future
+        self.queued_at = time.perf_counter()
+
+def _csv_text(items: Any, image_name: str) -> str:
+    buf = io.StringIO()
+    cols = columns_for(items)
+    w = csv.writer(buf, lineterminator="\n")
+    w.writerow(cols)
+    for row in iter_rows(items, image_name):
+        w.writerow([row.get(c, "") for c in cols])
+    return buf.getvalue()
+
+class InferenceServer:
+    def __init__(self, opts: Dict[str, Any], host: str = "127.0.0.1", port: int = 8080, workers: int = 2,
+                 queue_size: int = 32, max_batch: int = 8, batch_wait_ms: float = 20.0,
+                 max_body_mb: float = 100.0, request_timeout: float = 300.0, warmup: bool = True):
+        self.opts = dict(opts)
+        self.host, self.port = host, int(port)
+        self.workers = max(1, int(workers))
+        self.queue_size = max(1, int(queue_size))
+        self.max_batch = max(1, int(max_batch))
+        self.batch_wait = max(0.0, float(batch_wait_ms)) / 1000.0
+        self.max_body = int(float(max_body_mb) * 1024 * 1024)
+        self.request_timeout = float(request_timeout)
+        self.warmup = warmup
+        self.queue: Optional[asyncio.Queue] = None
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._tasks: List[asyncio.Task] = []
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.ready = False
+        # —— 统计
+        self.requests: Dict[int, int] = {}
+        self.inflight = 0
+        self.batches = 0
+        self.batched_jobs = 0
+        self.latency_sum = 0.0
+        self.latency_count = 0
+        self.stage_totals: Dict[str, Any] = aggregate([], name="serve")
+
+    # ---------------- lifecycle ----------------
+    async def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bubble-serve")
+        # 每个 worker 一份引擎（分块模式再乘 tile_workers）；只调高，之后的请求不会把上限改回去
+        reserve_engine_pool(engine_copies(self.opts, self.workers))
+        if self.warmup:
+            await loop.run_in_executor(self.executor, self._warm_engines)
+        self._tasks = [asyncio.create_task(self._dispatch()) for _ in range(self.workers)]
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self.ready = True
+
+    def _warm_engines(self) -> None:
+        """同时借出 workers 份引擎并各跑一次，池中留下 workers 个已加载的实例"""
+        backend, options = backend_spec(self.opts)
+        with ExitStack() as st:
+            engines = [st.enter_context(checkout_backend(backend, self.opts.get("lang", "en"),
+                                                         self.opts.get("det_model_dir"), self.opts.get("rec_model_dir"),
+                                                         options)) for _ in range(self.workers)]
+            for be in engines:
+                be.warmup()
+
+    async def serve_forever(self) -> None:
+        await self.start()
+        print(f"[INFO] serving on http://{self.host}:{self.port} "
+              f"({self.workers} workers, queue {self.queue_size}, batch ≤{self.max_batch})")
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def stop(self) -> None:
+        self.ready = False
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+
+    # ---------------- batching ----------------
+    async def _dispatch(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.batch_wait
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self.queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                left = deadline - loop.time()
+                if left <= 0:
+                    break
+                # 轮询而不是 wait_for(queue.get())：超时取消 get 时可能丢掉刚取到的请求
+                await asyncio.sleep(min(left, 0.002))
+            live = [j for j in batch if not j.future.done()]  # 客户端已超时 / 断开的不再处理
+            if not live:
+                continue
+            self.inflight += len(live)
+            try:
+                results = await loop.run_in_executor(self.executor, self._run_batch, live)
+            except Exception as e:
+                results = [HttpError(500, f"{type(e).__name__}: {e}")] * len(live)
+            finally:
+                self.inflight -= len(live)
+            for job, res in zip(live, results):
+                if job.future.done():
+                    continue
+                if isinstance(res, Exception):
+                    job.future.set_exception(res)
+                else:
+                    job.future.set_result(res)
+
+    def _run_batch(self, jobs: List[Job]) -> List[Any]:
+        """工作线程：解码 → 光栅页按 OCR 设置分组、每组一次 ocr_images → 逐个清洗 / 绘制 / 序列化"""
+        m = Metrics(f"batch of {len(jobs)}")
+        out: List[Any] = [None] * len(jobs)
+        with collecting(m):
+            pages: Dict[int, Tuple[Any, Optional[list], list]] = {}
+            for k, job in enumerate(jobs):
+                try:
+                    pages[k] = self._decode(job)
+                except Exception as e:
+                    out[k] = HttpError(422, f"cannot decode input: {type(e).__name__}: {e}")
+
+            raw: Dict[int, Tuple[List[Dict[str, Any]], str]] = {}
+            groups: Dict[str, List[int]] = {}
+            for k, (img, text_items, regions) in pages.items():
+                opts = jobs[k].opts
+                if text_items is None:
+                    groups.setdefault(json.dumps(ocr_settings(opts), sort_keys=True, default=str), []).append(k)
+                elif backend_spec(opts)[0] == PdfTextBackend.name:
+                    raw[k] = (text_items, "pdf-text")
+                else:
+                    raw[k] = ocr_fallback(img, text_items, regions, lambda im, o=opts: ocr_image(im, o),
+                                          full_page=backend_spec(opts)[0] == ReplayBackend.name)
+            for idx in groups.values():
+                opts = dict(jobs[idx[0]].opts, ocr_batch=len(idx))
+                try:
+                    for k, res in zip(idx, ocr_images([pages[k][0] for k in idx], opts)):
+                        raw[k] = res
+                except Exception as e:
+                    for k in idx:
+                        out[k] = HttpError(500, f"OCR failed: {type(e).__name__}: {e}")
+
+            for k, job in enumerate(jobs):
+                if out[k] is not None or k not in raw:
+                    continue
+                try:
+                    out[k] = self._finish(job, pages[k][0], *raw[k], batch_size=len(jobs))
+                except Exception as e:
+                    out[k] = HttpError(500, f"{type(e).__name__}: {e}")
+        d = m.to_dict()
+        with self._lock:
+            self.batches += 1
+            self.batched_jobs += len(jobs)
+            self.stage_totals = aggregate([self.stage_totals, d], name="serve")
+        return out
+
+    @staticmethod
+    def _decode(job: Job) -> Tuple[Any, Optional[list], list]:
+        fd, path = tempfile.mkstemp(suffix=job.suffix, prefix="bubble_serve_")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(job.data)
+            with stage("load"):
+                img, text_items, regions = decode_page(path, int(job.opts.get("page") or 1), job.opts)
+                img.load()
+            return img, text_items, regions
+        finally:
+            job.data = b""
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _finish(self, job: Job, img: Any, ocr_items: List[Dict[str, Any]], mode: str,
+                batch_size: int) -> Dict[str, Any]:
+        items, anno = annotate(img, ocr_items, job.opts)
+        name = job.opts.get("name") or f"request{job.suffix}"
+        res: Dict[str, Any] = {"id": job.id, "size": list(img.size), "mode": mode, "raw_items": len(ocr_items),
+                               "batch_size": batch_size, "items": items.to_items()}
+        if job.want_csv:
+            with stage("export_tabular", items=len(items)):
+                res["csv"] = _csv_text(items, name)
+        if job.want_image:
+            with stage("save_image"):
+                buf = io.BytesIO()
+                anno.convert("RGB").save(buf, format="JPEG", quality=90)
+                res["image_jpeg_base64"] = base64.b64encode(buf.getvalue()).decode("ascii")
+        return res
+
+    # ---------------- HTTP ----------------
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    method, target, version = line.decode("latin-1").split()
+                except ValueError:
+                    await self._send(writer, 400, {"error": "malformed request line"}, close=True)
+                    break
+                headers: Dict[str, str] = {}
+                while True:
+                    h = await reader.readline()
+                    if h in (b"\r\n", b"\n", b""):
+                        break
+                    k, _, v = h.decode("latin-1").partition(":")
+                    headers[k.strip().lower()] = v.strip()
+                close = headers.get("connection", "").lower() == "close" or version == "HTTP/1.0"
+                try:
+                    body = await self._read_body(reader, headers)
+                    status, payload, extra = await self._route(method, target, headers, body)
+                except HttpError as e:
+                    status, payload, extra = e.status, {"error": str(e)}, e.headers
+                    close = close or e.close
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    raise
+                except Exception as e:
+                    status, payload, extra = 500, {"error": f"{type(e).__name__}: {e}"}, {}
+                self.requests[status] = self.requests.get(status, 0) + 1
+                await self._send(writer, status, payload, extra, close=close)
+                if close:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            try:
+                writer.close()
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+    async def _read_body(self, reader: asyncio.StreamReader, headers: Dict[str, str]) -> bytes:
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            raise HttpError(411, "chunked transfer encoding is not supported; send Content-Length", close=True)
+        try:
+            n = int(headers.get("content-length") or 0)
+        except ValueError:
+            n = -1
+        if n < 0:
+            raise HttpError(400, "bad Content-Length", close=True)
+        if n > self.max_body:
+            raise HttpError(413, f"request body over {self.max_body} bytes", close=True)
+        return await reader.readexactly(n) if n else b""
+
+    async def _send(self, writer: asyncio.StreamWriter, status: int, payload: Any,
+                    extra: Optional[Dict[str, str]] = None, close: bool = False) -> None:
+        if isinstance(payload, (bytes, str)):
+            body = payload.encode("utf-8") if isinstance(payload, str) else payload
+            ctype = (extra or {}).pop("Content-Type", "text/plain; charset=utf-8")
+        else:
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            ctype = "application/json; charset=utf-8"
+        head = [f"HTTP/1.1 {status} {_REASONS.get(status, '')}", f"Content-Type: {ctype}",
+                f"Content-Length: {len(body)}", f"Connection: {'close' if close else 'keep-alive'}"]
+        head += [f"{k}: {v}" for k, v in (extra or {}).items()]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+    async def _route(self, method: str, target: str, headers: Dict[str, str],
+                     body: bytes) -> Tuple[int, Any, Dict[str, str]]:
+        url = urlsplit(target)
+        if url.path == "/healthz":
+            return (200 if self.ready else 503), self.health(), {}
+        if url.path == "/metrics":
+            return 200, self.prometheus(), {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+        if url.path in ("/v1/process", "/process"):
+            if method != "POST":
+                raise HttpError(405, "use POST with the image / PDF as the request body", {"Allow": "POST"})
+            return 200, await self._submit(url.query, headers, body), {}
+        raise HttpError(404, f"no route for {url.path}")
+
+    async def _submit(self, query: str, headers: Dict[str, str], body: bytes) -> Dict[str, Any]:
+        params = {k: v[-1] for k, v in parse_qs(query).items()}
+        data, filename, ctype = body, params.get("name", ""), headers.get("content-type", "").split(";")[0].strip()
+        if ctype == "multipart/form-data":
+            data, filename, ctype = self._first_file(headers["content-type"], body)
+        if not data:
+            raise HttpError(400, "empty request body")
+        suffix = os.path.splitext(filename)[1].lower() or _SUFFIX.get(ctype, "")
+        if not suffix:
+            suffix = ".pdf" if data[:5] == b"%PDF-" else ".png"  # 光栅格式由 PIL 按内容识别
+        opts = dict(self.opts, name=filename or f"request{suffix}")
+        for k, conv in REQUEST_PARAMS.items():
+            if k in params:
+                try:
+                    opts[k] = conv(params[k])
+                except ValueError as e:
+                    raise HttpError(400, f"bad value for {k}: {params[k]!r} ({e})")
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._next_id += 1
+            job_id = self._next_id
+        job = Job(job_id, data, suffix, opts, _flag(params.get("image", "1")), _flag(params.get("csv", "1")),
+                  loop.create_future())
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise HttpError(429, f"queue full ({self.queue_size} pending); retry later", {"Retry-After": "1"})
+        try:
+            res = await asyncio.wait_for(asyncio.shield(job.future), self.request_timeout)
+        except asyncio.TimeoutError:
+            job.future.cancel()
+            raise HttpError(504, f"request not finished within {self.request_timeout:.0f}s")
+        self.latency_sum += time.perf_counter() - job.queued_at
+        self.latency_count += 1
+        res["seconds"] = round(time.perf_counter() - job.queued_at, 4)
+        return res
+
+    @staticmethod
+    def _first_file(content_type: str, body: bytes) -> Tuple[bytes, str, str]:
+        head = b"Content-Type: " + content_type.encode("latin-1") + b"\r\n\r\n"
+        msg = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(head + body)
+        for part in msg.iter_parts() if msg.is_multipart() else []:
+            if part.get_filename() or part.get_content_type() != "text/plain":
+                return part.get_payload(decode=True) or b"", part.get_filename() or "", part.get_content_type()
+        raise HttpError(400, "multipart body has no file part")
+
+    # ---------------- status ----------------
+    def health(self) -> Dict[str, Any]:
+        return {"status": "ok" if self.ready else "starting", "backend": backend_spec(self.opts)[0],
+                "workers": self.workers, "queue": self.queue.qsize() if self.queue else 0,
+                "queue_size": self.queue_size, "inflight": self.inflight,
+                "engines_per_key": engine_pool_limits()[1],
+                "uptime_seconds": round(time.time() - self.started_at, 1)}
+
+    def prometheus(self) -> str:
+        lines = ["# TYPE bubble_requests_total counter"]
+        lines += [f'bubble_requests_total{{code="{c}"}} {n}' for c, n in sorted(self.requests.items())]
+        lines += ["# TYPE bubble_queue_depth gauge", f"bubble_queue_depth {self.queue.qsize() if self.queue else 0}",
+                  "# TYPE bubble_queue_capacity gauge", f"bubble_queue_capacity {self.queue_size}",
+                  "# TYPE bubble_inflight gauge", f"bubble_inflight {self.inflight}",
+                  "# TYPE bubble_engines_per_key gauge", f"bubble_engines_per_key {engine_pool_limits()[1]}",
+                  "# TYPE bubble_batches_total counter", f"bubble_batches_total {self.batches}",
+                  "# TYPE bubble_batched_jobs_total counter", f"bubble_batched_jobs_total {self.batched_jobs}",
+                  "# TYPE bubble_request_seconds summary", f"bubble_request_seconds_sum {self.latency_sum:.4f}",
+                  f"bubble_request_seconds_count {self.latency_count}",
+                  "# TYPE bubble_stage_seconds_total counter"]
+        with self._lock:
+            stages = dict(self.stage_totals["stages"])
+        lines += [f'bubble_stage_seconds_total{{stage="{k}"}} {v["seconds"]}' for k, v in stages.items()]
+        lines += ["# TYPE bubble_stage_calls_total counter"]
+        lines += [f'bubble_stage_calls_total{{stage="{k}"}} {v["calls"]}' for k, v in stages.items()]
+        return "\n".join(lines) + "\n"
+
+def cmd_serve(args: argparse.Namespace) -> None:
+    opts = {k: v for k, v in vars(args).items() if k != "func"}
+    srv = InferenceServer(opts, host=args.host, port=args.port, workers=args.workers, queue_size=args.queue_size,
+                          max_batch=args.max_batch, batch_wait_ms=args.batch_wait_ms, max_body_mb=args.max_body_mb,
+                          request_timeout=args.request_timeout, warmup=not args.no_warmup)
+    try:
+        asyncio.run(srv.serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+def add_serve_args(ap: argparse.ArgumentParser) -> None:
+    ap.add_argument("--host", default="127.0.0.1", help="Bind address (keep 127.0.0.1 unless the drawings may leave the host)")
+    ap.add_argument("--port", type=int, default=8080)
+    ap.add_argument("--workers", type=int, default=2, help="Inference threads, each with its own warm OCR engine")
+    ap.add_argument("--queue_size", type=int, default=32, help="Pending requests before new ones get 429")
+    ap.add_argument("--max_batch", type=int, default=8, help="Requests combined into one batched OCR call")
+    ap.add_argument("--batch_wait_ms", type=float, default=20, help="How long a worker waits to fill a batch")
+    ap.add_argument("--max_body_mb", type=float, default=100, help="Largest accepted upload")
+    ap.add_argument("--request_timeout", type=float, default=300, help="Seconds before a queued request returns 504")
+    ap.add_argument("--no_warmup", action="store_true", help="Do not preload OCR engines at startup")
+
+__all__ = ["InferenceServer", "REQUEST_PARAMS", "cmd_serve", "add_serve_args"]
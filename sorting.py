@@ -1,23 +1,155 @@
 # -*- coding: utf-8 -*-
-from typing import Any, Dict, List
+"""
+sorting.py — 气泡编号的阅读顺序
+- rows（默认）：按 y 排序后单遍聚类成行：与当前行的 y 均值之差不超过 lane 则并入，否则另起一行；行内按 x。
+  只和当前行比较，整体 O(n log n)；用滑动均值而非行首条目，倾斜扫描件上行不会越走越偏
+- columns：同样的单遍聚类按 x 分列，列内按 y（竖排标注、明细栏）
+- zones：按图框分区（行字母 A、B… 自上而下，列号 1、2… 自左而右）逐区编号，区内按 rows 顺序
+- legacy：原来的逐行扫描（与每行第一个条目比较），保留以便对照
+- deskew：由文本框上边的角度估计整页倾角（中位数），先把中心点转正再聚类
+"""
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+import math
 import numpy as np
 
-#  标签排序
-def sort_reading_order(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    if not items:
-        return items
-    ys = np.array([it["center"][1] for it in items], dtype=float)
-    h = float(max(ys) - min(ys)) if len(ys) else 0.0
+from .items import ItemTable
+
+METHODS = ("rows", "columns", "zones", "legacy")
+
+def _legacy_order(centers: np.ndarray) -> List[int]:
+    ys = centers[:, 1].astype(float)
+    xs = centers[:, 0].astype(float).tolist()
+    h = float(ys.max() - ys.min())
     lane = max(6.0, 0.02 * h)
-    rows: List[List[Dict[str, Any]]] = []
-    for it in sorted(items, key=lambda t: t["center"][1]):
-        placed = False
-        for r in rows:
-            if abs(r[0]["center"][1] - it["center"][1]) <= lane:
-                r.append(it); placed = True; break
-        if not placed:
-            rows.append([it])
-    out: List[Dict[str, Any]] = []
+    rows: List[List[int]] = []
+    row_y: List[float] = []
+    for i in np.argsort(ys, kind="stable").tolist():
+        y = ys[i]
+        for r, y0 in zip(rows, row_y):
+            if abs(y0 - y) <= lane:
+                r.append(i); break
+        else:
+            rows.append([i]); row_y.append(y)
+    out: List[int] = []
     for r in rows:
-        out.extend(sorted(r, key=lambda t: t["center"][0]))
+        out.extend(sorted(r, key=lambda i: xs[i]))
     return out
+
+def cluster_1d(v: np.ndarray, lane: float) -> np.ndarray:
+    """
+    一维单遍聚类：按值排序后依次与当前簇的均值比较，差值 ≤ lane 并入，否则开新簇。
+    返回每个元素（原顺序）的簇号，簇号随值递增
+    """
+    n = len(v)
+    labels = np.empty(n, dtype=np.int64)
+    if n == 0:
+        return labels
+    order = np.argsort(v, kind="stable")
+    sv = v[order].tolist()
+    lab = np.empty(n, dtype=np.int64)
+    k, total, count = 0, sv[0], 1
+    lab[0] = 0
+    for j in range(1, n):
+        y = sv[j]
+        if y - total / count <= lane:
+            total += y; count += 1
+        else:
+            k += 1; total, count = y, 1
+        lab[j] = k
+    labels[order] = lab
+    return labels
+
+def estimate_skew(boxes: np.ndarray, max_deg: float = 15.0) -> float:
+    """文本框上边（p0→p1）角度的中位数（弧度）；只用横向较长、角度在 ±max_deg 内的框"""
+    if boxes is None or len(boxes) == 0:
+        return 0.0
+    b = np.asarray(boxes, dtype=np.float64).reshape(-1, 4, 2)
+    d = b[:, 1] - b[:, 0]
+    w = np.hypot(d[:, 0], d[:, 1])
+    h = np.hypot(*(b[:, 3] - b[:, 0]).T)
+    ang = np.arctan2(d[:, 1], d[:, 0])
+    ok = (w > h) & (np.abs(ang) <= math.radians(max_deg))
+    return float(np.median(ang[ok])) if ok.any() else 0.0
+
+def _deskew(centers: np.ndarray, angle: float) -> np.ndarray:
+    c, s = math.cos(angle), math.sin(angle)
+    x, y = centers[:, 0], centers[:, 1]
+    return np.stack([x * c + y * s, -x * s + y * c], axis=1)
+
+def reading_order(
+    centers: np.ndarray,
+    method: str = "rows",
+    boxes: Optional[np.ndarray] = None,
+    deskew: bool = False,
+    lane: Optional[float] = None,
+    zone_grid: Tuple[int, int] = (8, 6),
+    size: Optional[Tuple[float, float]] = None
+) -> List[int]:
+    """
+    centers (N, 2) → 阅读顺序的下标。
+    lane：同行（同列）的最大偏差，默认 max(6, 2% 的纵向 / 横向跨度)，与 legacy 一致。
+    zone_grid：(列数, 行数) 图框分区；size：图幅 (w, h)，默认取中心点的外包范围。
+    """
+    centers = np.asarray(centers, dtype=np.float64).reshape(-1, 2)
+    n = len(centers)
+    if n == 0:
+        return []
+    if method == "legacy":
+        return _legacy_order(centers)
+    if method not in METHODS:
+        raise ValueError(f"unknown sort method '{method}' (available: {', '.join(METHODS)})")
+
+    pts = centers
+    if deskew and boxes is not None:
+        angle = estimate_skew(boxes)
+        if abs(angle) > math.radians(0.2):
+            pts = _deskew(centers, angle)
+    xs, ys = pts[:, 0], pts[:, 1]
+
+    if method == "columns":
+        col_lane = lane if lane is not None else max(6.0, 0.02 * float(xs.max() - xs.min()))
+        cols = cluster_1d(xs, col_lane)
+        return np.lexsort((ys, cols)).tolist()
+
+    row_lane = lane if lane is not None else max(6.0, 0.02 * float(ys.max() - ys.min()))
+    rows = cluster_1d(ys, row_lane)
+    if method == "rows":
+        return np.lexsort((xs, rows)).tolist()
+
+    # zones：按原始坐标分区（分区线与图框平行，不随 deskew 旋转）
+    gc, gr = max(1, int(zone_grid[0])), max(1, int(zone_grid[1]))
+    w, h = size if size is not None else (float(centers[:, 0].max()) + 1.0, float(centers[:, 1].max()) + 1.0)
+    zc = np.clip((centers[:, 0] / (float(w) / gc)).astype(np.int64), 0, gc - 1)
+    zr = np.clip((centers[:, 1] / (float(h) / gr)).astype(np.int64), 0, gr - 1)
+    return np.lexsort((xs, rows, zc, zr)).tolist()
+
+def zone_label(center: Sequence[float], size: Tuple[float, float], zone_grid: Tuple[int, int] = (8, 6)) -> str:
+    """中心点所在图框分区，如 'B3'（行字母自上而下，列号自左而右）"""
+    gc, gr = max(1, int(zone_grid[0])), max(1, int(zone_grid[1]))
+    c = min(gc - 1, max(0, int(center[0] / (float(size[0]) / gc))))
+    r = min(gr - 1, max(0, int(center[1] / (float(size[1]) / gr))))
+    return f"{chr(ord('A') + r)}{c + 1}"
+
+#  标签排序
+def sort_reading_order(
+    items: Union[List[Dict[str, Any]], ItemTable],
+    method: str = "rows",
+    deskew: bool = False,
+    lane: Optional[float] = None,
+    zone_grid: Tuple[int, int] = (8, 6),
+    size: Optional[Tuple[float, float]] = None
+) -> Union[List[Dict[str, Any]], ItemTable]:
+    if isinstance(items, ItemTable):
+        return items.take(reading_order(items.centers, method, items.boxes if deskew else None, deskew,
+                                        lane, zone_grid, size))
+    if not items:
+        return items
+    centers = np.array([it["center"] for it in items], dtype=float).reshape(len(items), 2)
+    boxes = None
+    if deskew:
+        quads = [it.get("box") for it in items]
+        if all(q is not None and len(q) == 4 for q in quads):
+            boxes = np.array(quads, dtype=float)
+    return [items[i] for i in reading_order(centers, method, boxes, deskew, lane, zone_grid, size)]
+
+__all__ = ["METHODS", "reading_order", "sort_reading_order", "cluster_1d", "estimate_skew", "zone_label"]
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+spatial.py — 均匀网格空间索引
+对象（圆 / 轴对齐矩形 / 线段）按包围框登记到覆盖的格子；查询只看窗口覆盖的格子，
+格子边长取与查询窗口同一量级时每次查询是近常数时间，与已登记对象总数无关。
+对象可带 owner（如条目下标）并可移除，供迭代优化时移动对象。
+"""
+from __future__ import annotations
+
+import math
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from .geometry import circle_hits_rect, point_segment_dist2
+
+Point = Tuple[float, float]
+Rect = Tuple[float, float, float, float]
+
+CIRCLE, RECT, SEGMENT = "c", "r", "s"
+
+class GridIndex:
+    def __init__(self, cell: float = 64.0):
+        self.cell = max(1.0, float(cell))
+        self._cells: Dict[Tuple[int, int], List[int]] = {}
+        self._shapes: List[Tuple[str, Tuple[float, ...]]] = []
+        self._bboxes: List[Optional[Rect]] = []
+        self._owners: List[Any] = []
+
+    def __len__(self) -> int:
+        return sum(1 for b in self._bboxes if b is not None)
+
+    def _span(self, x1: float, y1: float, x2: float, y2: float) -> Iterator[Tuple[int, int]]:
+        c = self.cell
+        for gy in range(int(math.floor(y1 / c)), int(math.floor(y2 / c)) + 1):
+            for gx in range(int(math.floor(x1 / c)), int(math.floor(x2 / c)) + 1):
+                yield (gx, gy)
+
+    def _add(self, kind: str, geom: Tuple[float, ...], bbox: Rect, owner: Any = None) -> int:
+        sid = len(self._shapes)
+        self._shapes.append((kind, geom))
+        self._bboxes.append(bbox)
+        self._owners.append(owner)
+        for key in self._span(*bbox):
+            self._cells.setdefault(key, []).append(sid)
+        return sid
+
+    def add_circle(self, c: Point, r: float, owner: Any = None) -> int:
+        return self._add(CIRCLE, (c[0], c[1], r), (c[0] - r, c[1] - r, c[0] + r, c[1] + r), owner)
+
+    def add_rect(self, rect: Rect, owner: Any = None) -> int:
+        return self._add(RECT, tuple(rect), rect, owner)
+
+    def add_segment(self, a: Point, b: Point, owner: Any = None) -> int:
+        return self._add(SEGMENT, (a[0], a[1], b[0], b[1]),
+                         (min(a[0], b[0]), min(a[1], b[1]), max(a[0], b[0]), max(a[1], b[1])), owner)
+
+    def remove(self, sid: int) -> None:
+        bbox = self._bboxes[sid]
+        if bbox is None:
+            return
+        for key in self._span(*bbox):
+            ids = self._cells.get(key)
+            if ids is not None:
+                ids.remove(sid)
+                if not ids:
+                    del self._cells[key]
+        self._bboxes[sid] = None
+
+    def owners_in(self, x1: float, y1: float, x2: float, y2: float) -> Set[Any]:
+        """窗口覆盖格子内对象的 owner 集合（粗筛，调用方自行做精确判断）"""
+        out: Set[Any] = set()
+        for ids in self._buckets(x1, y1, x2, y2):
+            for sid in ids:
+                out.add(self._owners[sid])
+        return out
+
+    def query(self, x1: float, y1: float, x2: float, y2: float) -> Iterator[Tuple[str, Tuple[float, ...]]]:
+        """窗口覆盖格子内的对象（去重）；调用方自行做精确判断"""
+        seen = set()
+        for key in self._span(x1, y1, x2, y2):
+            for sid in self._cells.get(key, ()):
+                if sid not in seen:
+                    seen.add(sid)
+                    yield self._shapes[sid]
+
+    def _buckets(self, x1: float, y1: float, x2: float, y2: float) -> Iterator[List[int]]:
+        """窗口覆盖格子的对象表（不去重；只做“是否存在”判断时重复无害，省掉去重开销）"""
+        c = self.cell
+        cells = self._cells
+        gx1, gx2 = int(math.floor(x1 / c)), int(math.floor(x2 / c))
+        for gy in range(int(math.floor(y1 / c)), int(math.floor(y2 / c)) + 1):
+            for gx in range(gx1, gx2 + 1):
+                ids = cells.get((gx, gy))
+                if ids:
+                    yield ids
+
+    def circle_near(self, c: Point, dist: float) -> bool:
+        """是否有已登记圆的圆心与 c 的距离 <= dist"""
+        x, y = c
+        d2 = dist * dist
+        shapes = self._shapes
+        for ids in self._buckets(x - dist, y - dist, x + dist, y + dist):
+            for sid in ids:
+                kind, g = shapes[sid]
+                if kind == CIRCLE and (g[0] - x) ** 2 + (g[1] - y) ** 2 <= d2:
+                    return True
+        return False
+
+    def circle_blocked(self, c: Point, r: float) -> bool:
+        """半径 r 的圆是否压到已登记的矩形或线段"""
+        shapes = self._shapes
+        for ids in self._buckets(c[0] - r, c[1] - r, c[0] + r, c[1] + r):
+            for sid in ids:
+                kind, g = shapes[sid]
+                if kind == RECT and circle_hits_rect(c, r, g):  # type: ignore[arg-type]
+                    return True
+                if kind == SEGMENT and point_segment_dist2(c, (g[0], g[1]), (g[2], g[3])) < r * r:
+                    return True
+        return False
+
+    def segment_hits_circle(self, a: Point, b: Point) -> bool:
+        """线段是否穿过已登记的圆"""
+        shapes = self._shapes
+        for ids in self._buckets(min(a[0], b[0]), min(a[1], b[1]), max(a[0], b[0]), max(a[1], b[1])):
+            for sid in ids:
+                kind, g = shapes[sid]
+                if kind == CIRCLE and point_segment_dist2((g[0], g[1]), a, b) < g[2] * g[2]:
+                    return True
+        return False
+
+__all__ = ["GridIndex"]
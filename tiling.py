@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+tiling.py — 大幅面图纸分块高分辨率 OCR
+- 按 tile_size/overlap 切成重叠块，每块按原分辨率（或 scale 指定的 DPI 比例）识别
+- 块内坐标 → 整页坐标：先加块偏移，再除以 scale（与 run_ocr 中 rw/rh 的反映射一致）
+- batch_size > 1 时同尺寸的块组批送入后端，每批一次 predict
+- skip_blank 时先算一次墨迹密度网格（premask.ink_grid），没有墨迹的块不送入 OCR
+- 重叠区的重复结果按包围框重叠度合并，优先保留未被块边界截断、面积更大、置信度更高的一条
+"""
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from .geometry import quad_bbox, rect_area, rect_intersection
+from .ocr import _quad_center
+from .backends import checkout_backend
+from .metrics import bind, stage
+from .premask import darkest_channel, has_ink, ink_grid
+
+Rect = Tuple[int, int, int, int]
+
+# 距块内部切边小于该像素数的框视为可能被截断
+_EDGE_MARGIN = 3.0
+
+def tile_grid(w: int, h: int, tile_size: int = 1600, overlap: int = 200) -> List[Rect]:
+    """生成覆盖整页的重叠块 (x1, y1, x2, y2)；最后一行/列贴齐右/下边"""
+    tile_size = max(64, int(tile_size))
+    overlap = max(0, min(int(overlap), tile_size // 2))
+    step = tile_size - overlap
+
+    def starts(n: int) -> List[int]:
+        if n <= tile_size:
+            return [0]
+        out = list(range(0, n - tile_size, step))
+        out.append(n - tile_size)
+        return out
+
+    return [(x, y, min(w, x + tile_size), min(h, y + tile_size)) for y in starts(h) for x in starts(w)]
+
+def _touches_cut(bb: Tuple[float, float, float, float], tile: Rect, w: int, h: int) -> bool:
+    x1, y1, x2, y2 = tile
+    return ((x1 > 0 and bb[0] - x1 < _EDGE_MARGIN) or (y1 > 0 and bb[1] - y1 < _EDGE_MARGIN) or
+            (x2 < w and x2 - bb[2] < _EDGE_MARGIN) or (y2 < h and y2 - bb[3] < _EDGE_MARGIN))
+
+def merge_tile_items(items: List[Dict[str, Any]], overlap_thr: float = 0.5, cell: int = 256) -> List[Dict[str, Any]]:
+    """合并重叠区的重复识别结果。重叠度 = 交集 / 较小框面积。"""
+    def rank(it):
+        return (not it.get("_cut", False), rect_area(it["_bb"]), float(it.get("conf", 0.0)))
+
+    order = sorted(items, key=rank, reverse=True)
+    grid: Dict[Tuple[int, int], List[Dict[str, Any]]] = {}
+    kept: List[Dict[str, Any]] = []
+    for it in order:
+        bb = it["_bb"]
+        cells = [(cx, cy)
+                 for cy in range(int(bb[1] // cell), int(bb[3] // cell) + 1)
+                 for cx in range(int(bb[0] // cell), int(bb[2] // cell) + 1)]
+        dup = False
+        seen = set()
+        for c in cells:
+            for other in grid.get(c, ()):
+                if id(other) in seen:
+                    continue
+                seen.add(id(other))
+                inter = rect_intersection(bb, other["_bb"])
+                small = min(rect_area(bb), rect_area(other["_bb"]))
+                if small > 0 and inter / small >= overlap_thr:
+                    dup = True
+                    break
+            if dup:
+                break
+        if dup:
+            continue
+        kept.append(it)
+        for c in cells:
+            grid.setdefault(c, []).append(it)
+
+    out = []
+    for it in kept:
+        out.append({k: v for k, v in it.items() if not k.startswith("_")})
+    # 恢复大致的上→下、左→右顺序，便于调试对照
+    out.sort(key=lambda t: (t["center"][1], t["center"][0]))
+    return out
+
+def run_ocr_tiled(
+    img: Image.Image,
+    lang: str = "en",
+    tile_size: int = 1600,
+    overlap: int = 200,
+    scale: float = 1.0,
+    workers: int = 1,
+    pad_stride: int = 32,
+    det_model_dir: Optional[str] = None,
+    rec_model_dir: Optional[str] = None,
+    overlap_thr: float = 0.5,
+    backend: str = "paddle",
+    backend_options: Optional[Dict[str, Any]] = None,
+    batch_size: int = 1,
+    skip_blank: bool = False
+) -> Tuple[List[Dict[str, Any]], str]:
+    """
+    分块识别整页，返回与 run_ocr 相同结构的 (items, mode)，坐标为原图坐标。
+    scale：识别分辨率 / 原图分辨率（如 600dpi 扫描件按 300dpi 识别传 0.5）。
+    workers：并发批数；实际并发还受引擎池 max_per_key 限制（入口处用 backends.reserve_engine_pool 预留）。
+    batch_size：每次 predict 送入的块数。
+    skip_blank：跳过没有墨迹的块（按覆盖块的网格小格判断，不会漏掉有内容的块）。
+    """
+    src = img.convert("RGB")
+    scale = float(scale) if scale and scale > 0 else 1.0
+    if abs(scale - 1.0) > 1e-6:
+        src = src.resize((max(1, int(round(src.width * scale))), max(1, int(round(src.height * scale)))),
+                         Image.BILINEAR)
+    arr = np.asarray(src)
+    h, w = arr.shape[:2]
+    tiles = tile_grid(w, h, tile_size, overlap)
+    if skip_blank:
+        with stage("ocr.premask") as rec:
+            grid = ink_grid(darkest_channel(src))  # 按最暗通道，浅色彩色文字不算空白
+            tiles = [t for t in tiles if has_ink(grid, t)]
+            rec.items = len(tiles)
+        if not tiles:
+            return [], "blank"
+
+    def _one(chunk: List[Rect]) -> Tuple[List[Dict[str, Any]], str]:
+        subs = [np.ascontiguousarray(arr[y1:y2, x1:x2]) for (x1, y1, x2, y2) in chunk]
+        with checkout_backend(backend, lang, det_model_dir, rec_model_dir, backend_options) as be:
+            # limit_side_len 取块边长：块内不再缩小
+            results = be.predict(subs, limit_side_len=max(max(a.shape[:2]) for a in subs),
+                                 pad_stride=pad_stride, batch_size=len(subs))
+            mode = be.mode
+        out = []
+        for tile, items in zip(chunk, results):
+            x1, y1 = tile[0], tile[1]
+            for it in items:
+                page_box = [(x + x1, y + y1) for (x, y) in it["box"]]
+                cut = _touches_cut(quad_bbox(page_box), tile, w, h)
+                mapped = [(x / scale, y / scale) for (x, y) in page_box]
+                out.append({"text": it["text"], "conf": it["conf"], "box": mapped,
+                            "center": _quad_center(mapped), "_bb": quad_bbox(mapped), "_cut": cut})
+        return out, mode
+
+    bs = max(1, int(batch_size or 1))
+    chunks = [tiles[i:i + bs] for i in range(0, len(tiles), bs)]
+    n_workers = max(1, min(int(workers or 1), len(chunks)))
+    if n_workers == 1:
+        results = [_one(c) for c in chunks]
+    else:
+        with ThreadPoolExecutor(max_workers=n_workers) as ex:
+            results = list(ex.map(bind(_one), chunks))
+
+    raw: List[Dict[str, Any]] = []
+    mode = ""
+    for items, m in results:
+        raw.extend(items)
+        mode = mode or m
+    with stage("ocr.merge_tiles", items=len(raw)):
+        merged = merge_tile_items(raw, overlap_thr=overlap_thr)
+    return merged, mode
+
+__all__ = ["tile_grid", "merge_tile_items", "run_ocr_tiled"]